@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Benchmark the FindBugs analyzer on a large synthetic report.
+
+Writes a FindBugs ``-xml:withMessages`` report of about the given size to a
+temp file, with the same structure as real reports (messages, classes,
+methods, fields, grouped instances, and a summary section), then parses it
+with each parser in a fresh interpreter and reports throughput and peak memory
+(max RSS) for each.
+
+    python bench/findbugs_xml.py [--mb N]
+"""
+
+from __future__ import print_function
+import sys
+import os
+import itertools
+import time
+import tempfile
+import resource
+import subprocess
+import argparse
+from itertools import ifilter
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blamethrower import Analyne
+from blamethrower.analyzers import findbugs
+from generators import Project, write_findbugs
+
+
+def analyze_tree(bugsfile, prefix=''):
+    """The analyzer before it ran in constant memory, kept here for comparison."""
+    for _, bug in ifilter(lambda event_elt: event_elt[1].tag == 'BugInstance', ElementTree.iterparse(bugsfile)):
+        bugtype = bug.get('type')
+        severity = findbugs.rank2severity(int(bug.get('rank')))
+        sourcelines = bug.findall('SourceLine')
+        if len(sourcelines) > 1:
+            sourcelines = [line for line in sourcelines if line.attrib.get('primary') or line.attrib.get('role') == 'SOURCE_LINE_ANOTHER_INSTANCE']
+        for sourceline in sourcelines:
+            yield Analyne(prefix + sourceline.get('sourcepath'), int(sourceline.get('start')), bugtype, severity, None)
+        bug.clear()
+
+
+PARSERS = {
+    'stream': findbugs.analyze,
+    'tree': analyze_tree,
+}
+
+
+def write_report(outfile, size, numfiles=5000, seed=0):
+    """Write a FindBugs report of about `size` bytes, with bugs in `numfiles` files, to `outfile`.
+
+    :Return: the number of bugs (that is, analynes) written.
+    """
+    project = Project(numfiles=numfiles, filelines=900, seed=seed)
+
+    def bugs():
+        """Bugs in every file, over and over."""
+        for rerun in itertools.count():
+            for bug in project.bugs(0.01, rerun):
+                yield bug
+
+    return write_findbugs(outfile, itertools.takewhile(lambda _: outfile.tell() < size, bugs()), seed)
+
+
+def run(parser, filename):
+    """Parse `filename` with `parser` and print elapsed seconds, bugs, and max RSS in KiB."""
+    start = time.time()
+    with open(filename, 'rb') as infile:
+        numbugs = sum(1 for _ in PARSERS[parser](infile))
+    print(time.time() - start, numbugs, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def main(args):
+    """Generate input, run each parser in a subprocess, and print results."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mb', type=int, default=2048, help='approximate size of the synthetic report in MB')
+    parser.add_argument('--files', type=int, default=5000, help='source files with bugs')
+    parser.add_argument('--parsers', default='stream,tree', help='comma-separated parsers to run: ' + ', '.join(sorted(PARSERS)))
+    parser.add_argument('--run', choices=sorted(PARSERS), help=argparse.SUPPRESS)
+    parser.add_argument('--input', help=argparse.SUPPRESS)
+    opts = parser.parse_args(args)
+    if opts.run:
+        return run(opts.run, opts.input)
+
+    with tempfile.NamedTemporaryFile(prefix='blamethrower.bench.', suffix='.xml') as report:
+        numbugs = write_report(report, opts.mb << 20, opts.files)
+        report.flush()
+        size = os.path.getsize(report.name)
+        print('{0} bugs, {1:.1f} MB of FindBugs XML'.format(numbugs, size / 2.0 ** 20))
+        print('{0:8} {1:>10} {2:>12} {3:>10}'.format('parser', 'seconds', 'bugs/sec', 'maxrss MB'))
+        for name in opts.parsers.split(','):
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--run', name, '--input', report.name])
+            seconds, parsed, maxrss = output.split()
+            seconds = float(seconds)
+            assert int(parsed) == numbugs, (parsed, numbugs)
+            print('{0:8} {1:10.3f} {2:12.0f} {3:10.1f}'.format(name, seconds, numbugs / seconds, int(maxrss) / 1024.0))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,196 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Generators for synthetic BlameThrower input at any scale.
+
+A :class:`Project` is a made-up repository: some number of files of about a
+given length, written by some number of authors in some number of commits.
+The ``write_*`` functions write what the blame helper scripts and static
+analysis tools in ``bin/`` would output for it, in the formats BlameThrower
+reads.  Everything is generated from a seed, so the same arguments always give
+the same output, and lazily, so generating a huge project takes no memory.
+"""
+
+import random
+import itertools
+
+__all__ = ['Project', 'write_porcelain', 'write_git', 'write_hg', 'write_pylint', 'write_jslint', 'write_findbugs']
+
+
+class Project(object):
+    """A synthetic repository."""
+    def __init__(self, numfiles=1000, filelines=300, numauthors=50, numcommits=5000, seed=0):
+        """:param int numfiles: The number of files.
+        :param int filelines: The average number of lines in a file.
+        :param int numauthors: The number of distinct authors.
+        :param int numcommits: The number of distinct commits; each is by one author.
+        :param int seed: The random seed that determines everything else.
+        """
+        self.numfiles = numfiles
+        self.filelines = filelines
+        self.numauthors = numauthors
+        self.seed = seed
+        rand = random.Random(seed)
+        self.commits = ['{0:040x}'.format(rand.getrandbits(160)) for _ in xrange(numcommits)]
+
+    def author(self, commitnum):
+        """:Return: the author of commit number `commitnum`."""
+        return 'Author {0}'.format(commitnum % self.numauthors)
+
+    def files(self):
+        """:Return: an iterator over the ``(filename, number of lines)`` of every file."""
+        rand = random.Random(self.seed)
+        for filenum in xrange(self.numfiles):
+            yield 'pkg{0}/sub{1}/module{2}.py'.format(filenum % 20, filenum % 7, filenum), rand.randint(1, 2 * self.filelines - 1)
+
+    def blame(self, filenum, numlines):
+        """:Return: an iterator over ``(commit number, run length)`` pairs giving the commit
+        that last touched each line of file number `filenum`, which has `numlines` lines."""
+        rand = random.Random(self.seed * 1000003 + filenum)
+        # Most files have a handful of commits.
+        commits = [rand.randrange(len(self.commits)) for _ in xrange(rand.randint(1, 10))]
+        linenum = 1
+        while linenum <= numlines:
+            runlength = min(rand.randint(1, 30), numlines - linenum + 1)
+            yield rand.choice(commits), runlength
+            linenum += runlength
+
+    def bugs(self, density, seed=0):
+        """:Return: an iterator over the ``(filename, linenum)`` of bugs, about `density` per line of code.
+
+        Files come in order, lines in order within a file, and there may be more than one bug on a line.
+        """
+        rand = random.Random(self.seed * 1000003 + seed)
+        for filename, numlines in self.files():
+            numbugs = int(numlines * density + rand.random())
+            for linenum in sorted(rand.randint(1, numlines) for _ in xrange(numbugs)):
+                yield filename, linenum
+
+
+def write_porcelain(outfile, project, filename, blame):
+    """Write ``git blame --porcelain`` output for `filename` to `outfile`.
+
+    :param iter blame: ``(commit number, run length)`` pairs, as from :meth:`Project.blame`.
+    """
+    seen = set()
+    linenum = 1
+    for commitnum, runlength in blame:
+        commit = project.commits[commitnum]
+        for i in xrange(runlength):
+            outfile.write('{0} {1} {1}{2}\n'.format(commit, linenum, ' {0}'.format(runlength) if i == 0 else ''))
+            if commitnum not in seen:
+                seen.add(commitnum)
+                author = project.author(commitnum)
+                outfile.write('author {0}\nauthor-mail <{1}@example.com>\nauthor-time 1350000000\nauthor-tz +0000\n'
+                              'committer {0}\ncommitter-mail <{1}@example.com>\ncommitter-time 1350000000\ncommitter-tz +0000\n'
+                              'summary Commit {2}\nfilename {3}\n'.format(author, author.replace(' ', '.'), commit, filename))
+            outfile.write('\tgenerated_line_{0} = {0}\n'.format(linenum))
+            linenum += 1
+
+
+def write_git(outfile, project):
+    """Write the output of `bin/git-blame.sh` for `project` to `outfile`."""
+    for filenum, (filename, numlines) in enumerate(project.files()):
+        outfile.write('>>> git-blame output for: {0} <<<\n'.format(filename))
+        write_porcelain(outfile, project, filename, project.blame(filenum, numlines))
+
+
+def write_hg(outfile, project):
+    """Write the output of `bin/hg-blame.sh` for `project` to `outfile`."""
+    width = max(len(project.author(commitnum)) for commitnum in xrange(min(project.numauthors, len(project.commits))))
+    for filenum, (filename, numlines) in enumerate(project.files()):
+        outfile.write('>>> hg blame output for: {0} <<<\n'.format(filename))
+        for commitnum, runlength in project.blame(filenum, numlines):
+            author = project.author(commitnum)
+            # hg right-justifies, and with -v gives the email address.
+            line = '{0} <{1}@example.com>\n'.format(author.rjust(width), author.replace(' ', '.'))
+            outfile.write(line * runlength)
+
+
+PYLINT_TYPES = (('C0103', 'Invalid name "x"'), ('W0142', 'Used * or ** magic'), ('R0913', 'Too many arguments'),
+                ('E1101', 'Instance has no member'), ('F0401', 'Unable to import'), ('C0111', 'Missing docstring'))
+
+
+def write_pylint(outfile, bugs, seed=0):
+    """Write ``pylint -iy -rn -fparseable`` output for ``(filename, linenum)`` `bugs` to `outfile`."""
+    rand = random.Random(seed)
+    for filename, linenum in bugs:
+        bugtype, message = rand.choice(PYLINT_TYPES)
+        outfile.write('{0}:{1}: [{2}, function{3}] {4}\n'.format(filename, linenum, bugtype, linenum % 13, message))
+
+
+JSLINT_MESSAGES = ("Expected 'var' at column 1, not column 3.", "Unexpected '(space)'.", "Missing 'use strict' statement.",
+                   "'document' was used before it was defined.", "Expected '===' and instead saw '=='.")
+
+
+def write_jslint(outfile, bugs, seed=0):
+    """Write ``jslint4java`` output for ``(filename, linenum)`` `bugs` to `outfile`."""
+    rand = random.Random(seed)
+    for filename, linenum in bugs:
+        outfile.write('jslint:{0}:{1}:{2}:{3}\n'.format(filename, linenum, rand.randint(1, 60), rand.choice(JSLINT_MESSAGES)))
+
+
+FINDBUGS_TYPES = ('SF_SWITCH_NO_DEFAULT', 'EI_EXPOSE_REP', 'NP_NULL_ON_SOME_PATH', 'DM_DEFAULT_ENCODING', 'SE_BAD_FIELD', 'URF_UNREAD_FIELD')
+
+FINDBUGS_BUG = """  <BugInstance type="{type}" priority="2" abbrev="XX" category="STYLE" instanceHash="{hash:032x}" instanceOccurrenceNum="0" instanceOccurrenceMax="0" rank="{rank}">
+    <ShortMessage>Something is not quite right</ShortMessage>
+    <LongMessage>Something is not quite right in {cls}.method{num}() at line {line}</LongMessage>
+    <Class classname="{cls}" primary="true">
+      <SourceLine classname="{cls}" start="1" end="900" sourcefile="{base}" sourcepath="{path}">
+        <Message>At {base}:[lines 1-900]</Message>
+      </SourceLine>
+      <Message>In class {cls}</Message>
+    </Class>
+    <Method classname="{cls}" name="method{num}" signature="()V" isStatic="false" primary="true">
+      <SourceLine classname="{cls}" start="{start}" end="{end}" startBytecode="0" endBytecode="120" sourcefile="{base}" sourcepath="{path}"/>
+      <Message>In method {cls}.method{num}()</Message>
+    </Method>
+    <Field classname="{cls}" name="field{num}" signature="[B" isStatic="false">
+      <SourceLine classname="{cls}" sourcefile="{base}" sourcepath="{path}">
+        <Message>In {base}</Message>
+      </SourceLine>
+      <Message>Field {cls}.field{num}</Message>
+    </Field>
+    <SourceLine classname="{cls}" primary="true" start="{line}" end="{line}" startBytecode="11" endBytecode="11" sourcefile="{base}" sourcepath="{path}">
+      <Message>At {base}:[line {line}]</Message>
+    </SourceLine>
+{others}  </BugInstance>
+"""
+
+FINDBUGS_OTHER = """    <SourceLine classname="{cls}" start="{line}" end="{line}" startBytecode="40" endBytecode="40" sourcefile="{base}" sourcepath="{path}" role="SOURCE_LINE_ANOTHER_INSTANCE">
+      <Message>Another occurrence at {base}:[line {line}]</Message>
+    </SourceLine>
+"""
+
+
+def write_findbugs(outfile, bugs, seed=0):
+    """Write a FindBugs ``-xml:withMessages`` report for ``(filename, linenum)`` `bugs` to `outfile`.
+
+    As FindBugs does, some bugs of the same type in the same file are grouped
+    into one <BugInstance> with a <SourceLine> for each other instance; every
+    bug still comes out as one :class:`blamethrower.Analyne`.
+    :Return: the number of bugs written.
+    """
+    rand = random.Random(seed)
+    outfile.write('<?xml version="1.0" encoding="UTF-8"?>\n\n<BugCollection version="2.0.1" sequence="0" timestamp="1350698902000" release="">\n'
+                  '  <Project projectName="">\n    <Jar>dist/generated.jar</Jar>\n  </Project>\n')
+    numbugs = 0
+    paths = set()
+    for path, group in itertools.groupby(bugs, lambda bug: bug[0]):
+        paths.add(path)
+        cls, base = path.rpartition('.')[0].replace('/', '.'), path.rpartition('/')[2]
+        group = [linenum for _, linenum in group]
+        while group:
+            size = min(rand.choice((1, 1, 1, 3)), len(group))
+            line, others = group[0], group[1:size]
+            del group[:size]
+            outfile.write(FINDBUGS_BUG.format(type=rand.choice(FINDBUGS_TYPES), hash=rand.getrandbits(128), rank=rand.randint(1, 20),
+                                              cls=cls, base=base, path=path, num=numbugs % 97, line=line, start=max(line - 5, 1), end=line + 20,
+                                              others=''.join(FINDBUGS_OTHER.format(cls=cls, base=base, path=path, line=other) for other in others)))
+            numbugs += size
+    outfile.write('  <Errors errors="0" missingClasses="0"></Errors>\n  <FindBugsSummary timestamp="Sat, 20 Oct 2012" total_classes="{0}" total_bugs="{1}">\n'.format(len(paths), numbugs))
+    for path in sorted(paths):
+        outfile.write('    <ClassStats class="{0}" sourceFile="{1}" interface="false" size="900" bugs="1"/>\n'.format(path.rpartition('.')[0].replace('/', '.'), path.rpartition('/')[2]))
+    outfile.write('  </FindBugsSummary>\n  <ClassFeatures></ClassFeatures>\n  <History></History>\n</BugCollection>\n')
+    return numbugs
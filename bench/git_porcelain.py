@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Benchmark the streaming git porcelain parser against the old regex parser.
+
+Writes ``git blame --porcelain`` output for one large synthetic source file to
+a temp file, then parses it with each parser in a fresh interpreter, and
+reports throughput and peak memory (max RSS) for each.
+
+    python bench/git_porcelain.py [--lines N] [--commits N]
+"""
+
+from __future__ import print_function
+import sys
+import os
+import re
+import random
+import time
+import tempfile
+import resource
+import subprocess
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blamethrower.reporeaders import git
+from generators import Project, write_porcelain
+
+# The parser before it was made to stream, kept here for comparison.
+GIT_PORCELAIN_RE = re.compile(r"""^(?P<commit>[0-9a-f]{40}) \d+ (?P<linenum>\d+)( [1-9][0-9]*)?
+(author (?P<author>.+)$)?""", re.MULTILINE)
+
+
+def get_authors_regex(porcelain):
+    """:Return: an iterable of authors for each line in `porcelain`, the old way."""
+    commit2author = {}
+    yield None
+    for expected_linenum, match in enumerate(GIT_PORCELAIN_RE.finditer(''.join(porcelain)), 1):
+        linenum, author, commit = match.group('linenum', 'author', 'commit')
+        linenum = int(linenum)
+        if author is None:
+            author = commit2author.get(commit)
+            assert author
+        else:
+            author = intern(author)
+            assert commit2author.get(commit) in (None, author)
+            commit2author[commit] = author
+        assert linenum == expected_linenum
+        yield author
+
+
+PARSERS = {
+    'stream': git.get_authors,
+    'regex': get_authors_regex,
+    'none': lambda porcelain: (None for _ in porcelain),        # Baseline: just read the file
+}
+
+
+def write_file(outfile, numlines, numcommits, seed=0):
+    """Write porcelain for a `numlines`-line file blamed on `numcommits` commits to `outfile`."""
+    project = Project(numfiles=1, numcommits=numcommits, seed=seed)
+    rand = random.Random(seed)
+
+    def blame():
+        """Runs of lines by randomly chosen commits."""
+        linenum = 1
+        while linenum <= numlines:
+            runlength = min(rand.randint(1, 20), numlines - linenum + 1)
+            yield rand.randrange(numcommits), runlength
+            linenum += runlength
+
+    write_porcelain(outfile, project, 'generated.py', blame())
+
+
+def run(parser, filename):
+    """Parse `filename` with `parser` and print elapsed seconds, lines, and max RSS in KiB."""
+    start = time.time()
+    with open(filename, 'rU') as infile:
+        numlines = sum(1 for _ in PARSERS[parser](infile))
+    print(time.time() - start, numlines, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def main(args):
+    """Generate input, run each parser in a subprocess, and print results."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=500000, help='source lines in the synthetic file')
+    parser.add_argument('--commits', type=int, default=5000, help='distinct commits blamed')
+    parser.add_argument('--run', choices=sorted(PARSERS), help=argparse.SUPPRESS)
+    parser.add_argument('--input', help=argparse.SUPPRESS)
+    opts = parser.parse_args(args)
+    if opts.run:
+        return run(opts.run, opts.input)
+
+    with tempfile.NamedTemporaryFile(prefix='blamethrower.bench.', suffix='.txt') as porcelain:
+        write_file(porcelain, opts.lines, opts.commits)
+        porcelain.flush()
+        size = os.path.getsize(porcelain.name)
+        print('{0} lines, {1:.1f} MB of porcelain'.format(opts.lines, size / 2.0 ** 20))
+        print('{0:8} {1:>10} {2:>12} {3:>10}'.format('parser', 'seconds', 'lines/sec', 'maxrss MB'))
+        for name in ('none', 'regex', 'stream'):
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--run', name, '--input', porcelain.name])
+            seconds, numlines, maxrss = output.split()
+            seconds = float(seconds)
+            print('{0:8} {1:10.3f} {2:12.0f} {3:10.1f}'.format(name, seconds, (int(numlines) - 1) / seconds, int(maxrss) / 1024.0))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
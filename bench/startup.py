@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Benchmark how long bin/blamethrower takes to start up.
+
+Runs each command below in a fresh interpreter, keeps the fastest of a number
+of runs, and reports its wall seconds and how many modules it imported:
+
+  python    an interpreter that does nothing, for reference
+  import    import blamethrower
+  version   blamethrower --version
+  help      blamethrower --help
+  tiny      blamethrower on a one-file pylint report and git blame
+
+Small runs (one file in an editor hook, say) are mostly startup, so this is
+what to watch when adding imports.
+
+    python bench/startup.py [--repeat N]
+"""
+
+from __future__ import print_function
+import sys
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLAMETHROWER = os.path.join(ROOT, 'bin', 'blamethrower')
+
+# Print the number of modules imported when the interpreter exits.
+COUNT_MODULES = "import atexit, sys; atexit.register(lambda: sys.stderr.write('modules: %d\\n' % len([m for m in sys.modules.values() if m])))"
+
+GIT_BLAME = """>>> git-blame output for: tiny.py <<<
+0123456789012345678901234567890123456789 1 1 2
+author Someone
+author-mail <someone@example.com>
+author-time 1330000000
+author-tz -0800
+committer Someone
+committer-mail <someone@example.com>
+committer-time 1330000000
+committer-tz -0800
+summary Tiny
+filename tiny.py
+\timport os
+0123456789012345678901234567890123456789 2 2
+\tprint os.name
+"""
+
+PYLINT = "tiny.py:1: [W0611] Unused import os\n"
+
+
+def commands(workdir):
+    """:Return: a list of ``(name, argv)`` of the commands to time, writing their input to `workdir`."""
+    blamefile, bugsfile = os.path.join(workdir, 'tiny.git.txt'), os.path.join(workdir, 'tiny.pylint.txt')
+    with open(blamefile, 'w') as outfile:
+        outfile.write(GIT_BLAME)
+    with open(bugsfile, 'w') as outfile:
+        outfile.write(PYLINT)
+    run = [sys.executable, '-c', COUNT_MODULES + "; sys.argv = sys.argv[1:]; execfile(sys.argv[0], {'__name__': '__main__'})", BLAMETHROWER]
+    return [
+        ('python', [sys.executable, '-c', COUNT_MODULES]),
+        ('import', [sys.executable, '-c', COUNT_MODULES + '; import blamethrower']),
+        ('version', run + ['--version']),
+        ('help', run + ['--help']),
+        ('tiny', run + ['--git', blamefile, '--pylint', bugsfile]),
+    ]
+
+
+def timeit(argv, repeat):
+    """:Return: ``(seconds, modules)``: the fastest wall time of `repeat` runs of `argv`, and the modules it imported."""
+    best, modules = None, None
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    for _ in xrange(repeat):
+        start = time.time()
+        proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        _, err = proc.communicate()
+        seconds = time.time() - start
+        if proc.returncode != 0:
+            raise RuntimeError('{0} failed: {1}'.format(' '.join(argv), err))
+        best = seconds if best is None else min(best, seconds)
+        modules = int(err.rsplit('modules: ', 1)[1])
+    return best, modules
+
+
+def main(args):
+    """Time each command and print a table."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20, help='run each command this many times and keep the fastest (default %(default)s)')
+    opts = parser.parse_args(args)
+    workdir = tempfile.mkdtemp(prefix='blamethrower.startup.')
+    try:
+        print('{0:10} {1:>10} {2:>10}'.format('command', 'ms', 'modules'))
+        for name, argv in commands(workdir):
+            seconds, modules = timeit(argv, opts.repeat)
+            print('{0:10} {1:10.1f} {2:10}'.format(name, seconds * 1000, modules))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Benchmark the memory and time of counting distinct lines in stats.getstats.
+
+Runs :func:`blamethrower.stats.getstats` on synthetic blame-only input, with
+line sets stored as compressed bitmaps (:class:`blamethrower.stats.LineSet`)
+and as plain Python sets of ints, as they used to be.  Input is either one
+:class:`blamethrower.Analyne` per line or :class:`blamethrower.Analyrun` runs of
+lines, generated lazily so it takes no memory itself.  Each case runs in a fresh
+interpreter, and reports seconds and peak memory (max RSS).
+
+    python bench/stats_lines.py [--lines N] [--filelines N] [--authors N]
+"""
+
+from __future__ import print_function
+import sys
+import os
+import random
+import time
+import resource
+import subprocess
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import blamethrower
+import blamethrower.stats
+
+
+class SetLineSet(set):
+    """The old line set: a Python set of ints."""
+    def add_run(self, start, length):
+        """Add the `length` lines starting at line number `start` to the set."""
+        self.update(xrange(start, start + length))
+
+
+def blameruns(numlines, filelines, numauthors, seed=0):
+    """:Return: an iterator over :class:`Analyrun` runs for `numlines` lines of blame
+    in files of `filelines` lines each, by `numauthors` authors."""
+    rand = random.Random(seed)
+    authors = ['Author {0}'.format(i) for i in xrange(numauthors)]
+    for filenum in xrange((numlines + filelines - 1) // filelines):
+        filename = 'dir{0}/file{1}.py'.format(filenum % 100, filenum)
+        linenum, numfilelines = 1, min(filelines, numlines - filenum * filelines)
+        while linenum <= numfilelines:
+            length = min(rand.randint(1, 20), numfilelines - linenum + 1)
+            yield blamethrower.Analyrun(filename, linenum, length, rand.choice(authors))
+            linenum += length
+
+
+def run(lineset, inputtype, numlines, filelines, numauthors):
+    """Compute stats and print elapsed seconds, total lines, and max RSS in KiB."""
+    if lineset == 'set':
+        blamethrower.stats.LineSet = SetLineSet
+    analynes = blameruns(numlines, filelines, numauthors)
+    if inputtype == 'lines':
+        analynes = blamethrower.expand_runs(analynes)
+    start = time.time()
+    stats = blamethrower.stats.getstats(analynes)
+    print(time.time() - start, stats['overall']['lines'], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def main(args):
+    """Run each case in a subprocess and print results."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=10000000, help='total lines of blame')
+    parser.add_argument('--filelines', type=int, default=2000, help='lines per file')
+    parser.add_argument('--authors', type=int, default=50, help='number of authors')
+    parser.add_argument('--run', nargs=2, help=argparse.SUPPRESS)
+    opts = parser.parse_args(args)
+    if opts.run:
+        return run(opts.run[0], opts.run[1], opts.lines, opts.filelines, opts.authors)
+
+    print('{0} lines in {1}-line files by {2} authors'.format(opts.lines, opts.filelines, opts.authors))
+    print('{0:8} {1:6} {2:>10} {3:>10}'.format('lineset', 'input', 'seconds', 'maxrss MB'))
+    for lineset in ('set', 'bitmap'):
+        for inputtype in ('lines', 'runs'):
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--run', lineset, inputtype,
+                                              '--lines', str(opts.lines), '--filelines', str(opts.filelines), '--authors', str(opts.authors)])
+            seconds, numlines, maxrss = output.split()
+            assert int(numlines) == opts.lines
+            print('{0:8} {1:6} {2:10.3f} {3:10.1f}'.format(lineset, inputtype, float(seconds), int(maxrss) / 1024.0))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
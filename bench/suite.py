@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Benchmark each stage of BlameThrower on synthetic input.
+
+Generates blame and bugs for a synthetic project (see generators.py), then
+runs each stage in a fresh interpreter, with its own input already in memory,
+and records its time and peak memory (max RSS):
+
+  getblame  parse blame with blamethrower.getblame
+  getbugs   parse bugs with blamethrower.getbugs
+  merge     blamethrower.merge parsed bugs and blame
+  getstats  blamethrower.stats.getstats on merged analynes
+  as_tsv    format merged analynes as --rawdata output (blamethrower.tsv)
+  cli       the whole bin/blamethrower command, writing stats
+
+Results are printed as a table and can be saved as JSON with --output; give an
+earlier results file with --compare to see the change in each stage.
+
+    python bench/suite.py [--files N] [--lines N] [--density D] [--output results.json] [--compare old.json]
+"""
+
+from __future__ import print_function, division
+import sys
+import os
+import gc
+import json
+import time
+import shutil
+import platform
+import tempfile
+import resource
+import subprocess
+import argparse
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import blamethrower
+import blamethrower.stats
+import blamethrower.tsv
+import generators
+
+STAGES = ('getblame', 'getbugs', 'merge', 'getstats', 'as_tsv', 'cli')
+REPOS = {'git': generators.write_git, 'hg': generators.write_hg}
+ANALYZERS = {'pylint': generators.write_pylint, 'jslint': generators.write_jslint, 'findbugs': generators.write_findbugs}
+
+
+def prepare(stage, repo, blamefile, analyzer, bugsfile):
+    """Get everything `stage` needs in memory.
+
+    :Return: a function that runs `stage` and returns the number of items it produced.
+    """
+    def getblame():
+        """:Return: blame read from `blamefile`."""
+        return blamethrower.getblame(repo, open(blamefile, 'rU'))
+
+    def getbugs():
+        """:Return: bugs read from `bugsfile`."""
+        return blamethrower.getbugs(analyzer, open(bugsfile, 'rU'))
+
+    if stage == 'getblame':
+        return lambda: sum(len(authors) - 1 for _, authors in getblame())
+    if stage == 'getbugs':
+        return lambda: sum(1 for _ in getbugs())
+    if stage == 'cli':
+        cmd = [sys.executable, os.path.join(ROOT, 'bin', 'blamethrower'), '--' + repo, blamefile, '--' + analyzer, bugsfile]
+
+        def cli():
+            """Run the command, which has no items to count."""
+            with open(os.devnull, 'w') as devnull:
+                subprocess.check_call(cmd, stdout=devnull, env=dict(os.environ, PYTHONPATH=ROOT))
+        return cli
+
+    blame, bugs = list(getblame()), list(getbugs())
+    if stage == 'merge':
+        return lambda: sum(1 for _ in blamethrower.merge(bugs, blame))
+    analynes = list(blamethrower.merge(bugs, blame))
+    del blame[:], bugs[:]
+    if stage == 'getstats':
+        return lambda: blamethrower.stats.getstats(analynes)['overall']['lines']
+    if stage == 'as_tsv':
+        return lambda: sum(1 for _ in blamethrower.tsv.rows(analynes))
+    raise ValueError("Unknown stage '{0}'".format(stage))
+
+
+def run(stage, repo, blamefile, analyzer, bugsfile):
+    """Run `stage` and print a JSON object of its results."""
+    func = prepare(stage, repo, blamefile, analyzer, bugsfile)
+    gc.collect()
+    who = resource.RUSAGE_CHILDREN if stage == 'cli' else resource.RUSAGE_SELF
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if stage != 'cli' else 0
+    start = time.time()
+    items = func()
+    seconds = time.time() - start
+    maxrss = resource.getrusage(who).ru_maxrss
+    print(json.dumps({
+        'seconds': seconds,
+        'items': items,
+        'items_per_sec': items / seconds if items and seconds else None,
+        'maxrss_mb': maxrss / 1024,
+        'stage_mb': (maxrss - before) / 1024,       # How much the peak went up during the stage
+    }))
+
+
+def revision():
+    """:Return: the git revision of the code being benchmarked, or `None` if unknown."""
+    try:
+        proc = subprocess.Popen(['git', 'describe', '--always', '--dirty'], cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out = proc.communicate()[0].strip()
+    except OSError:
+        return None
+    return out if proc.returncode == 0 else None
+
+
+def generate(workdir, opts):
+    """Write synthetic blame and bugs into `workdir`, unless they're already there
+    from an earlier run with the same options.
+
+    :Return: a dict describing the input files.
+    """
+    project = generators.Project(opts.files, opts.lines, opts.authors, opts.commits, opts.seed)
+    inputs = {}
+    for kind, name, write in (('blame', opts.repo, REPOS[opts.repo]), ('bugs', opts.analyzer, ANALYZERS[opts.analyzer])):
+        path = os.path.join(workdir, '{0}.{1}.{2.files}x{2.lines}.a{2.authors}.c{2.commits}.d{2.density}.s{2.seed}.txt'.format(kind, name, opts))
+        if not os.path.exists(path):
+            with open(path + '.tmp', 'w') as outfile:
+                if kind == 'blame':
+                    write(outfile, project)
+                else:
+                    write(outfile, project.bugs(opts.density, opts.seed), opts.seed)
+            os.rename(path + '.tmp', path)
+        inputs[kind] = {'format': name, 'path': path, 'bytes': os.path.getsize(path)}
+    return inputs
+
+
+def compare(old, new):
+    """Print how each stage changed from results `old` to `new`."""
+    print('\nCompared to {0} ({1}):'.format(old.get('revision') or old.get('version'), old.get('timestamp')))
+    if old.get('params') != new.get('params'):
+        print('Warning: benchmark parameters differ.')
+    print('{0:10} {1:>10} {2:>10} {3:>8} {4:>10} {5:>10} {6:>8}'.format('stage', 'old s', 'new s', 'ratio', 'old MB', 'new MB', 'ratio'))
+    for stage in STAGES:
+        before, after = old['stages'].get(stage), new['stages'].get(stage)
+        if before and after:
+            print('{0:10} {1:10.3f} {2:10.3f} {3:8.2f} {4:10.1f} {5:10.1f} {6:8.2f}'.format(
+                stage, before['seconds'], after['seconds'], after['seconds'] / before['seconds'],
+                before['maxrss_mb'], after['maxrss_mb'], after['maxrss_mb'] / before['maxrss_mb']))
+
+
+def main(args):
+    """Generate input, run each stage in a subprocess, and report results."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=1000, help='files in the synthetic project (default %(default)s)')
+    parser.add_argument('--lines', type=int, default=300, help='average lines per file (default %(default)s)')
+    parser.add_argument('--authors', type=int, default=50, help='distinct authors (default %(default)s)')
+    parser.add_argument('--commits', type=int, default=5000, help='distinct commits (default %(default)s)')
+    parser.add_argument('--density', type=float, default=0.05, help='bugs per line of code (default %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default %(default)s)')
+    parser.add_argument('--repo', choices=sorted(REPOS), default='git', help='blame format (default %(default)s)')
+    parser.add_argument('--analyzer', choices=sorted(ANALYZERS), default='pylint', help='bugs format (default %(default)s)')
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma-separated stages to run (default all)')
+    parser.add_argument('--repeat', type=int, default=1, help='run each stage this many times and keep the fastest')
+    parser.add_argument('--workdir', help='keep generated input here and reuse it next time (default: a temp dir)')
+    parser.add_argument('--output', help='save results to this JSON file')
+    parser.add_argument('--compare', help='compare with results saved in this JSON file')
+    parser.add_argument('--run', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--inputs', nargs=4, help=argparse.SUPPRESS)
+    opts = parser.parse_args(args)
+    if opts.run:
+        return run(opts.run, *opts.inputs)
+
+    workdir = opts.workdir or tempfile.mkdtemp(prefix='blamethrower.bench.')
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    try:
+        inputs = generate(workdir, opts)
+        results = {
+            'version': blamethrower.__version__,
+            'revision': revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': datetime.now().replace(microsecond=0).isoformat(),
+            'params': dict((name, getattr(opts, name)) for name in ('files', 'lines', 'authors', 'commits', 'density', 'seed', 'repo', 'analyzer')),
+            'inputs': dict((kind, {'format': info['format'], 'bytes': info['bytes']}) for kind, info in inputs.iteritems()),
+            'stages': {},
+        }
+        print('{0} blame: {1:.1f} MB; {2} bugs: {3:.1f} MB'.format(opts.repo, inputs['blame']['bytes'] / 2 ** 20, opts.analyzer, inputs['bugs']['bytes'] / 2 ** 20))
+        print('{0:10} {1:>10} {2:>10} {3:>12} {4:>10} {5:>10}'.format('stage', 'seconds', 'items', 'items/sec', 'maxrss MB', 'stage MB'))
+        for stage in opts.stages.split(','):
+            runs = []
+            for _ in xrange(opts.repeat):
+                output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--run', stage, '--inputs',
+                                                  opts.repo, inputs['blame']['path'], opts.analyzer, inputs['bugs']['path']])
+                runs.append(json.loads(output))
+            result = results['stages'][stage] = min(runs, key=lambda result: result['seconds'])
+            print('{0:10} {1:10.3f} {2:>10} {3:>12} {4:10.1f} {5:10.1f}'.format(
+                stage, result['seconds'], result['items'] if result['items'] is not None else '-',
+                '{0:.0f}'.format(result['items_per_sec']) if result['items_per_sec'] else '-', result['maxrss_mb'], result['stage_mb']))
+    finally:
+        if not opts.workdir:
+            shutil.rmtree(workdir)
+
+    if opts.output:
+        with open(opts.output, 'w') as outfile:
+            json.dump(results, outfile, sort_keys=True, indent=2)
+    if opts.compare:
+        with open(opts.compare) as infile:
+            compare(json.load(infile), results)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -10,13 +10,18 @@ attribution information.
 
 from collections import namedtuple, defaultdict
 import itertools
+import operator
 import warnings
 
 import blamethrower.analyzers
 import blamethrower.reporeaders
+from blamethrower.runs import StringTable, BlameRuns
+import blamethrower.extsort
+import blamethrower.tsv
 
 
-__all__ = ['Analyne', 'getanalyzers', 'getreporeaders', 'getbugs', 'getblame', 'merge', 'read_analynes', 'getmodule', 'itergroup', 'NoOneToBlameWarning']
+__all__ = ['Analyne', 'Analyrun', 'getanalyzers', 'getreporeaders', 'getmanifest', 'getbugs', 'getblame', 'getblameruns', 'merge', 'expand_runs',
+           'read_analynes', 'getmodule', 'itergroup', 'NoOneToBlameWarning']
 __version__ = "0.7.0"
 
 #: A `namedtuple` describing a line of code: file, linenum, bugtype, severity, author
@@ -27,6 +32,13 @@ __version__ = "0.7.0"
 #: `author` is the author of the line
 Analyne = namedtuple('Analyne', 'filename linenum bugtype severity author')        # pylint: disable=C0103
 
+#: A `namedtuple` describing a run of consecutive lines in a file by the same author, with no bugs.
+#: `filename` is a filename string (including any path)
+#: `start` is the int line number of the first line
+#: `length` is the number of lines
+#: `author` is the author of the lines
+Analyrun = namedtuple('Analyrun', 'filename start length author')        # pylint: disable=C0103
+
 
 def getanalyzers():
     """:Return: the names of available static analyzers.
@@ -44,6 +56,14 @@ def getreporeaders():
     return tuple(blamethrower.reporeaders.__all__)
 
 
+def getmanifest(package):
+    """:Return: a dict mapping the name of each module in `package` (``'analyzers'``
+    or ``'reporeaders'``) to a dict of its ``help`` string and ``options`` dict,
+    without importing the modules.
+    """
+    return getmodule('blamethrower', package).MANIFEST
+
+
 def getbugs(analyzer_name, bugsfile, **options):
     """:Return: An iterator over :class:`Analyne` tuples for the bugs found
     in `bugsfile`.
@@ -72,7 +92,31 @@ def getblame(repo_name, blamefile, **options):
     return blamethrower.reporeaders._check_reporeader_output(reporeader.read(blamefile, **options))
 
 
-def merge(bugs=None, blame=None):
+def getblameruns(repo_name, blamefile, authors=None, **options):
+    """:Return: an iterator of ``(filename, BlameRuns)`` pairs: the same blame as
+    :func:`getblame`, but run-length encoded.
+
+    Uses the reporeader's `read_runs` function if it has one, or encodes the
+    output of its `read` function otherwise.
+    :param str repo_name: The name of the module to use to read `blamefile`.
+    :param file blamefile: VCS "blame" output from VCS `repo_name`.
+    :param StringTable authors: The table to intern author names in; share one
+      between calls to save memory.
+    :param dict(str,str) options: Any keyword arguments for the `read` or `read_runs` method.
+    :rtype: iter((str, BlameRuns))
+    """
+    reporeader = getmodule("blamethrower.reporeaders", repo_name)
+    if not reporeader:
+        raise ValueError("Unknown repo file type '{0}'".format(repo_name))
+    authors = StringTable() if authors is None else authors
+    if hasattr(reporeader, 'read_runs'):
+        blameruns = reporeader.read_runs(blamefile, authors, **options)
+    else:
+        blameruns = ((filename, BlameRuns.fromauthors(authorlist, authors)) for filename, authorlist in reporeader.read(blamefile, **options))
+    return blamethrower.reporeaders._check_reporeader_output(blameruns)
+
+
+def merge(bugs=None, blame=None, sortbuffer=None):
     """:Return: an iterator over :class:`Analyne` namedtuples with all information
     on the given `bugs` and/or `blame`.
 
@@ -80,8 +124,20 @@ def merge(bugs=None, blame=None):
     If `blame` is given and a bug has no author, the bug is returned without an author
     and a :exc:`NoOneToBlameWarning` is raised.  In particular, note that some analyzers give bugs
     for lines that don't actually exist.
+
+    Blame for a file may also be a :class:`BlameRuns`, from :func:`getblameruns`.  Lines of such
+    files without bugs are output as :class:`Analyrun` runs rather than one :class:`Analyne` per
+    line; see :func:`expand_runs`.
+
+    By default, all bugs are read into memory before any blame.  If `sortbuffer` is given,
+    bugs and blame are instead both sorted by filename, with at most about `sortbuffer` bugs
+    (or lines of blame) in memory at once and the rest spilled to temporary files, and then
+    joined a file at a time.  The output is then in filename order, with bugs with no blame
+    output as they are found rather than at the end.
     :param iter(Analyne) bugs: Iterator over Analyne namedtuples from :func:`getbugs`.
-    :param iter((str, list(str))) blame: an iterable of ``(filename,  authorlist)`` pairs from :func:`getblame`.
+    :param iter((str, list(str))) blame: an iterable of ``(filename,  authorlist)`` pairs from
+      :func:`getblame` or :func:`getblameruns`.
+    :param int sortbuffer: Join bugs and blame with an external sort, using this size of buffer.
     :raises NoOneToBlameWarning: If `bugs` and `blame` are given and there is one or more bugs with no blame.
     """
     # Assumption: each line can only have one author, but multiple bugs.  [Later: one language, one linetype]
@@ -90,21 +146,20 @@ def merge(bugs=None, blame=None):
         for bug in bugs:
             yield bug
 
+    elif blame and sortbuffer:
+        for analyne in _sortmerge(bugs, blame, sortbuffer):
+            yield analyne
+
     elif blame:
         file2line2bugs = defaultdict(lambda: defaultdict(list))
         for bug in bugs or []:
             file2line2bugs[bug.filename][bug.linenum].append(bug)
 
         for filename, authorlist in blame:
-            linenum = 0
-            for linenum, author in enumerate(authorlist[1:], 1):
-                buglist = file2line2bugs.get(filename, {}).get(linenum)       # Tread lightly on defaultdicts
-                if buglist:
-                    for bug in buglist:
-                        yield bug._replace(author=author)               # pylint: disable=W0212
-                    del file2line2bugs[filename][linenum]
-                else:
-                    yield Analyne(filename=filename, linenum=linenum, bugtype=None, severity=None, author=author)
+            line2bugs = file2line2bugs.get(filename, {})        # Tread lightly on defaultdicts
+            mergefile = _merge_runs if isinstance(authorlist, BlameRuns) else _merge_authorlist
+            for analyne in mergefile(filename, authorlist, line2bugs):
+                yield analyne
 
         # Output any remaining bugs with no blame, and raise warning.
         numbugs = 0
@@ -117,20 +172,97 @@ def merge(bugs=None, blame=None):
         return      # No inputs, no outputs.
 
 
+def _sortmerge(bugs, blame, sortbuffer):
+    """:Return: an iterator over the output of :func:`merge` using a sort-merge join."""
+    bugs = blamethrower.extsort.sort(bugs or [], operator.attrgetter('filename', 'linenum'), sortbuffer)
+    blame = blamethrower.extsort.sort(blame, operator.itemgetter(0), sortbuffer, lambda file_authors: len(file_authors[1]))
+    file2bugs = itertools.groupby(bugs, operator.attrgetter('filename'))
+    bugfile, filebugs = next(file2bugs, (None, ()))
+    numbugs = 0
+    for filename, fileblame in itertools.groupby(blame, operator.itemgetter(0)):
+        while bugfile is not None and bugfile < filename:       # No blame for these bugs
+            for numbugs, bug in enumerate(filebugs, numbugs + 1):
+                yield bug
+            bugfile, filebugs = next(file2bugs, (None, ()))
+
+        line2bugs = defaultdict(list)
+        if bugfile == filename:
+            for bug in filebugs:
+                line2bugs[bug.linenum].append(bug)
+            bugfile, filebugs = next(file2bugs, (None, ()))
+        for _, authorlist in fileblame:
+            mergefile = _merge_runs if isinstance(authorlist, BlameRuns) else _merge_authorlist
+            for analyne in mergefile(filename, authorlist, line2bugs):
+                yield analyne
+        for numbugs, bug in enumerate(itertools.chain.from_iterable(line2bugs[linenum] for linenum in sorted(line2bugs)), numbugs + 1):
+            yield bug
+
+    while bugfile is not None:
+        for numbugs, bug in enumerate(filebugs, numbugs + 1):
+            yield bug
+        bugfile, filebugs = next(file2bugs, (None, ()))
+    if numbugs:
+        warnings.warn(NoOneToBlameWarning(numbugs), stacklevel=3)
+
+
+def _merge_authorlist(filename, authorlist, line2bugs):
+    """:Return: an iterator over :class:`Analyne` namedtuples for each line of `filename`,
+    removing any bugs on those lines from `line2bugs`."""
+    for linenum, author in enumerate(authorlist[1:], 1):
+        buglist = line2bugs.pop(linenum, None)
+        if buglist:
+            for bug in buglist:
+                yield bug._replace(author=author)               # pylint: disable=W0212
+        else:
+            yield Analyne(filename=filename, linenum=linenum, bugtype=None, severity=None, author=author)
+
+
+def _merge_runs(filename, blameruns, line2bugs):
+    """:Return: an iterator over an :class:`Analyne` for each bug in `filename` and an
+    :class:`Analyrun` for each run of lines between them, removing those bugs from `line2bugs`."""
+    buglines = sorted(line2bugs)
+    i = 0
+    for start, length, author_id in blameruns:
+        author = blameruns.authors[author_id]
+        end = start + length
+        while i < len(buglines) and buglines[i] < end:
+            linenum = buglines[i]
+            i += 1
+            if linenum < start:
+                continue        # Before line 1; leave it for the no-blame bugs.
+            if linenum > start:
+                yield Analyrun(filename, start, linenum - start, author)
+            for bug in line2bugs.pop(linenum):
+                yield bug._replace(author=author)               # pylint: disable=W0212
+            start = linenum + 1
+        if start < end:
+            yield Analyrun(filename, start, end - start, author)
+
+
+def expand_runs(analynes):
+    """:Return: an iterator over `analynes`, with any :class:`Analyrun` from :func:`merge`
+    expanded into an :class:`Analyne` for each of its lines."""
+    for analyne in analynes:
+        if isinstance(analyne, Analyrun):
+            filename, start, length, author = analyne
+            for linenum in xrange(start, start + length):
+                yield Analyne(filename, linenum, None, None, author)
+        else:
+            yield analyne
+
+
 def read_analynes(infile):
     """:Return: an iterator over :class:`Analyne` namedtuples read from open-for-reading
-    text file `infile`."""
-    for line in infile:
-        filename, linenum, bugtype, severity, author = (field or None for field in line.rstrip('\n').split('\t'))
-        linenum = int(linenum)
-        severity = severity or None
-        yield Analyne(filename, linenum, bugtype, severity, author)
+    text file `infile` of tab-separated values without a header; see :mod:`blamethrower.tsv`."""
+    return blamethrower.tsv.read(infile)
 
 
 def blame2analynes(blame):
     """:Return: an iterator over :class:`Analyne` namedtuples constructed from
-    the output of :func:`getblame` `blame`."""
+    the output of :func:`getblame` or :func:`getblameruns` `blame`."""
     for filename, authors in blame:
+        if isinstance(authors, BlameRuns):
+            authors = authors.tolist()
         for linenum, author in enumerate(authors[1:], 1):
             yield Analyne(filename, linenum, None, None, author)
 
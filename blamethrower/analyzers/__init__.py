@@ -5,6 +5,14 @@
 
 __all__ = ['findbugs', 'jslint', 'pylint']
 
+#: The ``HELP`` and ``OPTIONS`` of each analyzer, so the command line can offer
+#: them without importing every analyzer.  Keep in sync with the modules (the tests check).
+MANIFEST = {
+    'findbugs': {'help': 'FindBugs -xml:withMessages', 'options': {'prefix': 'add path prefix to FindBugs filenames'}},
+    'jslint': {'help': 'jslint4java --maxerr 100000', 'options': {}},
+    'pylint': {'help': 'pylint -iy -rn -fparseable', 'options': {}},
+}
+
 
 import blamethrower
 
@@ -13,11 +13,17 @@ lines, so we just pick the first.
 
 The only other issues are that FindBugs works on compiled binaries, so the
 source file names may not line up with your repo blame filenames; and it
-sometimes outputs duplicate bugs.
+sometimes outputs duplicate bugs (drop them with `blamethrower --dedup`).
+
+Reports can be huge, so we parse them incrementally, and throw away each
+<BugInstance> (and anything else under the root) as soon as we're done with it,
+so memory use stays constant.
 """
 
-from xml.etree import ElementTree
-from itertools import ifilter
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
 
 from blamethrower import Analyne
 
@@ -38,22 +44,40 @@ def rank2severity(rank):
         assert False
 
 
+def _getbugs(bug, prefix):
+    """:Return: an iterator over an :class:`Analyne` for each line with <BugInstance> `bug`."""
+    bugtype = bug.get('type')
+    severity = rank2severity(int(bug.get('rank')))
+    sourcelines = bug.findall('SourceLine')
+    assert sourcelines, "No SourceLine for bug: {0}".format(bug.attrib)
+    if len(sourcelines) > 1:
+        sourcelines = [line for line in sourcelines if line.get('primary') or line.get('role') == 'SOURCE_LINE_ANOTHER_INSTANCE']
+        assert sourcelines, "No SourceLine for bug: {0}".format(bug.attrib)
+    for sourceline in sourcelines:
+        yield Analyne(prefix + sourceline.get('sourcepath'), int(sourceline.get('start')), bugtype, severity, None)
+
+
 def analyze(bugsfile, prefix=''):
     """:Return: an iterable of :class:`Analyne` objects read from FindBugs
     -xml:withMessages file `bugsfile`.
 
     :param str prefix: A path prefix to prepend to every filename.
     """
-    for _, bug in ifilter(lambda event_elt: event_elt[1].tag == 'BugInstance', ElementTree.iterparse(bugsfile)):
-        bugtype = bug.get('type')
-        severity = rank2severity(int(bug.get('rank')))
-        sourcelines = bug.findall('SourceLine')
-        assert sourcelines, "No SourceLine for bug: {}".format(bug.attrib)
-        if len(sourcelines) > 1:
-            sourcelines = [line for line in sourcelines if line.attrib.get('primary') or line.attrib.get('role') == 'SOURCE_LINE_ANOTHER_INSTANCE']
-            assert sourcelines, "No SourceLine for bug: {}".format(bug.attrib)
-        for sourceline in sourcelines:
-            filename = prefix + sourceline.get('sourcepath')
-            linenum = sourceline.get('start')
-            yield Analyne(filename, int(linenum), bugtype, severity, None)
-        bug.clear()
+    events = ElementTree.iterparse(bugsfile, events=('start', 'end'))
+    _, root = next(events)
+    depth = 0           # Below the root
+    top = None          # The child of the root we're in
+    for event, elem in events:
+        if event == 'start':
+            depth += 1
+            if depth == 1:
+                top = elem
+            continue
+        depth -= 1
+        if depth == 0:
+            if elem.tag == 'BugInstance':
+                for analyne in _getbugs(elem, prefix):
+                    yield analyne
+            root.clear()
+        elif depth == 1 and top.tag != 'BugInstance':
+            top.clear()         # E.g., each of the many <ClassStats> in <FindBugsSummary>
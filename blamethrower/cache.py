@@ -0,0 +1,151 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+A persistent on-disk cache of per-file blame.
+
+Blaming a file that hasn't changed gives the same answer every time, so a
+:class:`BlameCache` keeps the author list of each file blamed, keyed by
+whatever identifies its content: for git, the path and blob id.  Re-running on
+a repo then only has to blame the files that changed.
+
+Entries are stored one per file (as run-length encoded authors), so several
+processes can share a cache.  When the cache grows past its size limit, the
+least recently used entries are deleted.
+"""
+
+import os
+import hashlib
+import tempfile
+import cPickle as pickle
+from array import array
+
+from blamethrower.runs import StringTable, BlameRuns
+
+__all__ = ['BlameCache', 'DEFAULT_MAXSIZE']
+
+#: The default size limit of a cache, in bytes.
+DEFAULT_MAXSIZE = 256 << 20
+
+
+class BlameCache(object):
+    """A size-bounded directory of cached author lists."""
+    def __init__(self, directory, maxsize=DEFAULT_MAXSIZE):
+        """:param str directory: Where to keep the cache; created if it doesn't exist.
+        :param int maxsize: Evict old entries when the cache is bigger than this many bytes.
+        """
+        self.directory = directory
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def key(*parts):
+        """:Return: a cache key for the content identified by strings `parts`."""
+        return hashlib.sha1('\0'.join(parts)).hexdigest()
+
+    def _path(self, key):
+        """:Return: the path of the file holding the entry for `key`."""
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def _entries(self):
+        """:Return: an iterator of ``(path, size, last used time)`` for every entry in the cache."""
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.startswith('.'):     # Still being written
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:         # Evicted by someone else
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key):
+        """:Return: the author list cached for `key`, or `None` if there isn't one.
+
+        A corrupt entry counts as a miss, and is deleted.
+        """
+        path = self._path(key)
+        try:
+            infile = open(path, 'rb')
+        except IOError:
+            self.misses += 1
+            return None
+        try:
+            with infile:
+                strings, runs = pickle.load(infile)
+            if len(runs) % 3:
+                raise ValueError('Runs are not (start, length, author_id) triples')
+            authors = StringTable()
+            for string in strings:
+                authors.getid(string)
+            authorlist = BlameRuns(authors, array('l', runs)).tolist()
+        except Exception:           # pylint: disable=W0703
+            self.misses += 1        # Unpickling garbage can raise most anything.
+            self._remove(path)
+            return None
+        try:
+            os.utime(path, None)        # Mark as recently used
+        except OSError:         # Evicted by someone else
+            pass
+        self.hits += 1
+        return authorlist
+
+    def put(self, key, authorlist):
+        """Cache author list `authorlist` (as from :func:`blamethrower.getblame`) for `key`."""
+        blameruns = BlameRuns.fromauthors(authorlist, StringTable())
+        data = pickle.dumps((blameruns.authors.strings, blameruns.runs.tolist()), pickle.HIGHEST_PROTOCOL)
+        path = self._path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:             # Made by someone else in the meantime
+                pass
+        # Write to a temporary file and rename, so readers never see a partial entry.
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.')
+        with os.fdopen(fd, 'wb') as outfile:
+            outfile.write(data)
+        oldsize = self._filesize(path)        # Of the entry being replaced, if any
+        os.rename(tmppath, path)
+        self._size += len(data) - oldsize
+        if self._size > self.maxsize:
+            self.evict()
+
+    @staticmethod
+    def _filesize(path):
+        """:Return: the size of the file at `path`, or 0 if there isn't one."""
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return 0
+
+    def _remove(self, path):
+        """Delete the entry at `path`, if it's still there."""
+        size = self._filesize(path)
+        try:
+            os.remove(path)
+        except OSError:         # Evicted by someone else
+            return
+        self._size -= size
+
+    def evict(self, target=None):
+        """Delete the least recently used entries until the cache is no bigger than
+        `target` bytes (by default, a bit under its size limit, so we don't evict
+        again right away)."""
+        target = int(self.maxsize * 0.9) if target is None else target
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._size -= size
+
+    def __len__(self):
+        return sum(1 for _ in self._entries())
@@ -0,0 +1,213 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Binary columnar file format for raw analyne data.
+
+Writing ``--rawdata`` as text means re-tokenizing every line to read it back.
+This format stores :class:`blamethrower.columns.AnalyneBatch` columns as they are
+in memory, so :class:`ColumnFile` can memory-map a file and hand out columns
+without parsing or copying anything.
+
+Layout (all integers little-endian)::
+
+    header:    'BTCOLS' version(uint16)
+    segment:   'SEG' nrows(uint32)
+               filename ids (int32 * nrows)  line numbers (int32 * nrows)
+               bugtype ids (int32 * nrows)   severity codes (int8 * nrows)
+               author ids (int32 * nrows)
+    ...        (one segment per batch)
+    tables:    for filenames, bugtypes, authors:
+               count(uint32) lengths(uint32 * count) strings (UTF-8, lengths in bytes)
+    trailer:   tables offset(uint64) 'BTCOLS'
+
+String tables come last because they grow as batches are written, so a file can
+be written in one pass to a pipe.  Ids of -1 stand for `None`.
+"""
+
+from array import array
+import mmap
+import os
+import struct
+import sys
+
+from blamethrower.columns import AnalyneBatch, Tables
+
+__all__ = ['write', 'ColumnFile']
+
+MAGIC = 'BTCOLS'
+VERSION = 1
+#: Column names and array typecodes, in the order they are stored.
+COLUMNS = (('filenames', 'i'), ('linenums', 'i'), ('bugtypes', 'i'), ('severities', 'b'), ('authors', 'i'))
+
+_HEADER = struct.Struct('<6sH')
+_SEGMENT = struct.Struct('<3sI')
+_TRAILER = struct.Struct('<Q6s')
+_BIGENDIAN = sys.byteorder == 'big'
+
+
+def _tostring(column):
+    """:Return: the bytes of array `column`, little-endian."""
+    if _BIGENDIAN and column.itemsize > 1:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tostring()
+
+
+def write(batches, outfile, tables):
+    """Write :class:`AnalyneBatch` es `batches` to binary file `outfile` in columnar format.
+
+    :param Tables tables: The tables shared by all `batches`.
+    """
+    outfile.write(_HEADER.pack(MAGIC, VERSION))
+    offset = _HEADER.size
+    for batch in batches:
+        assert batch.tables is tables
+        outfile.write(_SEGMENT.pack('SEG', len(batch)))
+        offset += _SEGMENT.size
+        for name, _ in COLUMNS:
+            data = _tostring(getattr(batch, name))
+            outfile.write(data)
+            offset += len(data)
+
+    for table in (tables.filenames, tables.bugtypes, tables.authors):
+        strings = [string.encode('utf-8') if isinstance(string, unicode) else string for string in table.strings]
+        outfile.write(struct.pack('<I', len(strings)))
+        outfile.write(_tostring(array('I', (len(string) for string in strings))))       # Bytes, not characters
+        outfile.write(''.join(strings))
+    outfile.write(_TRAILER.pack(offset, MAGIC))
+
+
+class MappedColumn(object):
+    """A read-only sequence of fixed-width integers read straight out of a memory map."""
+    __slots__ = ('_buffer', '_offset', '_length', '_struct')
+
+    def __init__(self, buffer_, offset, length, typecode):
+        self._buffer = buffer_
+        self._offset = offset
+        self._length = length
+        self._struct = struct.Struct('<' + typecode)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('column index out of range')
+        return self._struct.unpack_from(self._buffer, self._offset + index * self._struct.size)[0]
+
+    def __iter__(self):
+        # Unpack a chunk at a time; one at a time is much slower.
+        size, fmt = self._struct.size, self._struct.format
+        for start in xrange(0, self._length, 65536):
+            count = min(65536, self._length - start)
+            for value in struct.unpack_from('{0}{1}{2}'.format(fmt[0], count, fmt[1:]), self._buffer, self._offset + start * size):
+                yield value
+
+    def toarray(self):
+        """:Return: a copy of the column as an :class:`array.array`."""
+        column = array(self._struct.format[1:])
+        column.fromstring(self._buffer[self._offset:self._offset + self._length * self._struct.size])
+        if _BIGENDIAN and column.itemsize > 1:
+            column.byteswap()
+        return column
+
+
+class ColumnFile(object):
+    """A memory-mapped file written by :func:`write`.
+
+    Iterate over it for :class:`blamethrower.Analyne` tuples, or use :meth:`columns`
+    for the columns of each segment straight from the file, or :meth:`batches`
+    for copies of them as :class:`AnalyneBatch` es.
+    """
+    def __init__(self, infile):
+        """:param file infile: A file written by :func:`write`, open for reading.
+
+        :raises ValueError: If `infile` is not a complete file of a version this can read.
+        """
+        if os.fstat(infile.fileno()).st_size < _HEADER.size + _TRAILER.size:
+            raise ValueError("Not a BlameThrower columnar file (too short)")
+        self._map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read()
+        except struct.error:
+            self._map.close()
+            raise ValueError("Truncated BlameThrower columnar file")
+        except ValueError:
+            self._map.close()
+            raise
+
+    def _read(self):
+        """Read the string tables and find the segments.
+
+        :raises struct.error: If the file ends too soon.
+        """
+        magic, version = _HEADER.unpack_from(self._map, 0)
+        tablesoffset, endmagic = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+        if magic != MAGIC or endmagic != MAGIC:
+            raise ValueError("Not a BlameThrower columnar file")
+        if version != VERSION:
+            raise ValueError("Unsupported BlameThrower columnar file version {0}".format(version))
+        if not _HEADER.size <= tablesoffset <= len(self._map) - _TRAILER.size:
+            raise ValueError("Corrupt BlameThrower columnar file: string tables at offset {0}".format(tablesoffset))
+        self.tables = Tables()
+        offset = tablesoffset
+        for table in (self.tables.filenames, self.tables.bugtypes, self.tables.authors):
+            count, = struct.unpack_from('<I', self._map, offset)
+            lengths = struct.unpack_from('<{0}I'.format(count), self._map, offset + 4)
+            offset += 4 + 4 * count
+            for length in lengths:
+                if offset + length > len(self._map):
+                    raise struct.error('string past end of file')
+                string = self._map[offset:offset + length]
+                table.ids.setdefault(string, len(table.strings))      # Not getid(), so ids stay put even if
+                table.strings.append(string)                          # u'x' and 'x' were both written as 'x'.
+                offset += length
+
+        self._segments = []     # (nrows, offset of first column)
+        offset = _HEADER.size
+        while offset < tablesoffset:
+            tag, nrows = _SEGMENT.unpack_from(self._map, offset)
+            if tag != 'SEG':
+                raise ValueError("Corrupt BlameThrower columnar file at offset {0}".format(offset))
+            offset += _SEGMENT.size
+            self._segments.append((nrows, offset))
+            offset += nrows * sum(array(typecode).itemsize for _, typecode in COLUMNS)
+        if offset != tablesoffset:
+            raise ValueError("Corrupt BlameThrower columnar file: last segment runs past offset {0}".format(tablesoffset))
+
+    def columns(self):
+        """:Return: an iterator over a dict for each segment, mapping column names
+        to :class:`MappedColumn` s that read directly from the file."""
+        for nrows, offset in self._segments:
+            columns = {}
+            for name, typecode in COLUMNS:
+                columns[name] = MappedColumn(self._map, offset, nrows, typecode)
+                offset += nrows * array(typecode).itemsize
+            yield columns
+
+    def batches(self):
+        """:Return: an iterator over an :class:`AnalyneBatch` for each segment.
+
+        Each batch's columns are copies (as from :meth:`MappedColumn.toarray`), since
+        :class:`AnalyneBatch` holds arrays; to read columns without copying, use :meth:`columns`.
+        """
+        for columns in self.columns():
+            batch = AnalyneBatch(self.tables)
+            for name, column in columns.iteritems():
+                setattr(batch, name, column.toarray())
+            yield batch
+
+    def __iter__(self):
+        for batch in self.batches():
+            for analyne in batch:
+                yield analyne
+
+    def __len__(self):
+        return sum(nrows for nrows, _ in self._segments)
+
+    def close(self):
+        """Unmap the file."""
+        self._map.close()
@@ -0,0 +1,296 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Columnar batches of analynes.
+
+An :class:`AnalyneBatch` holds many analynes as columns: arrays of filename ids,
+line numbers, bugtype ids, severity codes, and author ids, with the strings
+interned in :class:`Tables` shared by every batch.  A row costs 17 bytes rather
+than a tuple and its fields, and whole runs of blame are added to a batch with
+a few array operations rather than one tuple per line.
+
+:func:`getbugs`, :func:`merge`, and :func:`getstats` work like their namesakes in
+:mod:`blamethrower` and :mod:`blamethrower.stats`, but on batches.  Iterating
+over a batch gives plain :class:`blamethrower.Analyne` tuples.
+"""
+
+from array import array
+from collections import defaultdict
+import itertools
+import warnings
+
+import blamethrower
+import blamethrower.stats
+from blamethrower import Analyne, Analyrun, NoOneToBlameWarning
+from blamethrower.runs import StringTable, BlameRuns
+
+__all__ = ['SEVERITIES', 'NONE', 'Tables', 'AnalyneBatch', 'tobatches', 'getbugs', 'merge', 'getstats', 'getpartial']
+
+#: Severities, indexed by severity code.
+SEVERITIES = (None, 'high', 'med', 'low')
+#: The id for a bugtype or author that is `None`.
+NONE = -1
+#: The default number of rows in a batch.
+BATCHSIZE = 65536
+
+_SEVERITY_CODES = dict((severity, code) for code, severity in enumerate(SEVERITIES))
+
+
+class Tables(object):
+    """The string tables for the filenames, bugtypes, and authors of a set of batches."""
+    __slots__ = ('filenames', 'bugtypes', 'authors')
+
+    def __init__(self, authors=None):
+        """:param StringTable authors: An existing table of authors, such as the
+          one given to :func:`blamethrower.getblameruns`."""
+        self.filenames = StringTable()
+        self.bugtypes = StringTable()
+        self.authors = StringTable() if authors is None else authors
+
+
+class AnalyneBatch(object):
+    """A batch of analynes, stored as columns."""
+    __slots__ = ('tables', 'filenames', 'linenums', 'bugtypes', 'severities', 'authors')
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.filenames = array('i')
+        self.linenums = array('i')
+        self.bugtypes = array('i')
+        self.severities = array('b')
+        self.authors = array('i')
+
+    def append(self, analyne):
+        """Add :class:`Analyne` `analyne` to the end of the batch."""
+        tables = self.tables
+        self.filenames.append(tables.filenames.getid(analyne.filename))
+        self.linenums.append(analyne.linenum)
+        self.bugtypes.append(NONE if analyne.bugtype is None else tables.bugtypes.getid(analyne.bugtype))
+        self.severities.append(_SEVERITY_CODES.get(analyne.severity, 0))
+        self.authors.append(NONE if analyne.author is None else tables.authors.getid(analyne.author))
+
+    def append_row(self, fileid, linenum, bugtypeid, severity, authorid):
+        """Add a row given by ids and codes to the end of the batch."""
+        self.filenames.append(fileid)
+        self.linenums.append(linenum)
+        self.bugtypes.append(bugtypeid)
+        self.severities.append(severity)
+        self.authors.append(authorid)
+
+    def append_run(self, fileid, start, length, authorid):
+        """Add a row without a bug for each of the `length` lines from `start`."""
+        self.filenames.extend(array('i', (fileid,)) * length)
+        self.linenums.extend(xrange(start, start + length))
+        self.bugtypes.extend(array('i', (NONE,)) * length)
+        self.severities.extend(array('b', (0,)) * length)
+        self.authors.extend(array('i', (authorid,)) * length)
+
+    def extend(self, other):
+        """Add all rows of `other`, which must share our :class:`Tables`, to the end of the batch."""
+        assert other.tables is self.tables
+        for column in self.__slots__[1:]:
+            getattr(self, column).extend(getattr(other, column))
+
+    def rows(self):
+        """:Return: an iterator over ``(fileid, linenum, bugtypeid, severity, authorid)`` rows."""
+        return itertools.izip(self.filenames, self.linenums, self.bugtypes, self.severities, self.authors)
+
+    def __iter__(self):
+        filenames, bugtypes, authors = self.tables.filenames.strings, self.tables.bugtypes.strings, self.tables.authors.strings
+        for fileid, linenum, bugtypeid, severity, authorid in self.rows():
+            yield Analyne(filenames[fileid], linenum, None if bugtypeid == NONE else bugtypes[bugtypeid],
+                          SEVERITIES[severity], None if authorid == NONE else authors[authorid])
+
+    def __len__(self):
+        return len(self.linenums)
+
+
+def tobatches(analynes, tables, size=BATCHSIZE):
+    """:Return: an iterator over :class:`AnalyneBatch` es of about `size` rows holding `analynes`,
+    expanding any :class:`blamethrower.Analyrun`."""
+    getfileid, getbugtypeid, getauthorid = tables.filenames.getid, tables.bugtypes.getid, tables.authors.getid
+    analynes = iter(analynes)
+    while True:
+        batch = AnalyneBatch(tables)
+        # This is the inner loop of converting every analyne, so the appends are unrolled.
+        filenames, linenums, bugtypes = batch.filenames.append, batch.linenums.append, batch.bugtypes.append
+        severities, authors = batch.severities.append, batch.authors.append
+        for analyne in itertools.islice(analynes, size):
+            if analyne.__class__ is Analyrun:
+                batch.append_run(getfileid(analyne.filename), analyne.start, analyne.length,
+                                 NONE if analyne.author is None else getauthorid(analyne.author))
+                continue
+            filename, linenum, bugtype, severity, author = analyne
+            filenames(getfileid(filename))
+            linenums(linenum)
+            bugtypes(NONE if bugtype is None else getbugtypeid(bugtype))
+            severities(_SEVERITY_CODES.get(severity, 0))
+            authors(NONE if author is None else getauthorid(author))
+        if not len(batch):
+            return
+        yield batch
+
+
+def getbugs(analyzer_name, bugsfile, tables, size=BATCHSIZE, **options):
+    """:Return: an iterator over :class:`AnalyneBatch` es of the bugs found in `bugsfile`;
+    see :func:`blamethrower.getbugs`."""
+    return tobatches(blamethrower.getbugs(analyzer_name, bugsfile, **options), tables, size)
+
+
+def merge(bugs=None, blame=None, tables=None, size=BATCHSIZE):
+    """:Return: an iterator over :class:`AnalyneBatch` es with all information on the given
+    `bugs` and/or `blame`; the rows are the same as the output of :func:`blamethrower.merge`.
+
+    Bugs are collected into one batch and indexed by file, rather than into a dict
+    of lists of tuples.  Bugs with no blame come last, in the order they were read.
+    :param iter(AnalyneBatch) bugs: Batches from :func:`getbugs`.
+    :param iter((str, BlameRuns)) blame: ``(filename, authors)`` pairs from
+      :func:`blamethrower.getblameruns` or :func:`blamethrower.getblame`.
+    :param Tables tables: The tables of `bugs`, which output batches will also use.
+    :raises NoOneToBlameWarning: If `bugs` and `blame` are given and there is one or more bugs with no blame.
+    """
+    if not blame:
+        for batch in bugs or ():
+            yield batch
+        return
+
+    allbugs = AnalyneBatch(tables)
+    for batch in bugs or ():
+        allbugs.extend(batch)
+    # Row numbers of bugs in order of (file, line), and where each file's rows start and end.
+    fileids, linenums = allbugs.filenames, allbugs.linenums
+    order = array('l', sorted(xrange(len(allbugs)), key=lambda row: (fileids[row] << 32) | linenums[row]))
+    file2rows = {}
+    for pos, row in enumerate(order):
+        file2rows.setdefault(fileids[row], [pos, pos])[1] = pos + 1
+    done = bytearray(len(allbugs))
+
+    out = AnalyneBatch(tables)
+    for filename, authors in blame:
+        if not isinstance(authors, BlameRuns):
+            authors = BlameRuns.fromauthors(authors, tables.authors)
+        fileid = tables.filenames.getid(filename)
+        pos, endpos = file2rows.get(fileid, (0, 0))
+        for start, length, authorid in authors:
+            if authors.authors is not tables.authors:
+                authorid = tables.authors.getid(authors.authors[authorid])
+            end = start + length
+            while pos < endpos and linenums[order[pos]] < end:
+                row = order[pos]
+                pos += 1
+                linenum = linenums[row]
+                if linenum < start or done[row]:
+                    continue
+                if linenum > start:
+                    out.append_run(fileid, start, linenum - start, authorid)
+                out.append_row(fileid, linenum, allbugs.bugtypes[row], allbugs.severities[row], authorid)
+                done[row] = 1
+                # Any more bugs on the same line come next in order.
+                while pos < endpos and linenums[order[pos]] == linenum:
+                    row = order[pos]
+                    pos += 1
+                    if not done[row]:
+                        out.append_row(fileid, linenum, allbugs.bugtypes[row], allbugs.severities[row], authorid)
+                        done[row] = 1
+                start = linenum + 1
+            if start < end:
+                out.append_run(fileid, start, end - start, authorid)
+            if len(out) >= size:
+                yield out
+                out = AnalyneBatch(tables)
+
+    numbugs = 0
+    for row, rowdone in enumerate(done):
+        if not rowdone:
+            numbugs += 1
+            out.append_row(fileids[row], linenums[row], allbugs.bugtypes[row], allbugs.severities[row], allbugs.authors[row])
+            if len(out) >= size:
+                yield out
+                out = AnalyneBatch(tables)
+    if len(out):
+        yield out
+    if numbugs:
+        warnings.warn(NoOneToBlameWarning(numbugs), stacklevel=2)
+
+
+# Where each field of :data:`blamethrower.stats.GROUP_FIELDS` is in a row.
+_ROW_INDEX = {'filename': 0, 'bugtype': 2, 'severity': 3, 'author': 4}
+
+
+def getstats(batches, groupby=(), directories=False, maxdepth=None, minlines=0):
+    """:Return: the same statistics as :func:`blamethrower.stats.getstats` for the analynes in `batches`,
+    which must all share the same :class:`Tables`, with the same optional groups and directories."""
+    return blamethrower.stats.finish(getpartial(batches, groupby, directories), directories, maxdepth, minlines)
+
+
+def getpartial(batches, groupby=(), directories=False):
+    """:Return: the same partial aggregate as :func:`blamethrower.stats.getpartial` for the
+    analynes in `batches`, which must all share the same :class:`Tables`."""
+    authors = defaultdict(blamethrower.stats._newauthor)        # By author id
+    groupings = [([_ROW_INDEX[field] for field in fields], defaultdict(blamethrower.stats._newauthor))
+                 for fields in blamethrower.stats._groupings(groupby, directories)]   # By tuple of ids
+    tables = None
+    for batch in batches:
+        tables = batch.tables
+        # Consecutive lines of blame by the same author are added to line sets as runs.
+        runfile = runauthor = NONE
+        runstart = runend = 0
+        for fileid, linenum, bugtypeid, severity, authorid in batch.rows():
+            if bugtypeid == NONE and linenum == runend and fileid == runfile and authorid == runauthor:
+                runend += 1
+                continue
+            if runend:
+                stats = authors[runauthor]
+                stats['lines'][runfile].add_run(runstart, runend - runstart)
+                stats['files'].add(runfile)
+                for indexes, groups in groupings:
+                    runrow = (runfile, runstart, NONE, 0, runauthor)
+                    _addrun(groups[tuple(runrow[i] for i in indexes)], runfile, runstart, runend)
+                runend = 0
+            if bugtypeid == NONE:
+                runfile, runauthor, runstart, runend = fileid, authorid, linenum, linenum + 1
+            else:
+                stats = authors[authorid]
+                stats['lines'][fileid].add(linenum)
+                stats['bugs'][SEVERITIES[severity] or 'total'] += 1
+                stats['files'].add(fileid)
+                for indexes, groups in groupings:
+                    row = (fileid, linenum, bugtypeid, severity, authorid)
+                    _addbug(groups[tuple(row[i] for i in indexes)], fileid, linenum, severity)
+        if runend:
+            _addrun(authors[runauthor], runfile, runstart, runend)
+            for indexes, groups in groupings:
+                runrow = (runfile, runstart, NONE, 0, runauthor)
+                _addrun(groups[tuple(runrow[i] for i in indexes)], runfile, runstart, runend)
+
+    if tables is None:
+        tables = Tables()
+    filenames, names = tables.filenames.strings, tables.authors.strings
+    strings = {
+        'filename': lambda fileid: filenames[fileid],
+        'bugtype': lambda bugtypeid: None if bugtypeid == NONE else tables.bugtypes.strings[bugtypeid],
+        'severity': lambda severity: SEVERITIES[severity],
+        'author': lambda authorid: None if authorid == NONE else names[authorid],
+    }
+    for stats in itertools.chain(authors.itervalues(), *(groups.itervalues() for _, groups in groupings)):
+        stats['lines'] = dict((filenames[fileid], lines) for fileid, lines in stats['lines'].iteritems())
+        stats['files'] = set(filenames[fileid] for fileid in stats['files'])
+    authors = defaultdict(blamethrower.stats._newauthor, ((strings['author'](authorid), stats) for authorid, stats in authors.iteritems()))
+    groupings = [(fields, defaultdict(blamethrower.stats._newauthor, ((tuple(strings[field](id_) for field, id_ in itertools.izip(fields, key)), stats)
+                                                                      for key, stats in groups.iteritems())))
+                 for fields, (_, groups) in itertools.izip(blamethrower.stats._groupings(groupby, directories), groupings)]
+    return blamethrower.stats._partial(authors, groupby, groupings)
+
+
+def _addrun(stats, fileid, start, end):
+    """Add the lines of file `fileid` from `start` up to `end` to `stats`."""
+    stats['lines'][fileid].add_run(start, end - start)
+    stats['files'].add(fileid)
+
+
+def _addbug(stats, fileid, linenum, severity):
+    """Add a bug of severity code `severity` on line `linenum` of file `fileid` to `stats`."""
+    stats['lines'][fileid].add(linenum)
+    stats['bugs'][SEVERITIES[severity] or 'total'] += 1
+    stats['files'].add(fileid)
@@ -0,0 +1,281 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Read gzip, bzip2, or xz compressed input as if it weren't.
+
+:func:`openfile` recognizes compressed files by their first few bytes, not
+their names, and returns a :class:`BackgroundReader` for them: a file-like
+object that decompresses in a background thread, a bounded number of blocks
+ahead of whoever is reading, so decompression overlaps with parsing.  (zlib,
+bz2, and lzma release the GIL while they work.)  Other files are just opened.
+
+xz needs the :mod:`lzma` module (Python 3.3+, or ``backports.lzma``).
+"""
+
+from __future__ import absolute_import
+import os
+import sys
+import zlib
+import bz2
+import itertools
+import threading
+import Queue
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+__all__ = ['openfile', 'detect', 'BackgroundReader']
+
+#: Leading bytes of each compressed format.
+MAGIC = (
+    ('gzip', '\x1f\x8b'),
+    ('bzip2', 'BZh'),
+    ('xz', '\xfd7zXZ\x00'),
+)
+
+_DECOMPRESSORS = {
+    'gzip': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    'bzip2': bz2.BZ2Decompressor,
+    'xz': lambda: lzma.LZMADecompressor(),
+}
+
+_BLOCKSIZE = 1 << 18            # Compressed bytes read at a time
+_READAHEAD = 16                 # Decompressed blocks to buffer
+
+
+def detect(data):
+    """:Return: the name of the compression format of a file starting with string `data`, or `None`."""
+    for name, magic in MAGIC:
+        if data.startswith(magic):
+            return name
+    return None
+
+
+def _ended(decompressor):
+    """:Return: whether `decompressor` has seen the end of its stream.
+
+    A finished bz2 or lzma decompressor raises :exc:`EOFError` given more data, and
+    a finished zlib one sets it aside in ``unused_data``.
+    """
+    try:
+        decompressor.decompress('\0')
+    except EOFError:
+        return True
+    except Exception:           # pylint: disable=W0703
+        return False            # Not valid data for the middle of a stream, either
+    return bool(getattr(decompressor, 'unused_data', ''))
+
+
+def openfile(filename, mode='rU'):
+    """:Return: an open-for-reading file object for `filename`, decompressing it if
+    need be; ``'-'`` is standard input.
+
+    Only regular files are checked for compression, since checking a pipe
+    would consume its first bytes.
+    :raises IOError: if the file can't be opened, or is compressed in a format we can't read.
+    """
+    if filename == '-':
+        return sys.stdin
+    if os.path.isfile(filename):
+        with open(filename, 'rb') as infile:
+            format_ = detect(infile.read(8))
+        if format_:
+            if format_ == 'xz' and lzma is None:
+                raise IOError(0, 'xz compressed, but no lzma module is installed', filename)
+            return BackgroundReader(open(filename, 'rb'), format_, universal='U' in mode)
+    return open(filename, mode)
+
+
+class BackgroundReader(object):
+    """A read-only file-like object of the decompressed contents of a compressed file.
+
+    The decompressing thread starts on the first read, so a reader can be
+    handed to a forked process (as by :mod:`blamethrower.parallel`) before it's used.
+    """
+    def __init__(self, rawfile, format_, universal=True, readahead=_READAHEAD):
+        """:param file rawfile: The compressed file, opened in binary mode.
+        :param str format_: Its compression format, as from :func:`detect`.
+        :param bool universal: Translate ``\\r\\n`` and ``\\r`` line endings to ``\\n``, like mode ``'rU'``.
+        :param int readahead: Decompress at most this many blocks ahead of the reader.
+        """
+        self.name = rawfile.name
+        self.format = format_
+        self._rawfile = rawfile
+        self._universal = universal
+        self._blocks = Queue.Queue(readahead)
+        self._thread = None
+        self._closed = threading.Event()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._lines = None          # The iterator over lines
+
+    def _decompress(self):
+        """Thread body: put decompressed blocks on the queue, then `None`, or the exception if something goes wrong."""
+        try:
+            decompressor = _DECOMPRESSORS[self.format]()
+            carry = ''              # A trailing \r, which might be half of a \r\n
+            while not self._closed.is_set():
+                data = self._rawfile.read(_BLOCKSIZE)
+                if not data:
+                    if not _ended(decompressor):
+                        raise EOFError('compressed data ended before the end of the stream; is the file truncated?')
+                    break
+                block = ''
+                # Concatenated streams (as from `cat a.gz b.gz`) each need a new decompressor.
+                while True:
+                    try:
+                        block += decompressor.decompress(data)
+                    except EOFError:        # bz2 or xz: the last stream ended with the last block
+                        decompressor = _DECOMPRESSORS[self.format]()
+                        continue
+                    data = getattr(decompressor, 'unused_data', '')
+                    if not data.strip('\0'):        # gzip may be padded with zeros
+                        break
+                    decompressor = _DECOMPRESSORS[self.format]()
+                if self._universal:
+                    block = carry + block
+                    carry = '\r' if block.endswith('\r') else ''
+                    block = block[:len(block) - len(carry)].replace('\r\n', '\n').replace('\r', '\n')
+                if block:
+                    self._put(block)
+            if carry:
+                self._put('\n')
+            self._put(None)
+        except Exception as err:        # pylint: disable=W0703
+            self._put(err)
+
+    def _put(self, item):
+        """Put `item` on the queue, unless the reader is closed first."""
+        while not self._closed.is_set():
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def _nextblock(self):
+        """:Return: the next decompressed block, or `None` at the end of the file.
+
+        :raises IOError: If the data can't be decompressed.
+        """
+        if self._eof:
+            return None
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._decompress, name='decompress ' + self.name)
+            self._thread.daemon = True
+            self._thread.start()
+        block = self._blocks.get()
+        if block is None:
+            self._eof = True
+            return None
+        if isinstance(block, Exception):
+            self._eof = True
+            raise IOError(0, 'Error decompressing {0} data: {1}'.format(self.format, block), self.name)
+        return block
+
+    def _fill(self):
+        """Add the next decompressed block to the buffer.
+
+        :Return: `False` at the end of the file.
+        """
+        block = self._nextblock()
+        if block is None:
+            return False
+        self._buf = self._buf[self._pos:] + block
+        self._pos = 0
+        return True
+
+    def read(self, size=-1):
+        """:Return: up to `size` bytes, or everything left if `size` is negative."""
+        if 0 <= size <= len(self._buf) - self._pos:
+            data = self._buf[self._pos:self._pos + size]
+            self._pos += size
+            return data
+        # Join the blocks once, rather than growing the buffer a block at a time.
+        blocks = [self._buf[self._pos:]]
+        numbytes = len(blocks[0])
+        while size < 0 or numbytes < size:
+            block = self._nextblock()
+            if block is None:
+                break
+            blocks.append(block)
+            numbytes += len(block)
+        data = ''.join(blocks)
+        if 0 <= size < len(data):
+            self._buf, self._pos = data, size
+            return data[:size]
+        self._buf, self._pos = '', 0
+        return data
+
+    def readline(self):
+        """:Return: the next line, including its newline, or ``''`` at the end of the file."""
+        end = self._buf.find('\n', self._pos)
+        while end < 0:
+            start = len(self._buf) - self._pos
+            if not self._fill():
+                end = len(self._buf) - 1
+                break
+            end = self._buf.find('\n', start)
+        line = self._buf[self._pos:end + 1]
+        self._pos = end + 1
+        return line
+
+    def readlines(self):
+        """:Return: a list of all the remaining lines."""
+        return list(self)
+
+    def __iter__(self):
+        """:Return: an iterator over the remaining lines.  As with a file, don't mix iterating with other reads."""
+        if self._lines is None:
+            self._lines = self._iterlines()
+        return self._lines
+
+    def next(self):
+        """:Return: the next line."""
+        return next(iter(self))
+
+    def _iterlines(self):
+        """:Return: an iterator over the remaining lines, much faster than calling :meth:`readline`."""
+        while True:
+            end = self._buf.rfind('\n', self._pos)
+            if end >= 0:
+                block, self._pos = self._buf[self._pos:end + 1], end + 1
+                if self._universal:         # No \r left to split on
+                    lines = block.splitlines(True)
+                else:
+                    lines = block.split('\n')
+                    lines = [line + '\n' for line in itertools.islice(lines, len(lines) - 1)]
+                for line in lines:
+                    yield line
+            if not self._fill():
+                break
+        if self._pos < len(self._buf):
+            yield self._buf[self._pos:]
+            self._pos = len(self._buf)
+
+    def close(self):
+        """Stop decompressing, and close the compressed file."""
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._rawfile.close()
+        self._eof = True
+        self._buf, self._pos = '', 0
+
+    @property
+    def closed(self):
+        """Whether the reader has been closed."""
+        return self._closed.is_set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
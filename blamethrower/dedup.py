@@ -0,0 +1,88 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Drop duplicate bugs.
+
+Some analyzers (FindBugs, for one) report the same bug more than once, and
+overlapping reports (per-module reports plus an aggregate one, say) repeat each
+other's bugs.  :func:`dedup` passes on only the first bug with each filename,
+line number, and bug type.
+
+It remembers the bugs it has seen in a set of their 64-bit hashes, which takes
+about half the memory of a set of the bugs themselves.  Two different bugs with
+the same hash would lose one of them, but with a billion bugs the odds of that
+are about 1 in 40.  The memory budget is a number of hashes: the set takes up
+to three quarters of it and then stops growing, and the rest of the bugs are
+sorted externally (see :mod:`blamethrower.extsort`) with whatever is left of the
+budget as the sort buffer, so duplicates among them are adjacent, and they're
+checked against the set as they come out.  So memory stays within the budget,
+but those bugs come out in sorted order rather than as they came in, which
+:func:`blamethrower.merge` doesn't mind.
+"""
+
+import itertools
+import operator
+import sys
+import warnings
+
+import blamethrower
+import blamethrower.extsort
+
+__all__ = ['dedup', 'DuplicateBugsWarning', 'DEFAULT_MAXKEYS']
+
+#: Default memory budget, in bug hashes: about 64 MB worth.
+DEFAULT_MAXKEYS = 1000000
+
+_key = operator.itemgetter(0, 1, 2)     # filename, linenum, bugtype
+_SORTRATIO = 4          # A bug takes about this many times the memory of its hash
+
+if sys.maxsize > 2 ** 32:
+    _hash = hash
+else:
+    def _hash(key):
+        """:Return: a 64-bit hash of tuple `key`, since :func:`hash` only gives 32 bits here."""
+        return hash(key) << 32 ^ hash(key[::-1])
+
+
+class DuplicateBugsWarning(Warning):
+    """Warning indicating that duplicate bugs were dropped."""
+    def __init__(self, numdups):
+        """:param int numdups: The number of duplicate bugs dropped."""
+        super(DuplicateBugsWarning, self).__init__("{0} duplicate bugs dropped".format(numdups))
+        self.numdups = numdups
+
+
+def dedup(bugs, maxkeys=DEFAULT_MAXKEYS):
+    """:Return: an iterator over `bugs` with only the first of any with the same filename,
+    line number, and bug type.
+
+    :param iter(Analyne) bugs: Bugs, as from :func:`blamethrower.getbugs`.
+    :param int maxkeys: The memory budget, in bug hashes: remember at most this many bugs,
+      less the sort buffer, and sort the rest with temporary files.
+    :raises DuplicateBugsWarning: If any duplicates were dropped.
+    """
+    seen = set()
+    maxseen = max(maxkeys - maxkeys // _SORTRATIO, 1)      # The rest of the budget is for sorting.
+    numdups = 0
+    bugs = iter(bugs)
+    for bug in bugs:
+        keyhash = _hash(_key(bug))
+        if keyhash in seen:
+            numdups += 1
+            continue
+        seen.add(keyhash)
+        yield bug
+        if len(seen) >= maxseen:
+            break
+    # Anything left is more than fits in memory.  Plain tuples pickle much faster than namedtuples.
+    sortsize = max((maxkeys - len(seen)) // _SORTRATIO, 1)
+    rest = blamethrower.extsort.sort(itertools.imap(tuple, bugs), _key, sortsize)
+    for key, dups in itertools.groupby(rest, _key):
+        if _hash(key) in seen:
+            numdups += sum(1 for _ in dups)
+            continue
+        yield blamethrower.Analyne._make(next(dups))
+        numdups += sum(1 for _ in dups)
+    if numdups:
+        warnings.warn(DuplicateBugsWarning(numdups), stacklevel=2)
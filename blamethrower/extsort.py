@@ -0,0 +1,108 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+External sorting, for when there is more to sort than fits in memory.
+
+Items are sorted in memory in batches of bounded size.  Each full batch is
+pickled to the end of one temporary file, and the sorted batches are then
+merged back together lazily, so only one chunk of each batch is in memory at a
+time.  Batches are read from their offsets in the file, so however many there
+are, only one file is open.  Merging more than :data:`FANIN` batches at once
+would hold too many chunks in memory, so they are first merged in passes, up to
+:data:`FANIN` at a time, into a new file with fewer, longer batches.
+"""
+
+import heapq
+import itertools
+import tempfile
+import cPickle as pickle
+
+__all__ = ['sort', 'FANIN']
+
+#: Most batches to merge at once.
+FANIN = 256
+_CHUNK = 1000       # Number of items to pickle at a time
+
+
+def _spill(items, tmp):
+    """Pickle `items` to the end of temporary file `tmp`.
+
+    :Return: the ``(start, end)`` offsets of the pickles.
+    """
+    start = tmp.tell()
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, _CHUNK))
+        if not chunk:
+            break
+        pickle.dump(chunk, tmp, pickle.HIGHEST_PROTOCOL)
+    return start, tmp.tell()
+
+
+def _unspill(tmp, start, end):
+    """:Return: an iterator over the items pickled in temporary file `tmp` from offset `start` to `end`.
+
+    Seeks before every chunk, so any number of these can read the same file at once.
+    """
+    while start < end:
+        tmp.seek(start)
+        chunk = pickle.load(tmp)
+        start = tmp.tell()
+        for item in chunk:
+            yield item
+
+
+def _decorate(items, runnum, key):
+    """:Return: an iterator of ``(key(item), runnum, itemnum, item)`` for `items`, so that
+    merging never compares items themselves, and ties keep their original order."""
+    for itemnum, item in enumerate(items):
+        yield key(item), runnum, itemnum, item
+
+
+def _merge(runs, key):
+    """:Return: an iterator over the items of sorted iterables `runs`, merged by `key`;
+    ties come out in the order of `runs`."""
+    return (item for _, _, _, item in heapq.merge(*[_decorate(run, runnum, key) for runnum, run in enumerate(runs)]))
+
+
+def _merged(tmp, spilled, batch, key):
+    """:Return: an iterator over the merged batches at offsets `spilled` in `tmp` and
+    in-memory `batch`, closing `tmp` when done."""
+    try:
+        for item in _merge([_unspill(tmp, start, end) for start, end in spilled] + [batch], key):
+            yield item
+    finally:
+        tmp.close()
+
+
+def sort(items, key, maxsize, sizeof=None):
+    """:Return: an iterator over `items`, stably sorted by `key`.
+
+    :param func key: Function giving the sort key of an item.
+    :param int maxsize: Sort in memory until the batch reaches this size, then
+      spill it to a temporary file and start another.
+    :param func sizeof: Function giving the size of an item; each item counts as 1 by default.
+    """
+    tmp = None
+    spilled = []
+    batch, size = [], 0
+    for item in items:
+        batch.append(item)
+        size += sizeof(item) if sizeof else 1
+        if size >= maxsize:
+            batch.sort(key=key)
+            if tmp is None:
+                tmp = tempfile.TemporaryFile(prefix='blamethrower.')
+            spilled.append(_spill(batch, tmp))
+            batch, size = [], 0
+    batch.sort(key=key)
+    if not spilled:
+        return iter(batch)
+    while len(spilled) >= FANIN:        # Leave room for the batch in memory
+        merged = tempfile.TemporaryFile(prefix='blamethrower.')
+        spilled = [_spill(_merge([_unspill(tmp, start, end) for start, end in spilled[i:i + FANIN]], key), merged)
+                   for i in xrange(0, len(spilled), FANIN)]
+        tmp.close()
+        tmp = merged
+    return _merged(tmp, spilled, batch, key)
@@ -0,0 +1,177 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Measure where the time goes in a BlameThrower run.
+
+BlameThrower is a pipeline of lazy iterators: stats pull analynes from merge,
+which pulls bugs and blame from the parsers.  So a :class:`Profiler` meters
+each iterator (or block of code) as a named stage, and charges each stage only
+for the time spent in it, not in the stages it pulls from.  For each stage it
+records wall and CPU seconds, items processed, items per second, and the peak
+RSS of the process when the stage finished.
+
+Optionally, each stage also gets its own :mod:`cProfile` profile, written to
+``<stage>.prof`` in a directory when the stage finishes.
+
+Metering costs a few microseconds per item, so only profile when you need to.
+:class:`NullProfiler` has the same interface and does nothing.
+"""
+
+from __future__ import division
+from contextlib import contextmanager
+import cProfile
+import os
+import re
+import resource
+import sys
+import time
+
+__all__ = ['Profiler', 'NullProfiler']
+
+# ru_maxrss is in KiB on Linux, but bytes on OS X.
+_MAXRSS_PER_MB = 2.0 ** 20 if sys.platform == 'darwin' else 2.0 ** 10
+
+
+def _maxrss_mb():
+    """:Return: the peak RSS of this process so far, in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / _MAXRSS_PER_MB
+
+
+class _Stage(object):
+    """The measurements of one stage."""
+    __slots__ = ('name', 'wall', 'cpu', 'childwall', 'childcpu', 'items', 'maxrss_mb', 'profile')
+
+    def __init__(self, name, profile=None):
+        self.name = name
+        self.wall = self.cpu = self.childwall = self.childcpu = 0.0
+        self.items = None
+        self.maxrss_mb = None
+        self.profile = profile
+
+    def result(self):
+        """:Return: a dict of the measurements of this stage, not counting time in other stages."""
+        wall, cpu = self.wall - self.childwall, self.cpu - self.childcpu
+        return {
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'items': self.items,
+            'items_per_sec': self.items / wall if self.items is not None and wall > 0 else None,
+            'maxrss_mb': self.maxrss_mb if self.maxrss_mb is not None else _maxrss_mb(),
+        }
+
+
+class Profiler(object):
+    """Measures named stages of a run."""
+    def __init__(self, cprofiledir=None):
+        """:param str cprofiledir: If given, write a :mod:`cProfile` profile of each stage to this directory."""
+        self.cprofiledir = cprofiledir
+        self._stages = {}
+        self._order = []            # Stage names, in order of first use
+        self._stack = []            # (stage, start wall time, start CPU time) of stages we're in
+
+    def _getstage(self, name):
+        """:Return: the :class:`_Stage` named `name`, creating it if need be."""
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _Stage(name, cProfile.Profile() if self.cprofiledir else None)
+            self._order.append(name)
+        return stage
+
+    def _enter(self, stage):
+        """Start charging time to `stage`."""
+        if stage.profile:
+            if self._stack and self._stack[-1][0].profile:
+                self._stack[-1][0].profile.disable()
+            stage.profile.enable()
+        self._stack.append((stage, time.time(), time.clock()))
+
+    def _exit(self):
+        """Stop charging time to the current stage, and go back to the one before."""
+        stage, wall, cpu = self._stack.pop()
+        wall, cpu = time.time() - wall, time.clock() - cpu
+        stage.wall += wall
+        stage.cpu += cpu
+        if stage.profile:
+            stage.profile.disable()
+        if self._stack:
+            parent = self._stack[-1][0]
+            parent.childwall += wall
+            parent.childcpu += cpu
+            if parent.profile:
+                parent.profile.enable()
+
+    def _finish(self, stage):
+        """Record the end of `stage`."""
+        stage.maxrss_mb = _maxrss_mb()
+        if stage.profile:
+            stage.profile.dump_stats(os.path.join(self.cprofiledir, re.sub(r'[^\w.-]+', '_', stage.name) + '.prof'))
+
+    def iter(self, name, iterable, size=None):
+        """:Return: an iterator over `iterable`, metered as stage `name`.
+
+        :param func size: Function giving the number of items an item counts as; 1 by default.
+        """
+        stage = self._getstage(name)
+        stage.items = stage.items or 0
+        iterator = iter(iterable)
+        while True:
+            self._enter(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._exit()
+                self._finish(stage)
+                return
+            except:
+                self._exit()
+                raise
+            self._exit()
+            stage.items += size(item) if size else 1
+            yield item
+
+    @contextmanager
+    def stage(self, name):
+        """Meter the code in a ``with`` block as stage `name`.
+
+        Yields a function to call with the number of items processed, if known.
+        """
+        stage = self._getstage(name)
+
+        def setitems(items):
+            """Record that the stage processed `items` items."""
+            stage.items = items
+
+        self._enter(stage)
+        try:
+            yield setitems
+        finally:
+            self._exit()
+            self._finish(stage)
+
+    def results(self):
+        """:Return: a list of dicts of the measurements of each stage so far, in order of first use."""
+        results = []
+        for name in self._order:
+            result = self._stages[name].result()
+            result['stage'] = name
+            results.append(result)
+        return results
+
+
+class NullProfiler(object):
+    """A :class:`Profiler` that doesn't measure anything."""
+    cprofiledir = None
+
+    def iter(self, name, iterable, size=None):        # pylint: disable=W0613
+        """:Return: `iterable`."""
+        return iterable
+
+    @contextmanager
+    def stage(self, name):          # pylint: disable=W0613
+        """Run the code in a ``with`` block."""
+        yield lambda items: None
+
+    def results(self):
+        """:Return: an empty list."""
+        return []
@@ -0,0 +1,161 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Parse bug and blame input files in parallel worker processes.
+
+Each input file is read and parsed by one worker, and results come back in the
+order the inputs were given, so anything downstream sees exactly what it would
+see reading the inputs one after the other.
+
+:func:`parse_chunks` instead splits one big input file into chunks at the
+header lines that start each source file, and parses the chunks in parallel.
+
+Workers inherit the already-open input files from the parent process, so this
+relies on :mod:`multiprocessing` forking its workers (i.e., a POSIX OS).
+"""
+
+from collections import deque
+import itertools
+import mmap
+import multiprocessing
+
+import blamethrower
+
+__all__ = ['parse', 'parse_chunks']
+
+# The open input files of the current pool, set in each worker as it starts.
+_inputs = []
+# The memory-mapped file and parse function of the current chunk pool.
+_chunked = []
+
+_MINCHUNK = 1 << 20         # Bytes; smaller chunks aren't worth sending to a worker
+_MAXCHUNK = 64 << 20        # Bytes; bigger chunks make for big results to send back
+
+
+def _init_worker(inputs):
+    """Pool initializer: remember the list of ``(func, name, file, options)`` `inputs`."""
+    _inputs[:] = inputs
+
+
+def _parse_input(index):
+    """:Return: a list of everything parsed from input number `index`."""
+    func, name, infile, options = _inputs[index]
+    return list(func(name, infile, **options))
+
+
+class _OrderedResults(object):
+    """Hand out results from an ordered iterator by index, buffering any
+    that are asked for out of order."""
+    def __init__(self, results):
+        self._results = enumerate(results)
+        self._waiting = {}
+
+    def pop(self, index):
+        """:Return: result number `index`; each result can only be popped once."""
+        while index not in self._waiting:
+            i, result = next(self._results)
+            self._waiting[i] = result
+        return self._waiting.pop(index)
+
+
+def parse(bugsfiles=(), blamefiles=(), jobs=None, runs=False):
+    """Parse all `bugsfiles` and `blamefiles` in a pool of `jobs` worker processes.
+
+    :Return: a ``(bugs, blame)`` pair of iterators, giving the same output as
+      chaining :func:`blamethrower.getbugs` over `bugsfiles` and
+      :func:`blamethrower.getblame` (or :func:`blamethrower.getblameruns`, if
+      `runs` is true) over `blamefiles`, respectively.
+    :param bugsfiles: ``(analyzer_name, bugsfile, options)`` triples.
+    :param blamefiles: ``(repo_name, blamefile, options)`` triples.
+    :param int jobs: The number of worker processes; defaults to the number of CPUs.
+    :param bool runs: Return blame as :class:`blamethrower.runs.BlameRuns`.
+    :rtype: (iter(Analyne), iter((str, list(str))))
+    """
+    getblame = blamethrower.getblameruns if runs else blamethrower.getblame
+    inputs = [(blamethrower.getbugs, name, infile, options) for name, infile, options in bugsfiles]
+    inputs += [(getblame, name, infile, options) for name, infile, options in blamefiles]
+    if not inputs:
+        return iter([]), iter([])
+
+    pool = multiprocessing.Pool(min(jobs or multiprocessing.cpu_count(), len(inputs)), _init_worker, (inputs,))
+    results = _OrderedResults(pool.imap(_parse_input, xrange(len(inputs))))
+    pool.close()        # Workers exit once all inputs are parsed.
+
+    numbugsfiles = len(bugsfiles)
+    bugs = itertools.chain.from_iterable(results.pop(i) for i in xrange(numbugsfiles))
+    blame = itertools.chain.from_iterable(results.pop(i) for i in xrange(numbugsfiles, len(inputs)))
+    return bugs, blame
+
+
+def split(buf, header, numchunks):
+    """:Return: a list of ``(start, end)`` offsets dividing `buf` into about `numchunks`
+    chunks of similar size, each starting at the beginning of the buffer or
+    at a line that starts with `header`."""
+    starts = [0]
+    for i in xrange(1, numchunks):
+        start = buf.find('\n' + header, max(len(buf) * i // numchunks, starts[-1] + 1) - 1)
+        if start < 0:
+            break
+        starts.append(start + 1)
+    return zip(starts, starts[1:] + [len(buf)])
+
+
+def _readlines(buf, start, end):
+    """:Return: an iterator over the lines of memory map `buf` from offset `start` to `end`."""
+    buf.seek(start)
+    readline = buf.readline
+    while buf.tell() < end:
+        yield readline()
+
+
+def _init_chunk_worker(buf, parse):
+    """Pool initializer: remember memory map `buf` and function `parse`."""
+    _chunked[:] = [buf, parse]
+
+
+def _parse_chunk(start_end):
+    """:Return: a list of everything parsed from the chunk of the memory map from offset `start` to `end`."""
+    buf, parse = _chunked
+    return list(parse(_readlines(buf, *start_end)))
+
+
+def parse_chunks(infile, header, parse, jobs=None):
+    """Parse `infile` in chunks in a pool of `jobs` worker processes.
+
+    The file is memory-mapped and split into chunks at lines starting with
+    `header`, which must start the output for each source file.  If `infile`
+    can't be memory-mapped, is small, or we're already in a worker process, it
+    is parsed right here instead.
+    :Return: an iterator over everything parsed from `infile`, in order.
+    :param func parse: Function of an iterator of lines returning an iterable of
+      results; it is inherited by workers, so it need not be picklable.
+    :param int jobs: The number of worker processes; defaults to the number of CPUs.
+    """
+    jobs = jobs or multiprocessing.cpu_count()
+    try:
+        buf = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, EnvironmentError, ValueError):      # Not a file, or empty
+        buf = None
+    if buf is None or jobs < 2 or len(buf) < 2 * _MINCHUNK or multiprocessing.current_process().daemon:
+        for result in parse(infile):
+            yield result
+        return
+
+    chunksize = min(max(len(buf) // (jobs * 4), _MINCHUNK), _MAXCHUNK)
+    chunks = iter(split(buf, header, -(-len(buf) // chunksize)))
+    pool = multiprocessing.Pool(jobs, _init_chunk_worker, (buf, parse))
+    try:
+        # Keep a few chunks per worker in flight, so results don't pile up faster than they're used.
+        pending = deque(pool.apply_async(_parse_chunk, (chunk,)) for chunk in itertools.islice(chunks, 2 * jobs))
+        while pending:
+            results = pending.popleft().get()
+            chunk = next(chunks, None)
+            if chunk:
+                pending.append(pool.apply_async(_parse_chunk, (chunk,)))
+            for result in results:
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        buf.close()
@@ -6,13 +6,25 @@
 
 __all__ = ['git', 'hg']
 
+#: The ``HELP`` and ``OPTIONS`` of each reporeader, so the command line can offer
+#: them without importing every reporeader.  Keep in sync with the modules (the tests check).
+MANIFEST = {
+    'git': {'help': 'git blame -p with headers; see bin/git-blame.sh', 'options': {'jobs': 'parse a large git blame file in N processes'}},
+    'hg': {'help': 'hg blame with headers; see bin/hg-blame.sh', 'options': {'jobs': 'parse a large hg blame file in N processes'}},
+}
+
+from blamethrower.runs import BlameRuns
+
 if __debug__:
     def _check_reporeader_output(files_authors):
-        """Validate the output from a reporeader `analyze` function and pass it through."""
+        """Validate the output from a reporeader `read` or `read_runs` function and pass it through."""
         for filename, authorlist in files_authors:
             assert filename
-            assert authorlist and authorlist[0] is None
-            assert not any(author is None for author in authorlist[1:])
+            if isinstance(authorlist, BlameRuns):
+                assert not any(authorlist.authors[author_id] is None for _, _, author_id in authorlist)
+            else:
+                assert authorlist and authorlist[0] is None
+                assert not any(author is None for author in authorlist[1:])
             yield filename, authorlist
 else:
     # Yes, I timed it and this really is faster, even with -O.
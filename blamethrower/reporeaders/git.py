@@ -13,59 +13,191 @@ before a file rename use the old name; the only way to get accurate commit
 attribution is to add a header with the filename before the output for each
 file.  Thus, we rely on a helper script to add headers.
 See `bin/git-blame.sh`.
+
+Porcelain gives each commit's metadata (author, date, and so on) only the first
+time the commit appears in a file, so a big repo repeats it thousands of times.
+We keep one :class:`CommitTable` for a whole blame file instead of one per
+file, and number its commits; :func:`read_commits` gives each line's commit as
+one of those numbers, and the table has the author, author email, and author
+time of each.
 """
 
 import re
+import itertools
+from array import array
+from collections import namedtuple
 
 from blamethrower import itergroup
+from blamethrower.runs import StringTable, BlameRuns, reintern
 
-__all__ = ['read', 'HELP']
+__all__ = ['read', 'read_runs', 'read_commits', 'get_authors', 'get_commits', 'CommitTable', 'Commit', 'HELP', 'OPTIONS']
 HELP = 'git blame -p with headers; see bin/git-blame.sh'
+OPTIONS = {'jobs': 'parse a large git blame file in N processes'}
+GIT_HEADER = '>>> git-blame output for: '
 GIT_HEADER_RE = re.compile(r"^>>> git-blame output for: (?P<filename>.+) <<<$")
-# Skip empty files, for which git-blame arguably gives the incorrect line number 1
-GIT_PORCELAIN_RE = re.compile(r"""^(?P<commit>[0-9a-f]{40}) \d+ (?P<linenum>\d+)( [1-9][0-9]*)?
-(author (?P<author>.+)$)?""", re.MULTILINE)
+GIT_COMMIT_RE = re.compile(r"^(?P<commit>[0-9a-f]{40}) \d+ (?P<linenum>\d+)( [1-9][0-9]*)?$")
+
+
+Commit = namedtuple('Commit', 'sha author author_mail author_time')        # pylint: disable=C0103
+
+
+class CommitTable(object):
+    """The commits in git-blame output, numbered from 0 in order of first appearance,
+    with the author, author email, and author time (seconds since the epoch) of each."""
+    def __init__(self):
+        self.ids = {}
+        self.shas = []
+        self.authors = []
+        self.mails = []
+        self.times = array('l')
 
+    def getid(self, sha):
+        """:Return: the id of commit `sha`, adding it to the table with no metadata if it is new."""
+        id_ = self.ids.get(sha)
+        if id_ is None:
+            id_ = self.ids[sha] = len(self.shas)
+            self.shas.append(sha)
+            self.authors.append(None)
+            self.mails.append(None)
+            self.times.append(0)
+        return id_
 
-def get_authors(porcelain):
+    def __getitem__(self, id_):
+        """:Return: the :class:`Commit` with id `id_`."""
+        return Commit(self.shas[id_], self.authors[id_], self.mails[id_], self.times[id_])
+
+    def __len__(self):
+        return len(self.shas)
+
+
+def get_commits(porcelain, commits):
+    """:Return: an iterable of the id of the commit of each line of source code in
+    git-blame output, adding commits to :class:`CommitTable` `commits`.
+
+    Reads and yields one line at a time, so memory use does not grow with the
+    size of `porcelain`.  Each id comes out as soon as its commit's author is
+    known; the rest of a new commit's metadata is filled in as it is read.
+    :param iter(str) porcelain: The output from ``git blame --porcelain``
+      on one file.
+    :rtype: iter(int)
+    """
+    # Each source line gets a header line with its commit and line number, then
+    # the commit info (starting with the author) if this is the first time this
+    # file has seen the commit, then the source line itself, prefixed with a tab.
+    # We only read the info the first time the table sees the commit.
+    ids, authors, mails, times = commits.ids, commits.authors, commits.mails, commits.times
+    yield None      # "line 0" has no commit
+    expected_linenum = 0
+    commit = None       # Set only on the line after a header
+    newid = None        # The id of the new commit whose info we're reading, if any
+    for line in porcelain:
+        if commit:
+            id_ = ids.get(commit)
+            if id_ is None:
+                id_ = newid = commits.getid(commit)
+                if line.startswith('author '):
+                    authors[id_] = intern(line[7:].rstrip('\n'))       # Save some memory
+            assert authors[id_]
+            commit = None
+            yield id_
+            continue
+        if not line.startswith('\t'):
+            match = GIT_COMMIT_RE.match(line)
+            if match:
+                commit, linenum = match.group('commit', 'linenum')
+                newid = None
+                expected_linenum += 1
+                assert int(linenum) == expected_linenum, "Expected line number {0} in commit {1}; got {2}".format(expected_linenum, commit, linenum)
+            elif newid is not None:
+                if line.startswith('author-mail '):
+                    mails[newid] = intern(line[12:].rstrip('\n'))
+                elif line.startswith('author-time '):
+                    times[newid] = int(line[12:])
+    if commit:      # Output ended right after a header
+        id_ = commits.getid(commit)
+        assert authors[id_]
+        yield id_
+
+
+def get_authors(porcelain, commits=None):
     """:Return: an iterable of authors for each line of source code in git-blame output.
 
+    Reads and yields one line at a time, so memory use does not grow with the
+    size of `porcelain`.
     :param iter(str) porcelain: The output from ``git blame --porcelain``
       on one file.
+    :param CommitTable commits: The table to keep commits in, if they're to be
+      shared with other files; by default, a new one.
     :rtype: iter(str)
     """
-    commit2author = {}
+    if commits is None:
+        commits = CommitTable()
+    authors = commits.authors
+    ids = get_commits(porcelain, commits)
+    next(ids)
     yield None      # "line 0" has no author
-    for expected_linenum, match in enumerate(GIT_PORCELAIN_RE.finditer(''.join(porcelain)), 1):
-        linenum, author, commit = match.group('linenum', 'author', 'commit')
-        linenum = int(linenum)
-        if author is None:
-            author = commit2author.get(commit)
-            assert author
-        else:
-            author = intern(author)     # Save some memory
-            assert commit2author.get(commit) in (None, author)
-            commit2author[commit] = author
-        assert linenum == expected_linenum, "Expected line number {0} in commit {1}; got {2}".format(expected_linenum, commit, linenum)
-        yield author
-
-
-def read(blamefile):
-    """Iterate over source files described by git-blame output with headers.
+    for id_ in ids:
+        yield authors[id_]
 
-    :Return: An iterator of ``(filename, list(author))`` tuples, with ``list[i]``
-      being the author of line ``i`` in `filename`.
-    :rtype: iter((str, list(str)))
-    """
+
+def _sourcefiles(blamefile):
+    """:Return: an iterator of ``(filename, iter(str))`` pairs, giving the git-blame
+    output for each file in `blamefile`, which has headers."""
     def getfilename(line):
         """:Return: the filename from a header `line`, or `None` if `line` was not a header."""
         match = GIT_HEADER_RE.match(line)
         return match.group('filename') if match else None
 
-    # This doesn't use REs so we can stream the file, since a multi-line RE
-    # would require reading in the whole file, or stitching chunks.
+    # This doesn't use multi-line REs so we can stream the file.
     for sourcefile in itergroup(blamefile, getfilename):
         filename = getfilename(next(sourcefile))
         if not filename:
             raise ValueError("Did not find header as first line of git blame output")
-        yield filename, list(get_authors(sourcefile))
+        yield filename, sourcefile
+
+
+def read(blamefile, jobs=None):
+    """Iterate over source files described by git-blame output with headers.
+
+    :Return: An iterator of ``(filename, list(author))`` tuples, with ``list[i]``
+      being the author of line ``i`` in `filename`.
+    :param int jobs: Split `blamefile` into chunks and parse them in this many processes;
+      see :func:`blamethrower.parallel.parse_chunks`.
+    :rtype: iter((str, list(str)))
+    """
+    if jobs:
+        from blamethrower.parallel import parse_chunks      # Only when asked for; multiprocessing is slow to import.
+        return parse_chunks(blamefile, GIT_HEADER, read, int(jobs))
+    commits = CommitTable()
+    return ((filename, list(get_authors(sourcefile, commits))) for filename, sourcefile in _sourcefiles(blamefile))
+
+
+def read_runs(blamefile, authors, jobs=None):
+    """Iterate over source files described by git-blame output with headers.
+
+    :Return: An iterator of ``(filename, BlameRuns)`` tuples.
+    :param StringTable authors: The table to intern author names in.
+    :param int jobs: As for :func:`read`.
+    :rtype: iter((str, BlameRuns))
+    """
+    if jobs:
+        from blamethrower.parallel import parse_chunks
+        chunks = parse_chunks(blamefile, GIT_HEADER, lambda lines: read_runs(lines, StringTable()), int(jobs))
+        return reintern(chunks, authors)
+    commits = CommitTable()
+    return ((filename, BlameRuns.fromauthors(get_authors(sourcefile, commits), authors)) for filename, sourcefile in _sourcefiles(blamefile))
+
+
+def read_commits(blamefile, commits):
+    """Iterate over source files described by git-blame output with headers.
+
+    :Return: An iterator of ``(filename, array(int))`` tuples, with ``array[i]``
+      being the id in `commits` of the commit of line ``i`` in `filename`;
+      ``array[0]`` is -1.
+    :param CommitTable commits: The table to add commits to.
+    :rtype: iter((str, array))
+    """
+    for filename, sourcefile in _sourcefiles(blamefile):
+        ids = get_commits(sourcefile, commits)
+        next(ids)
+        yield filename, array('l', itertools.chain((-1,), ids))
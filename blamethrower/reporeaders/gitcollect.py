@@ -0,0 +1,188 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Collect line authorship straight from a git repository.
+
+This does the job of `bin/git-blame.sh` without the shell or an intermediate
+file: list the files in a commit with ``git ls-tree``, run ``git blame
+--porcelain`` on each in a bounded pool of threads, and parse each one's output
+with :func:`blamethrower.reporeaders.git.get_authors` as it streams in.  The
+threads mostly wait on ``git``, so they get along fine with the GIL.
+
+Since git is given the commit to blame, renames are no problem and no headers
+are needed.
+"""
+
+from collections import deque
+import itertools
+import subprocess
+import tempfile
+import threading
+import warnings
+from multiprocessing.pool import ThreadPool
+
+from blamethrower.reporeaders import git
+from blamethrower.runs import BlameRuns
+
+__all__ = ['collect', 'collect_runs', 'listfiles', 'listblobs', 'blame', 'BlameTimeoutWarning']
+
+GIT = 'git'
+#: Options given to ``git blame``, as in `bin/git-blame.sh`: ignore whitespace and detect moved lines.
+BLAME_OPTIONS = ('-w', '-C')
+
+
+class BlameTimeoutWarning(Warning):
+    """Warning indicating that ``git blame`` took too long on a file, which was skipped."""
+    def __init__(self, filename, timeout):
+        super(BlameTimeoutWarning, self).__init__("git blame timed out after {0} seconds on '{1}'; skipped it".format(timeout, filename))
+        self.filename = filename
+        self.timeout = timeout
+
+
+def _failed(returncode, cmd, err):
+    """:Return: a :exc:`subprocess.CalledProcessError` for command `cmd`, with its stderr `err` as the ``output``."""
+    error = subprocess.CalledProcessError(returncode, ' '.join(cmd))
+    error.output = err          # Not a constructor argument until Python 2.7
+    return error
+
+
+def _git(repo, *args):
+    """:Return: the output of running ``git`` with `args` in `repo`.
+
+    :raises subprocess.CalledProcessError: If git fails.
+    """
+    cmd = (GIT,) + args
+    proc = subprocess.Popen(cmd, cwd=repo, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    if proc.returncode:
+        raise _failed(proc.returncode, cmd, err)
+    return out
+
+
+def listblobs(repo, rev='HEAD'):
+    """:Return: a list of ``(filename, blob id)`` pairs for all files in commit `rev` of git repo `repo`.
+
+    Submodules are left out, since there's nothing to blame in them here.
+    """
+    blobs = []
+    for entry in _git(repo, 'ls-tree', '-rz', '--full-tree', rev).split('\0'):
+        info, _, filename = entry.partition('\t')
+        info = info.split(' ')
+        if info[1:2] == ['blob']:
+            blobs.append((filename, info[2]))
+    return blobs
+
+
+def listfiles(repo, rev='HEAD'):
+    """:Return: a list of the names of all files in commit `rev` of git repo `repo`."""
+    return [filename for filename, _ in listblobs(repo, rev)]
+
+
+def blame(repo, filename, rev='HEAD', timeout=None):
+    """:Return: the list of authors of each line of `filename` in commit `rev` of git repo `repo`,
+    as from :func:`blamethrower.reporeaders.git.read`, or `None` if ``git blame`` ran
+    for more than `timeout` seconds.
+
+    :raises subprocess.CalledProcessError: If git fails.
+    """
+    cmd = (GIT, 'blame', '--porcelain') + BLAME_OPTIONS + (rev, '--', filename)
+    errfile = tempfile.TemporaryFile(prefix='blamethrower.')        # Not a pipe, which could fill up while we read stdout.
+    proc = subprocess.Popen(cmd, cwd=repo, stdout=subprocess.PIPE, stderr=errfile)
+    timedout = threading.Event()
+
+    def kill():
+        """Kill git for taking too long."""
+        timedout.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.daemon = True
+        timer.start()
+    try:
+        authors = list(git.get_authors(proc.stdout))
+    except AssertionError:          # Output cut short
+        if not timedout.is_set():
+            raise
+    finally:
+        if timer:
+            timer.cancel()
+        proc.stdout.close()
+        proc.wait()
+        errfile.seek(0)
+        err = errfile.read()
+        errfile.close()
+    if timedout.is_set():
+        return None
+    if proc.returncode:
+        raise _failed(proc.returncode, cmd, err)
+    return authors
+
+
+class _Cached(object):
+    """A result that's already at hand, looking like an :class:`multiprocessing.pool.AsyncResult`."""
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def collect(repo, rev='HEAD', jobs=8, timeout=None, files=None, cache=None):
+    """Blame every file in commit `rev` of git repo `repo`, running up to `jobs` ``git blame`` s at once.
+
+    Files are blamed in the order ``git ls-tree`` lists them, and only a few
+    more than `jobs` results are held at a time, so memory use is bounded.
+    :Return: An iterator of ``(filename, list(author))`` tuples, like :func:`blamethrower.reporeaders.git.read`.
+    :param float timeout: Skip any file that takes longer than this many seconds to blame.
+    :param list files: Blame these files rather than all files in `rev`.
+    :param BlameCache cache: Take the blame for files that haven't changed from this cache,
+      and add the blame for files that have.  Files are keyed by path and blob id.
+    :raises BlameTimeoutWarning: For each file that timed out.
+    :rtype: iter((str, list(str)))
+    """
+    if cache is None:
+        blobs = ((filename, None) for filename in (listfiles(repo, rev) if files is None else files))
+    elif files is None:
+        blobs = listblobs(repo, rev)
+    else:
+        file2blob = dict(listblobs(repo, rev))
+        blobs = ((filename, file2blob.get(filename)) for filename in files)
+    blobs = iter(blobs)
+    pool = ThreadPool(jobs)
+
+    def start(filename, blob):
+        """:Return: a ``(filename, cache key, result)`` triple for blaming `filename`, which has blob id `blob`."""
+        key = cache.key(filename, blob, *BLAME_OPTIONS) if cache is not None and blob else None
+        authors = cache.get(key) if key else None
+        if authors is not None:
+            return filename, None, _Cached(authors)
+        return filename, key, pool.apply_async(blame, (repo, filename, rev, timeout))
+
+    try:
+        pending = deque(start(filename, blob) for filename, blob in itertools.islice(blobs, 2 * jobs))
+        while pending:
+            filename, key, result = pending.popleft()
+            authors = result.get()
+            for filename_blob in itertools.islice(blobs, 1):
+                pending.append(start(*filename_blob))
+            if authors is None:
+                warnings.warn(BlameTimeoutWarning(filename, timeout), stacklevel=2)
+                continue
+            if key:
+                cache.put(key, authors)
+            yield filename, authors
+        pool.close()
+    finally:
+        pool.terminate()
+
+
+def collect_runs(repo, authors, rev='HEAD', jobs=8, timeout=None, files=None, cache=None):
+    """:Return: An iterator of ``(filename, BlameRuns)`` tuples for the files blamed by :func:`collect`.
+
+    :param StringTable authors: The table to intern author names in.
+    :rtype: iter((str, BlameRuns))
+    """
+    for filename, authorlist in collect(repo, rev, jobs, timeout, files, cache):
+        yield filename, BlameRuns.fromauthors(authorlist, authors)
@@ -17,42 +17,129 @@ Mercurial's output, while simple, is pretty hopeless on its own.
 So, we can't use the output of Mercurial directly.  Before it gets here, we need
 to help it by filtering out binary files and prepending a header to the output
 for each file. See `bin/hg-blame.sh`.  The output is just a header line followed
-by an author name for each line in the file.
+by an author name for each line in the file.  :mod:`blamethrower.reporeaders.hgcollect`
+gets the same output from Mercurial with a template instead.
+
+A blame file has only a few distinct author lines, so each one is parsed once
+with string operations and remembered.  Files are split at their headers, and
+their lines mapped to authors, a whole run of lines at a time.
 """
 
 import re
+import itertools
+import operator
 
-from blamethrower import itergroup
+from blamethrower.runs import StringTable, BlameRuns, reintern
 
-__all__ = ['read', 'HELP']
+__all__ = ['read', 'read_runs', 'parse_author', 'HELP', 'OPTIONS']
 HELP = 'hg blame with headers; see bin/hg-blame.sh'
+OPTIONS = {'jobs': 'parse a large hg blame file in N processes'}
+HEADER = '>>> hg blame output for: '
 HEADER_RE = re.compile(r"^>>> hg blame output for: (?P<filename>.+) <<<$")
 AUTHOR_RE = re.compile(r"^\s*(?P<author>.+?)( <.+@.+>)?\s*$")
 
 
-def read(blamefile):
+def parse_author(line):
+    """:Return: the author from one `line` of ``hg blame -vu`` output, without any
+    email address or padding, or `None` if there isn't one; the same as :data:`AUTHOR_RE`, only faster."""
+    author = line.strip()
+    start = author.find(' <')
+    # AUTHOR_RE's author is as short as it can be, so it ends at the first ' <' that starts an email.
+    if start > 0 and author.endswith('>') and '@' in author[start + 3:-2]:
+        author = author[:start]
+    elif not author:        # All whitespace, which the regex makes something of
+        match = AUTHOR_RE.match(line)
+        author = match and match.group('author')
+    return author or None
+
+
+def _sourcefiles(blamefile):
+    """:Return: an iterator of ``(filename, list(str))`` pairs, giving the lines of
+    output for each file in `blamefile`, which has headers and no binary files."""
+    filename = None
+    # Split at the headers a whole run of lines at a time, rather than looking at each line.
+    for isheader, lines in itertools.groupby(blamefile, operator.methodcaller('startswith', HEADER)):
+        if isheader:
+            for header in lines:
+                if filename is not None:        # The file before was empty
+                    yield filename, []
+                match = HEADER_RE.match(header)
+                if not match:
+                    raise ValueError("Could not parse hg blame output header {0!r}".format(header))
+                filename = match.group('filename')
+        elif filename is None:
+            raise ValueError("Did not find header as first line of hg blame output")
+        else:
+            yield filename, list(lines)
+            filename = None
+    if filename is not None:
+        yield filename, []
+
+
+def _getauthors(filename, lines, line2author):
+    """:Return: the list of the authors of `lines` of `filename`.
+
+    :param dict line2author: Authors of lines already seen, which we add to.
+    """
+    authors = map(line2author.get, lines)
+    if None in authors:
+        for i, line in enumerate(lines):
+            if authors[i] is None:
+                author = parse_author(line)
+                if author is None:
+                    raise ValueError("Could not parse author from hg blame output for '{0}'".format(filename))
+                authors[i] = line2author[line] = intern(author)
+    return authors
+
+
+def read(blamefile, jobs=None):
     """Iterate over source files described by ``hg blame -vu`` output that has
     has headers and does not have binary files.
 
     Empty files are skipped.
     :Return: An iterator of ``(filename, list(author))`` tuples, with ``list[i]``
       being the author of line ``i`` in `filename`.
+    :param int jobs: Split `blamefile` into chunks and parse them in this many processes;
+      see :func:`blamethrower.parallel.parse_chunks`.
     :rtype: iter((str, list(str)))
     """
-    def getfilename(line):
-        """:Return: the filename from a header `line`, or `None` if `line` was not a header."""
-        match = HEADER_RE.match(line)
-        return match.group('filename') if match else None
-
-    for sourcefile in itergroup(blamefile, getfilename):
-        filename = getfilename(next(sourcefile))
-        if not filename:
-            raise ValueError("Did not find header as first line of hg blame output")
-        authors = [None]
-        for line in sourcefile:
-            match = AUTHOR_RE.match(line)
-            if not match:
-                raise ValueError("Could not parse author from hg blame output for '{0}'".format(filename))
-            authors.append(match.group('author'))
-        if len(authors) > 1:
-            yield filename, authors
+    if jobs:
+        from blamethrower.parallel import parse_chunks      # Only when asked for; multiprocessing is slow to import.
+        return parse_chunks(blamefile, HEADER, read, int(jobs))
+    return _read(blamefile)
+
+
+def _read(blamefile):
+    """:Return: the output of :func:`read` for `blamefile`, parsed serially."""
+    line2author = {}
+    for filename, lines in _sourcefiles(blamefile):
+        if lines:
+            yield filename, [None] + _getauthors(filename, lines, line2author)
+
+
+def read_runs(blamefile, authors, jobs=None):
+    """Iterate over source files described by ``hg blame -vu`` output that has
+    has headers and does not have binary files.
+
+    Empty files are skipped.
+    :Return: An iterator of ``(filename, BlameRuns)`` tuples.
+    :param StringTable authors: The table to intern author names in.
+    :param int jobs: As for :func:`read`.
+    :rtype: iter((str, BlameRuns))
+    """
+    if jobs:
+        from blamethrower.parallel import parse_chunks
+        chunks = parse_chunks(blamefile, HEADER, lambda lines: read_runs(lines, StringTable()), int(jobs))
+        return reintern(chunks, authors)
+    return _read_runs(blamefile, authors)
+
+
+def _read_runs(blamefile, authors):
+    """:Return: the output of :func:`read_runs` for `blamefile`, parsed serially."""
+    line2author = {}
+    for filename, lines in _sourcefiles(blamefile):
+        if lines:
+            blameruns = BlameRuns(authors)
+            for author, run in itertools.groupby(_getauthors(filename, lines, line2author)):
+                blameruns.append(author, len(list(run)))
+            yield filename, blameruns
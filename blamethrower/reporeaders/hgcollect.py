@@ -0,0 +1,118 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Collect line authorship straight from a Mercurial repository.
+
+This does the job of `bin/hg-blame.sh` without a shell, ``grep``, and ``cut``
+for every file: list the files in a revision with ``hg files``, and run ``hg
+annotate`` on many files at a time, with a template that gives the header and
+full username that :mod:`blamethrower.reporeaders.hg` reads, so there's
+nothing to filter.  Several ``hg`` processes run at once in a bounded pool of
+threads, and each one's output is parsed as it streams in.
+
+Templates need Mercurial 4.6 or later.  Binary files come out with no lines,
+so they're skipped, as are empty files.
+"""
+
+from collections import deque
+import itertools
+import subprocess
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from blamethrower.reporeaders import hg
+from blamethrower.runs import BlameRuns
+
+__all__ = ['collect', 'collect_runs', 'listfiles', 'annotate']
+
+HG = 'hg'
+#: Gives each file a header and each line its full username, as `bin/hg-blame.sh` does.
+#: Binary files have no ``lines``.
+TEMPLATE = hg.HEADER + '{path} <<<\\n{if(lines, lines % "{user}\\n")}'
+BATCHSIZE = 100         # Files per hg process
+
+
+def _failed(returncode, cmd, err):
+    """:Return: a :exc:`subprocess.CalledProcessError` for command `cmd`, with its stderr `err` as the ``output``."""
+    error = subprocess.CalledProcessError(returncode, ' '.join(cmd))
+    error.output = err          # Not a constructor argument until Python 2.7
+    return error
+
+
+def _hg(repo, *args):
+    """:Return: the output of running ``hg`` with `args` in `repo`.
+
+    :raises subprocess.CalledProcessError: If hg fails.
+    """
+    cmd = (HG,) + args
+    proc = subprocess.Popen(cmd, cwd=repo, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    if proc.returncode:
+        raise _failed(proc.returncode, cmd, err)
+    return out
+
+
+def listfiles(repo, rev='.'):
+    """:Return: a list of the names of all files in revision `rev` of Mercurial repo `repo`."""
+    return [filename for filename in _hg(repo, 'files', '-0', '-r', rev).split('\0') if filename]
+
+
+def annotate(repo, filenames, rev='.'):
+    """:Return: a list of ``(filename, list(author))`` tuples for `filenames` in revision
+    `rev` of Mercurial repo `repo`, as from :func:`blamethrower.reporeaders.hg.read`,
+    from one ``hg annotate``.
+
+    :raises subprocess.CalledProcessError: If hg fails.
+    """
+    patterns = ['path:' + filename for filename in filenames]       # Not globs or regexes
+    cmd = (HG, 'annotate', '--user', '--rev', rev, '--template', TEMPLATE, '--') + tuple(patterns)
+    errfile = tempfile.TemporaryFile(prefix='blamethrower.')        # Not a pipe, which could fill up while we read stdout.
+    proc = subprocess.Popen(cmd, cwd=repo, stdout=subprocess.PIPE, stderr=errfile)
+    try:
+        files_authors = list(hg.read(proc.stdout))
+    finally:
+        proc.stdout.close()
+        proc.wait()
+        errfile.seek(0)
+        err = errfile.read()
+        errfile.close()
+    if proc.returncode:
+        raise _failed(proc.returncode, cmd, err)
+    return files_authors
+
+
+def collect(repo, rev='.', jobs=8, files=None, batchsize=BATCHSIZE):
+    """Blame every file in revision `rev` of Mercurial repo `repo`, running up to
+    `jobs` ``hg annotate`` s at once, each on up to `batchsize` files.
+
+    Batches come out in the order ``hg files`` lists them, and only a few
+    more than `jobs` batches are held at a time, so memory use is bounded.
+    :Return: An iterator of ``(filename, list(author))`` tuples, like :func:`blamethrower.reporeaders.hg.read`.
+    :param list files: Blame these files rather than all files in `rev`.
+    :rtype: iter((str, list(str)))
+    """
+    files = iter(listfiles(repo, rev) if files is None else files)
+    batches = iter(lambda: list(itertools.islice(files, batchsize)), [])
+    pool = ThreadPool(jobs)
+    try:
+        pending = deque(pool.apply_async(annotate, (repo, batch, rev)) for batch in itertools.islice(batches, 2 * jobs))
+        while pending:
+            files_authors = pending.popleft().get()
+            for batch in itertools.islice(batches, 1):
+                pending.append(pool.apply_async(annotate, (repo, batch, rev)))
+            for filename, authors in files_authors:
+                yield filename, authors
+        pool.close()
+    finally:
+        pool.terminate()
+
+
+def collect_runs(repo, authors, rev='.', jobs=8, files=None, batchsize=BATCHSIZE):
+    """:Return: An iterator of ``(filename, BlameRuns)`` tuples for the files blamed by :func:`collect`.
+
+    :param StringTable authors: The table to intern author names in.
+    :rtype: iter((str, BlameRuns))
+    """
+    for filename, authorlist in collect(repo, rev, jobs, files, batchsize):
+        yield filename, BlameRuns.fromauthors(authorlist, authors)
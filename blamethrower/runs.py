@@ -0,0 +1,119 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Run-length encoded blame.
+
+Blame is mostly long runs of lines by the same author, so rather than a list
+with an author for every line, :class:`BlameRuns` stores ``(start, length,
+author_id)`` runs, with author names interned in a :class:`StringTable` shared
+by every file.
+"""
+
+from array import array
+import itertools
+
+__all__ = ['StringTable', 'BlameRuns', 'reintern']
+
+
+class StringTable(object):
+    """Interns strings as small integer ids, numbered from 0 in order of first appearance."""
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def getid(self, string):
+        """:Return: the id of `string`, adding it to the table if it is new."""
+        id_ = self.ids.get(string)
+        if id_ is None:
+            id_ = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return id_
+
+    def __getitem__(self, id_):
+        return self.strings[id_]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class BlameRuns(object):
+    """The authors of every line of one file, as ``(start, length, author_id)`` runs.
+
+    Runs are in line order, start at line 1, and cover every line.  Author ids
+    index into the :class:`StringTable` `authors`.
+    """
+    __slots__ = ('authors', 'runs')
+
+    def __init__(self, authors, runs=None):
+        """:param StringTable authors: The table of author names.
+        :param array runs: Flattened ``(start, length, author_id)`` triples.
+        """
+        self.authors = authors
+        self.runs = array('l') if runs is None else runs
+
+    @classmethod
+    def fromauthors(cls, authorlist, authors):
+        """:Return: a :class:`BlameRuns` for the per-line `authorlist` (whose first element,
+        for "line 0," is ignored), adding its authors to :class:`StringTable` `authors`."""
+        blameruns = cls(authors)
+        authorlist = iter(authorlist)
+        next(authorlist, None)
+        for author in authorlist:
+            blameruns.append(author)
+        return blameruns
+
+    def append(self, author, length=1):
+        """Add `length` lines by `author` to the end of the file."""
+        author_id = self.authors.getid(author)
+        runs = self.runs
+        if runs and runs[-1] == author_id:
+            runs[-2] += length
+        else:
+            runs.extend((len(self) + 1, length, author_id))
+
+    def tolist(self):
+        """:Return: the list of authors of each line, with ``None`` for "line 0," as from :func:`blamethrower.getblame`."""
+        authorlist = [None]
+        for _, length, author_id in self:
+            authorlist.extend([self.authors[author_id]] * length)
+        return authorlist
+
+    def __iter__(self):
+        runs = iter(self.runs)
+        return itertools.izip(runs, runs, runs)
+
+    def __len__(self):
+        """:Return: the number of lines in the file."""
+        runs = self.runs
+        return runs[-3] + runs[-2] - 1 if runs else 0
+
+    def __eq__(self, other):
+        return isinstance(other, BlameRuns) and self.tolist() == other.tolist()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'BlameRuns({0!r})'.format(list(self))
+
+
+def reintern(files_runs, authors):
+    """:Return: an iterator over the ``(filename, BlameRuns)`` pairs `files_runs`, with
+    each :class:`BlameRuns` changed to use :class:`StringTable` `authors`.
+
+    This is for blame parsed elsewhere with its own table; it is fastest when
+    consecutive runs share a table.
+    """
+    table = ids = None
+    for filename, blameruns in files_runs:
+        if blameruns.authors is not authors:
+            if blameruns.authors is not table:
+                table, ids = blameruns.authors, []
+            # The table may have grown since the last file.
+            ids.extend(authors.getid(author) for author in table.strings[len(ids):])
+            runs = blameruns.runs
+            for i in xrange(2, len(runs), 3):
+                runs[i] = ids[runs[i]]
+            blameruns.authors = authors
+        yield filename, blameruns
@@ -0,0 +1,324 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Answer queries about bugs and blame from memory, over HTTP.
+
+Reading and merging big blame and bug files takes a while, which is a lot to
+pay for every "what bugs does this author own under this path?"  A
+:class:`Server` reads its input files once, merges them into an :class:`Index`
+of analynes by author, filename, and bug type, and answers queries from it:
+
+  GET /stats?author=A&path=P&bugtype=T&severity=S&group_by=F,...
+      :func:`blamethrower.stats.getstats` of just the matching analynes
+  GET /bugs?author=A&path=P&bugtype=T&severity=S&limit=N
+      the matching bugs, as ``[filename, linenum, bugtype, severity, author]`` rows
+  GET /status
+      the input files, when each was read, and how many analynes there are
+  POST /reload
+      reread any input files that have changed, now
+
+All filters are optional; `path` matches a file or everything under a
+directory.  Results are JSON.  A background thread also checks the input
+files every so often, and rereads any that changed; only the changed files
+are parsed again, and queries keep using the old index until the new one is
+ready.  The server listens on a TCP port or, given a path, a Unix socket.
+"""
+
+from array import array
+from collections import defaultdict
+import BaseHTTPServer
+import SocketServer
+import bisect
+import itertools
+import json
+import os
+import stat
+import threading
+import time
+import urlparse
+import warnings
+
+import blamethrower
+import blamethrower.compressed
+import blamethrower.dedup
+import blamethrower.stats
+from blamethrower.runs import StringTable
+
+__all__ = ['Index', 'Server', 'serve', 'make_httpd']
+
+_LIMIT = 1000           # Default maximum bugs per /bugs response
+
+
+class Index(object):
+    """Merged analynes, indexed by author, filename, and bug type."""
+    def __init__(self, analynes):
+        """:param iter(Analyne) analynes: Analynes (and :class:`blamethrower.Analyrun` runs) from :func:`blamethrower.merge`."""
+        self.analynes = list(analynes)
+        indexes = byauthor, byfile, bybugtype = [defaultdict(lambda: array('l')) for _ in xrange(3)]
+        Analyrun = blamethrower.Analyrun         # pylint: disable=C0103
+        for i, analyne in enumerate(self.analynes):
+            byauthor[analyne.author].append(i)
+            byfile[analyne.filename].append(i)
+            bybugtype[None if analyne.__class__ is Analyrun else analyne.bugtype].append(i)
+        self.byauthor, self.byfile, self.bybugtype = [dict(index) for index in indexes]
+        self.filenames = sorted(self.byfile)
+
+    def files_under(self, path):
+        """:Return: a list of the filenames that are `path` or under directory `path`."""
+        path = path.rstrip('/')
+        if not path or path == '.':
+            return self.filenames
+        files = [path] if path in self.byfile else []
+        prefix = path + '/'
+        start = bisect.bisect_left(self.filenames, prefix)
+        end = bisect.bisect_left(self.filenames, prefix[:-1] + chr(ord('/') + 1))
+        return files + self.filenames[start:end]
+
+    def select(self, author=None, path=None, bugtype=None, severity=None):
+        """:Return: an iterator over the analynes that match all the given filters, in order.
+
+        Starts from the smallest of the indexes that apply, and checks the other filters as it goes.
+        :param str path: A filename, or a directory to match every file under.
+        """
+        candidates = []
+        if author is not None:
+            candidates.append(self.byauthor.get(author, ()))
+        if bugtype is not None:
+            candidates.append(self.bybugtype.get(bugtype, ()))
+        if path is not None:
+            positions = [self.byfile[filename] for filename in self.files_under(path)]
+            candidates.append(sorted(itertools.chain.from_iterable(positions)) if len(positions) != 1 else positions[0])
+        if candidates:
+            positions = min(candidates, key=len)
+        elif severity is not None:
+            positions = itertools.chain.from_iterable(index for bugtype_, index in self.bybugtype.iteritems() if bugtype_ is not None)
+            positions = sorted(positions)
+        else:
+            return iter(self.analynes)
+        filenames = None if path is None else set(self.files_under(path))
+        Analyrun = blamethrower.Analyrun         # pylint: disable=C0103
+        analynes = self.analynes
+
+        def matches(analyne):
+            """:Return: whether `analyne` matches every filter."""
+            if author is not None and analyne.author != author:
+                return False
+            if filenames is not None and analyne.filename not in filenames:
+                return False
+            if bugtype is not None or severity is not None:
+                if analyne.__class__ is Analyrun:
+                    return False
+                if bugtype is not None and analyne.bugtype != bugtype:
+                    return False
+                if severity is not None and analyne.severity != severity:
+                    return False
+            return True
+        return (analynes[i] for i in positions if matches(analynes[i]))
+
+    def stats(self, groupby=(), **filters):
+        """:Return: the stats of the analynes that match `filters`, as from :func:`blamethrower.stats.getstats`."""
+        return blamethrower.stats.getstats(self.select(**filters), groupby)
+
+    def bugs(self, limit=None, **filters):
+        """:Return: a list of up to `limit` of the bugs (not runs of lines without bugs) that match `filters`."""
+        bugs = (analyne for analyne in self.select(**filters) if analyne.__class__ is not blamethrower.Analyrun and analyne.bugtype is not None)
+        return list(itertools.islice(bugs, limit))
+
+
+class _Input(object):
+    """An input file, and what was last parsed from it."""
+    def __init__(self, kind, module, filename, options):
+        self.kind = kind            # 'bugs' or 'blame'
+        self.module = module
+        self.filename = filename
+        self.options = options
+        self.mtime = None
+        self.loaded = None
+        self.items = []
+
+    def changed(self):
+        """:Return: whether the file has changed since it was last read."""
+        try:
+            return os.stat(self.filename).st_mtime != self.mtime
+        except OSError:
+            return False            # Keep what we have until it comes back
+
+    def load(self, authors):
+        """Read and parse the file, interning blame authors in :class:`StringTable` `authors`."""
+        mtime = os.stat(self.filename).st_mtime
+        with blamethrower.compressed.openfile(self.filename) as infile:
+            if self.kind == 'bugs':
+                items = list(blamethrower.getbugs(self.module, infile, **self.options))         # pylint: disable=W0142
+            else:
+                items = list(blamethrower.getblameruns(self.module, infile, authors, **self.options))       # pylint: disable=W0142
+        self.items, self.mtime, self.loaded = items, mtime, time.time()
+
+    def status(self):
+        """:Return: a dict describing this input."""
+        return {'kind': self.kind, 'module': self.module, 'filename': self.filename, 'options': self.options,
+                'loaded': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.loaded)) if self.loaded else None,
+                'items': len(self.items)}
+
+
+class Server(object):
+    """Keeps an :class:`Index` of bug and blame input files up to date."""
+    def __init__(self, bugsfiles=(), blamefiles=(), sortbuffer=None, dedup=None):
+        """:param bugsfiles: ``(analyzer_name, filename, options)`` triples.
+        :param blamefiles: ``(repo_name, filename, options)`` triples.
+        :param int sortbuffer: Merge with an external sort, as for :func:`blamethrower.merge`.
+        :param int dedup: Drop duplicate bugs, remembering this many in memory, as for :func:`blamethrower.dedup.dedup`.
+        """
+        self.inputs = [_Input('bugs', name, filename, options) for name, filename, options in bugsfiles]
+        self.inputs += [_Input('blame', name, filename, options) for name, filename, options in blamefiles]
+        self.sortbuffer = sortbuffer
+        self.dedup = dedup
+        self.authors = StringTable()
+        self.index = None
+        self.nobugs = 0             # Bugs with no blame, at the last reload
+        self._lock = threading.Lock()
+
+    def reload(self, force=False):
+        """Reread the input files that have changed (or all of them, if `force`), and rebuild the index.
+
+        :Return: the list of filenames reread.
+        """
+        with self._lock:
+            changed = [inp for inp in self.inputs if force or inp.changed()]
+            if not changed and self.index is not None:
+                return []
+            for inp in changed:
+                inp.load(self.authors)
+            bugs = [item for inp in self.inputs if inp.kind == 'bugs' for item in inp.items]
+            blame = [item for inp in self.inputs if inp.kind == 'blame' for item in inp.items]
+            with warnings.catch_warnings(record=True) as warnlist:
+                warnings.simplefilter('always')
+                if self.dedup and bugs:
+                    bugs = list(blamethrower.dedup.dedup(bugs, self.dedup))
+                index = Index(blamethrower.merge(bugs or None, blame or None, self.sortbuffer))
+            self.nobugs = sum(warning.message.numbugs for warning in warnlist if warning.category is blamethrower.NoOneToBlameWarning)
+            self.index = index          # Queries in progress keep the old one.
+            return [inp.filename for inp in changed]
+
+    def watch(self, interval):
+        """Start a daemon thread that calls :meth:`reload` every `interval` seconds."""
+        def run():
+            """Reload forever."""
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception:           # pylint: disable=W0703
+                    pass            # Probably caught a file half-written; try again next time.
+        thread = threading.Thread(target=run, name='reload')
+        thread.daemon = True
+        thread.start()
+
+    def status(self):
+        """:Return: a dict describing the inputs and index."""
+        return {'inputs': [inp.status() for inp in self.inputs], 'analynes': len(self.index.analynes) if self.index else 0,
+                'no_blame_bugs': self.nobugs, 'version': blamethrower.__version__}
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers queries about the :class:`Server` ``self.server.blamethrower``."""
+    server_version = 'BlameThrower/' + blamethrower.__version__
+    FILTERS = ('author', 'path', 'bugtype', 'severity')
+
+    def address_string(self):
+        """Unix sockets have no client address."""
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):       # pylint: disable=W0622
+        """Only log when asked to."""
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _reply(self, code, obj):
+        """Send `obj` as JSON with HTTP status `code`."""
+        body = json.dumps(obj, sort_keys=True, indent=2) + '\n'
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):           # pylint: disable=C0103
+        """Answer /stats, /bugs, or /status."""
+        url = urlparse.urlparse(self.path)
+        params = dict((key, values[-1]) for key, values in urlparse.parse_qs(url.query).iteritems())
+        filters = dict((key, params[key]) for key in self.FILTERS if key in params)
+        index = self.server.blamethrower.index
+        try:
+            if url.path == '/stats':
+                groupby = [blamethrower.stats.parse_groupby(fields) for fields in urlparse.parse_qs(url.query).get('group_by', [])]
+                self._reply(200, index.stats(groupby, **filters))            # pylint: disable=W0142
+            elif url.path == '/bugs':
+                limit = int(params.get('limit', _LIMIT))
+                self._reply(200, [list(bug) for bug in index.bugs(limit, **filters)])       # pylint: disable=W0142
+            elif url.path == '/status':
+                self._reply(200, self.server.blamethrower.status())
+            else:
+                self._reply(404, {'error': 'No such query: ' + url.path})
+        except ValueError as err:
+            self._reply(400, {'error': str(err)})
+
+    def do_POST(self):          # pylint: disable=C0103
+        """Answer /reload."""
+        if urlparse.urlparse(self.path).path == '/reload':
+            try:
+                reloaded = self.server.blamethrower.reload()
+            except Exception as err:           # pylint: disable=W0703
+                self._reply(500, {'error': 'Reload failed: {0}'.format(err)})      # Probably caught a file half-written.
+            else:
+                self._reply(200, {'reloaded': reloaded})
+        else:
+            self._reply(404, {'error': 'No such command: ' + self.path})
+
+
+class _TCPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(server, address, interval=None, verbose=False, httpd=None):
+    """Answer queries about :class:`Server` `server` until interrupted.
+
+    :param str address: ``host:port`` (or just ``port``) to listen on, or the path of a Unix socket.
+    :param float interval: Check for changed input files this often, in seconds.
+    :param bool verbose: Log each request to standard error.
+    :param httpd: The :func:`make_httpd` server for `address`, if already made.
+    :raises ValueError: If `address` is a path to something other than a socket.
+    """
+    if httpd is None:
+        httpd = make_httpd(server, address, verbose)
+    if interval:
+        server.watch(interval)
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        if isinstance(httpd, _UnixServer):
+            os.remove(address)
+
+
+def make_httpd(server, address, verbose=False):
+    """:Return: an HTTP server answering queries about :class:`Server` `server` at `address`, as for :func:`serve`.
+
+    :raises ValueError: If `address` is a path to something other than a socket.
+    """
+    if '/' in address:
+        if os.path.lexists(address):
+            if not stat.S_ISSOCK(os.lstat(address).st_mode):
+                raise ValueError("Won't serve at '{0}': it already exists and is not a socket".format(address))
+            os.remove(address)          # Left over from before
+        httpd = _UnixServer(address, _Handler)
+    else:
+        host, _, port = address.rpartition(':')
+        httpd = _TCPServer((host or 'localhost', int(port)), _Handler)
+    httpd.blamethrower = server
+    httpd.verbose = verbose
+    return httpd
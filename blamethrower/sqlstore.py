@@ -0,0 +1,182 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Keep runs of merged analynes in an SQLite database, and query them.
+
+``--rawdata`` output is fine for one look, but getting any slice of it back
+means reading all of it.  :func:`write` bulk-loads the output of
+:func:`blamethrower.merge` into a database as a new *run*, so a database can
+hold months of runs, and :func:`select` reads back just the analynes of a run
+that match some filters, using indexes, to give to
+:func:`blamethrower.stats.getstats` (or :func:`getstats`, which does both).
+
+Filenames, authors, and bug types are stored once each, in their own tables,
+and rows refer to them by id.  A row is an analyne or a run of lines without
+bugs (see :class:`blamethrower.Analyrun`), which is stored as is, so blame
+takes a row per run rather than per line::
+
+    runs(id, timestamp, label, rows)
+    files(id, name)   authors(id, name)   bugtypes(id, name)
+    analynes(run, file, start, length, bugtype, severity, author)
+
+:func:`write` inserts rows in large batches with ``executemany``, all in one
+transaction, which is many times faster than committing as it goes.
+"""
+
+import itertools
+import sqlite3
+from datetime import datetime
+
+import blamethrower
+import blamethrower.stats
+
+__all__ = ['connect', 'write', 'runs', 'select', 'getstats']
+
+VERSION = 1             # Stored as the database's user_version
+_BATCHSIZE = 10000      # Rows per executemany()
+_NAMES = ('files', 'authors', 'bugtypes')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, timestamp TEXT, label TEXT, rows INTEGER);
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS authors (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS bugtypes (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS analynes (
+    run INTEGER NOT NULL REFERENCES runs(id),
+    file INTEGER NOT NULL REFERENCES files(id),
+    start INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    bugtype INTEGER REFERENCES bugtypes(id),
+    severity TEXT,
+    author INTEGER REFERENCES authors(id)
+);
+CREATE INDEX IF NOT EXISTS analynes_file ON analynes (run, file);
+CREATE INDEX IF NOT EXISTS analynes_author ON analynes (run, author);
+CREATE INDEX IF NOT EXISTS analynes_bugtype ON analynes (run, bugtype);
+"""
+
+
+def connect(filename):
+    """:Return: an :class:`sqlite3.Connection` to the database in `filename`, creating it if need be.
+
+    :raises ValueError: If the database is from a different version of BlameThrower.
+    """
+    db = sqlite3.connect(filename)
+    db.text_factory = str           # Names are bytes in, so bytes out.
+    version = db.execute('PRAGMA user_version').fetchone()[0]
+    if version not in (0, VERSION):
+        db.close()
+        raise ValueError("{0} has analyne database version {1}, not {2}".format(filename, version, VERSION))
+    if not version:
+        with db:
+            db.executescript(_SCHEMA)
+            db.execute('PRAGMA user_version = {0}'.format(VERSION))
+    return db
+
+
+class _Ids(dict):
+    """Maps names to their ids in one of the name tables, adding names as needed."""
+    def __init__(self, db, table):
+        super(_Ids, self).__init__(db.execute('SELECT name, id FROM ' + table))
+        self.db = db
+        self.table = table
+        self[None] = None
+
+    def __missing__(self, name):
+        self[name] = rowid = self.db.execute('INSERT INTO {0} (name) VALUES (?)'.format(self.table), (name,)).lastrowid
+        return rowid
+
+
+def write(analynes, db, label=None, timestamp=None):
+    """Store `analynes` (which may include :class:`blamethrower.Analyrun` runs) in :func:`connect` ed
+    database `db` as a new run, in a single transaction.
+
+    :param str label: Describe the run (say, with a commit id).
+    :param str timestamp: When the run was, in ISO 8601 format; default now.
+    :Return: the id of the new run.
+    """
+    if timestamp is None:
+        timestamp = datetime.now().replace(microsecond=0).isoformat()
+    Analyrun = blamethrower.Analyrun         # pylint: disable=C0103
+    with db:
+        run = db.execute('INSERT INTO runs (timestamp, label) VALUES (?, ?)', (timestamp, label)).lastrowid
+        files, authors, bugtypes = [_Ids(db, table) for table in _NAMES]
+        numrows = 0
+        analynes = iter(analynes)
+        while True:
+            rows = []
+            for analyne in itertools.islice(analynes, _BATCHSIZE):
+                if analyne.__class__ is Analyrun:
+                    filename, start, length, author = analyne
+                    rows.append((run, files[filename], start, length, None, None, authors[author]))
+                else:
+                    filename, linenum, bugtype, severity, author = analyne
+                    rows.append((run, files[filename], linenum, 1, bugtypes[bugtype], severity, authors[author]))
+            if not rows:
+                break
+            db.executemany('INSERT INTO analynes VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            numrows += len(rows)
+        db.execute('UPDATE runs SET rows = ? WHERE id = ?', (numrows, run))
+    return run
+
+
+def runs(db):
+    """:Return: a list of ``(id, timestamp, label, rows)`` tuples for the runs in `db`, oldest first."""
+    return db.execute('SELECT id, timestamp, label, rows FROM runs ORDER BY id').fetchall()
+
+
+def select(db, run=None, author=None, path=None, bugtype=None, severity=None):
+    """:Return: an iterator over the analynes of `run` in `db` that match all the given filters,
+    with runs of lines without bugs as :class:`blamethrower.Analyrun` s, in whatever order the
+    indexes give them.  (A run of one line comes back as an :class:`blamethrower.Analyne`, which
+    means the same thing.)
+
+    :param int run: The id of the run to read; default the latest.
+    :param str path: A filename, or a directory to match every file under.
+    :raises ValueError: If there is no such run.
+    """
+    if run is None:
+        run = db.execute('SELECT max(id) FROM runs').fetchone()[0]
+    if run is None or not db.execute('SELECT 1 FROM runs WHERE id = ?', (run,)).fetchone():
+        raise ValueError("No run {0} in the database".format('' if run is None else run).rstrip())
+    where, params = ['run = ?'], [run]
+    if author is not None:
+        where.append('author = (SELECT id FROM authors WHERE name = ?)')
+        params.append(author)
+    if bugtype is not None:
+        where.append('bugtype = (SELECT id FROM bugtypes WHERE name = ?)')
+        params.append(bugtype)
+    if severity is not None:
+        where.append('severity = ?')
+        params.append(severity)
+    if path is not None:
+        path = path.rstrip('/')
+        if path and path != '.':
+            # Everything from 'dir/' up to (not including) 'dir0', since '0' follows '/'.
+            where.append('file IN (SELECT id FROM files WHERE name = ? OR (name >= ? AND name < ?))')
+            params += [path, path + '/', path + chr(ord('/') + 1)]
+    cursor = db.execute('SELECT file, start, length, bugtype, severity, author FROM analynes WHERE ' + ' AND '.join(where), params)
+    return _analynes(db, cursor)
+
+
+def _analynes(db, rows):
+    """:Return: an iterator over the analynes for ``(file, start, length, bugtype, severity, author)`` `rows` from `db`."""
+    files, authors, bugtypes = [dict(db.execute('SELECT id, name FROM ' + table)) for table in _NAMES]
+    authors[None] = bugtypes[None] = None
+    Analyne, Analyrun = blamethrower.Analyne, blamethrower.Analyrun         # pylint: disable=C0103
+    while True:
+        rows_ = rows.fetchmany(_BATCHSIZE)
+        if not rows_:
+            break
+        for fileid, start, length, bugtypeid, severity, authorid in rows_:
+            if bugtypeid is None and severity is None and length != 1:
+                yield Analyrun(files[fileid], start, length, authors[authorid])
+            else:
+                yield Analyne(files[fileid], start, bugtypes[bugtypeid], severity, authors[authorid])
+
+
+def getstats(db, groupby=(), directories=False, maxdepth=None, minlines=0, **filters):
+    """:Return: the stats of the analynes from :func:`select` ``(db, **filters)``,
+    as from :func:`blamethrower.stats.getstats`."""
+    return blamethrower.stats.getstats(select(db, **filters), groupby, directories, maxdepth, minlines)      # pylint: disable=W0142
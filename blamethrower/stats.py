@@ -14,53 +14,461 @@ BlameThrower stats.
     - low
   - bugs_per_line
 
+- optionally, the same stats grouped by any combination of filename, author,
+  bugtype, and severity, computed in the same pass.
+
+- optionally, overall stats rolled up for every directory.
+
+Stats can also be collected as a *partial* aggregate, which still has the
+lines of each file rather than just their counts.  Partial aggregates of
+different inputs (say, different parts of a repo, processed by different
+processes or machines) can be merged, saved and loaded as JSON, and finished
+into the same stats as collecting everything at once.
+
 """
 
 from __future__ import division
-from collections import defaultdict
-import copy
+from collections import defaultdict, Mapping, Iterable
+from array import array
+import itertools
+import bisect
+import heapq
+import json
 
-__all__ = ['getstats']
+from blamethrower import Analyrun
 
+__all__ = ['getstats', 'rollup', 'LineSet', 'GROUP_FIELDS', 'parse_groupby', 'groupby_arg',
+           'getpartial', 'mergepartials', 'finish', 'dumppartial', 'loadpartial', 'PARTIAL_VERSION', 'pretty_floats']
 
-def getstats(analynes):
-    """:Return: a dictionary giving all available statistics about the bugs and/or
-    blame in `analynes`.
 
-    Bugs without a (valid) severity count toward the total, so high + med +
-    low will not add up to total.
+#: The version of the JSON format of partial aggregates.
+PARTIAL_VERSION = 1
+
+#: The fields of an analyne that stats can be grouped by.
+GROUP_FIELDS = ('filename', 'author', 'bugtype', 'severity')
+
+_CHUNKBITS = 16                         # Lines are grouped in chunks of 2**16
+_MAXSPARSE = 4096                       # An array of more 16-bit offsets than this is bigger than a bitmap
+_POPCOUNT = ''.join(chr(bin(byte).count('1')) for byte in xrange(256))
+
+
+def _popcount(bitmap):
+    """:Return: the number of bits set in bytearray `bitmap`."""
+    return sum(bytearray(str(bitmap).translate(_POPCOUNT)))
+
+
+def _countbits(bitmap, lo, hi):
+    """:Return: the number of bits set in bytearray `bitmap` from bit `lo` up to (but not including) bit `hi`."""
+    count = 0
+    while lo < hi and lo & 7:
+        count += bitmap[lo >> 3] >> (lo & 7) & 1
+        lo += 1
+    while lo < hi and hi & 7:
+        hi -= 1
+        count += bitmap[hi >> 3] >> (hi & 7) & 1
+    return count + _popcount(bitmap[lo >> 3:hi >> 3])
+
+
+class LineSet(object):
+    """A set of line numbers in one file.
+
+    Single lines are stored in a roaring-style compressed bitmap: line numbers
+    are grouped into chunks of 65536, and each chunk is a sorted array of 16-bit
+    offsets while it has only a few lines, or an 8 KiB bitmap once it has more.
+    Runs of lines are stored as ``(start, end)`` pairs, without storing each line.
     """
-    # Do recall: there can be multiple analynes for the same line of code.
-    # We make no attempt to deduplicate bugs.
-    AUTHOR = {
-        'lines': defaultdict(lambda: set()),
-        'bugs': {'total': 0, 'high': 0, 'med': 0, 'low': 0},
-        'files': set(),
-        'bugs_per_line': 0.0,
-    }
+    __slots__ = ('chunks', 'runs')
 
-    overall =  {
-        'lines': 0,
+    def __init__(self):
+        # Created on first use, since there are lots of small sets.
+        self.chunks = None          # Chunk number -> array('H') or bytearray
+        self.runs = None            # Flattened (start, end) pairs, end exclusive
+
+    def add(self, linenum):
+        """Add line number `linenum` to the set."""
+        high, low = linenum >> _CHUNKBITS, linenum & 0xffff
+        chunks = self.chunks
+        if chunks is None:
+            chunks = self.chunks = {}
+        chunk = chunks.get(high)
+        if chunk is None:
+            chunks[high] = array('H', (low,))
+        elif chunk.__class__ is bytearray:
+            chunk[low >> 3] |= 1 << (low & 7)
+        elif chunk[-1] < low:           # Lines usually come in order
+            chunk.append(low)
+            if len(chunk) > _MAXSPARSE:
+                self._tobitmap(high)
+        else:
+            i = bisect.bisect_left(chunk, low)
+            if chunk[i] != low:
+                chunk.insert(i, low)
+                if len(chunk) > _MAXSPARSE:
+                    self._tobitmap(high)
+
+    def _tobitmap(self, high):
+        """Convert chunk number `high` from an array to a bitmap."""
+        bitmap = bytearray(1 << (_CHUNKBITS - 3))
+        for low in self.chunks[high]:
+            bitmap[low >> 3] |= 1 << (low & 7)
+        self.chunks[high] = bitmap
+
+    def add_run(self, start, length):
+        """Add the `length` lines starting at line number `start` to the set."""
+        runs = self.runs
+        if runs is None:
+            self.runs = array('l', (start, start + length))
+        elif runs[-1] == start:
+            runs[-1] = start + length
+        else:
+            runs.extend((start, start + length))
+
+    def _count(self, start, end):
+        """:Return: the number of single lines in the set from `start` up to (but not including) `end`."""
+        count = 0
+        for high in xrange(start >> _CHUNKBITS, ((end - 1) >> _CHUNKBITS) + 1):
+            chunk = self.chunks.get(high) if self.chunks else None
+            if chunk is not None:
+                base = high << _CHUNKBITS
+                lo, hi = max(start, base) - base, min(end, base + (1 << _CHUNKBITS)) - base
+                if isinstance(chunk, bytearray):
+                    count += _countbits(chunk, lo, hi)
+                else:
+                    count += bisect.bisect_left(chunk, hi) - bisect.bisect_left(chunk, lo)
+        return count
+
+    def _mergedruns(self):
+        """:Return: an iterator over ``(start, end)`` pairs covering all runs in the set, without overlap."""
+        runs = iter(self.runs or ())
+        runs = sorted(itertools.izip(runs, runs))
+        if runs:
+            start, end = runs[0]
+            for nextstart, nextend in runs:
+                if nextstart > end:
+                    yield start, end
+                    start, end = nextstart, nextend
+                else:
+                    end = max(end, nextend)
+            yield start, end
+
+    def _singles(self):
+        """:Return: an iterator over the single lines in the set, in order."""
+        for high in sorted(self.chunks or ()):
+            chunk, base = self.chunks[high], high << _CHUNKBITS
+            if isinstance(chunk, bytearray):
+                for i, byte in enumerate(chunk):
+                    if byte:
+                        for bit in xrange(8):
+                            if byte >> bit & 1:
+                                yield base + (i << 3) + bit
+            else:
+                for low in chunk:
+                    yield base + low
+
+    def ranges(self):
+        """:Return: an iterator over ``(start, end)`` pairs, end exclusive, covering
+        exactly the lines in the set, in order and without overlap."""
+        start = end = None
+        for nextstart, nextend in heapq.merge(((linenum, linenum + 1) for linenum in self._singles()), self._mergedruns()):
+            if end is not None and nextstart <= end:
+                end = max(end, nextend)
+            else:
+                if end is not None:
+                    yield start, end
+                start, end = nextstart, nextend
+        if end is not None:
+            yield start, end
+
+    def update(self, ranges):
+        """Add the lines covered by ``(start, end)`` pairs `ranges` (as from :meth:`ranges`) to the set."""
+        for start, end in ranges:
+            if end - start == 1:
+                self.add(start)
+            else:
+                self.add_run(start, end - start)
+
+    def __getstate__(self):
+        return list(itertools.chain.from_iterable(self.ranges()))
+
+    def __setstate__(self, state):
+        self.chunks = self.runs = None
+        state = iter(state)
+        self.update(itertools.izip(state, state))
+
+    def __len__(self):
+        count = sum(len(chunk) if isinstance(chunk, array) else _popcount(chunk) for chunk in (self.chunks or {}).itervalues())
+        for start, end in self._mergedruns():
+            count += end - start - self._count(start, end)
+        return count
+
+
+def _newauthor():
+    """:Return: a dict for collecting the stats of one author."""
+    return {
+        'lines': defaultdict(LineSet),
         'bugs': {'total': 0, 'high': 0, 'med': 0, 'low': 0},
         'files': set(),
         'bugs_per_line': 0.0,
     }
 
-    authors = defaultdict(lambda: copy.deepcopy(AUTHOR))
+
+def parse_groupby(fields):
+    """:Return: a tuple of the field names in comma-separated string `fields`, such as ``'author,bugtype'``.
+
+    :raises ValueError: if a field is not one of :data:`GROUP_FIELDS`, or appears twice.
+    """
+    fields = tuple(field.strip() for field in fields.split(','))
+    for field in fields:
+        if field not in GROUP_FIELDS:
+            raise ValueError("Can't group by '{0}'; choose from {1}".format(field, ', '.join(GROUP_FIELDS)))
+    if len(set(fields)) != len(fields):
+        raise ValueError("Can't group by the same field twice: '{0}'".format(','.join(fields)))
+    return fields
+
+
+def groupby_arg(fields):
+    """:Return: the tuple of fields in the argument to a ``--group-by`` option, for its :mod:`argparse` `type`.
+
+    :raises argparse.ArgumentTypeError: with the message of :func:`parse_groupby`, if `fields` is bad.
+    """
+    try:
+        return parse_groupby(fields)
+    except ValueError as err:
+        import argparse
+        raise argparse.ArgumentTypeError(str(err))
+
+
+def _groupkey(fields):
+    """:Return: a function giving the tuple of `fields` of an analyne or analyrun
+    (which has no bugtype or severity)."""
+    return lambda analyne: tuple(getattr(analyne, field, None) for field in fields)
+
+
+def getstats(analynes, groupby=(), directories=False, maxdepth=None, minlines=0):
+    """:Return: a dictionary giving all available statistics about the bugs and/or
+    blame in `analynes`, which may include :class:`blamethrower.Analyrun` runs of lines.
+
+    Bugs without a (valid) severity count toward the total, so high + med +
+    low will not add up to total.
+
+    :param groupby: Tuples of :data:`GROUP_FIELDS` (as from :func:`parse_groupby`) to
+      also group the stats by, all in the same pass; see :func:`_nest`.
+      A line with a bug counts toward the lines of its bugtype and severity; a
+      line without one counts toward a bugtype and severity of `None`.
+    :param bool directories: Also give overall stats for every directory; see :func:`rollup`.
+    :param int maxdepth: Only give stats for directories at most this deep.
+    :param int minlines: Only give stats for directories with at least this many lines.
+    """
+    return finish(getpartial(analynes, groupby, directories), directories, maxdepth, minlines)
+
+
+def getpartial(analynes, groupby=(), directories=False):
+    """:Return: a partial aggregate of the stats of `analynes`, to merge with
+    :func:`mergepartials` and turn into stats with :func:`finish`.
+
+    Partial aggregates can be pickled (for example, to send them between
+    processes) or saved with :func:`dumppartial`.
+
+    :param groupby: Tuples of fields to group by, as for :func:`getstats`.
+    :param bool directories: Also collect what :func:`finish` needs to give stats for every directory.
+    """
+    # Do recall: there can be multiple analynes for the same line of code.
+    # We make no attempt to deduplicate bugs; see blamethrower.dedup.
+    authors = defaultdict(_newauthor)
+    groupings = [(fields, _groupkey(fields), defaultdict(_newauthor)) for fields in _groupings(groupby, directories)]
     for analyne in analynes:
         stats = authors[analyne.author]
+        if isinstance(analyne, Analyrun):
+            stats['lines'][analyne.filename].add_run(analyne.start, analyne.length)
+        else:
+            stats['lines'][analyne.filename].add(analyne.linenum)
+            if analyne.bugtype:
+                stats['bugs'][analyne.severity or 'total'] += 1
+        stats['files'].add(analyne.filename)
+        for _, key, groups in groupings:
+            _add(groups[key(analyne)], analyne)
+    return _partial(authors, groupby, [(fields, groups) for fields, _, groups in groupings])
+
+
+def _partial(authors, groupby, groupings):
+    """:Return: a partial aggregate.
+
+    :param authors: Dict mapping each author (or `None`) to a dict from :func:`_newauthor`.
+    :param groupby: The groupings asked for, as tuples of fields.
+    :param groupings: ``(fields, groups)`` pairs for each grouping collected, which
+      may include ``('filename',)`` for directories even if not asked for, where
+      `groups` maps tuples of field values to dicts from :func:`_newauthor`.
+    """
+    return {'authors': authors, 'groupby': [tuple(fields) for fields in groupby], 'groups': dict(groupings)}
+
+
+def _merge(stats, other):
+    """Add the stats in `other` to `stats`; both are dicts from :func:`_newauthor`."""
+    lines = stats['lines']
+    for filename, otherlines in other['lines'].iteritems():
+        if filename in lines:
+            lines[filename].update(otherlines.ranges())
+        else:
+            lines[filename] = otherlines
+    for type_ in ('total', 'high', 'med', 'low'):
+        stats['bugs'][type_] += other['bugs'][type_]
+    stats['files'].update(other['files'])
+
+
+def mergepartials(partials):
+    """:Return: the partial aggregate of everything in the partial aggregates `partials`,
+    as if it had all been collected at once.
+
+    Lines in more than one partial aggregate are only counted once, but bugs
+    are counted in each.  The first partial aggregate is updated in place, and
+    the others may share data with it.
+
+    :raises ValueError: if `partials` is empty, or they were not grouped the same way.
+    """
+    partials = iter(partials)
+    try:
+        result = next(partials)
+    except StopIteration:
+        raise ValueError('No partial aggregates to merge')
+    for partial in partials:
+        if partial['groupby'] != result['groupby'] or set(partial['groups']) != set(result['groups']):
+            raise ValueError("Can't merge partial aggregates grouped different ways")
+        for allstats, otherstats in itertools.chain([(result['authors'], partial['authors'])],
+                                                    ((groups, partial['groups'][fields]) for fields, groups in result['groups'].iteritems())):
+            for key, stats in otherstats.iteritems():
+                if key in allstats:
+                    _merge(allstats[key], stats)
+                else:
+                    allstats[key] = stats
+    return result
+
+
+def finish(partial, directories=False, maxdepth=None, minlines=0):
+    """:Return: the stats (as from :func:`getstats`) of partial aggregate `partial`,
+    which is used up in the process.
+
+    :param bool directories: Also give overall stats for every directory; see :func:`rollup`.
+    :param int maxdepth: Only give stats for directories at most this deep.
+    :param int minlines: Only give stats for directories with at least this many lines.
+    :raises ValueError: if `directories` but `partial` wasn't collected with `directories`.
+    """
+    if directories and ('filename',) not in partial['groups']:
+        raise ValueError('To give stats for directories, collect partial aggregates with directories=True')
+    result = _summarize(partial['authors'])
+    groups = dict((fields, _nest(groups)) for fields, groups in partial['groups'].iteritems())
+    if directories:
+        result['directories'] = rollup(groups[('filename',)], maxdepth, minlines)
+    if partial['groupby']:
+        result['groups'] = dict((','.join(fields), groups[fields]) for fields in partial['groupby'])
+    return result
+
+
+class PrettyFloat(float):
+    """A float with a repr that is consistent between Python 2.6 and 2.7/3.x."""
+    def __repr__(self):
+        # A little verbose, but the only way to maintain precision and always have a decimal point.
+        return '{0:.15f}'.format(self)
+
+
+def pretty_floats(obj):
+    """:Return: `obj` with any floats wrapped in a :class:`PrettyFloat`, recursively."""
+    # Adapted from http://stackoverflow.com/a/1733105/171236
+    if isinstance(obj, float):
+        return PrettyFloat(obj)
+    elif isinstance(obj, Mapping):
+        return dict((k, pretty_floats(v)) for k, v in obj.iteritems())
+    elif isinstance(obj, Iterable) and not isinstance(obj, basestring):
+        return map(pretty_floats, obj)
+    return obj
+
+
+def _dumpstats(stats):
+    """:Return: a JSON-able dict of stats from :func:`_newauthor`.  Files are the keys of ``lines``."""
+    return {
+        'lines': dict((filename, lines.__getstate__()) for filename, lines in stats['lines'].iteritems()),
+        'bugs': stats['bugs'],
+    }
+
+
+def _str(value):
+    """:Return: `value`, encoded as a UTF-8 `str` if it is `unicode`, as from :func:`json.load`."""
+    return value.encode('utf-8') if isinstance(value, unicode) else value
+
+
+def _loadstats(obj):
+    """:Return: a dict from :func:`_newauthor` for JSON object `obj` from :func:`_dumpstats`."""
+    stats = _newauthor()
+    for filename, ranges in obj['lines'].iteritems():
+        stats['lines'][_str(filename)].__setstate__(ranges)
+    stats['files'].update(stats['lines'])
+    stats['bugs'].update(obj['bugs'])
+    return stats
+
+
+def dumppartial(partial, outfile):
+    """Write partial aggregate `partial` to `outfile` as JSON, to load with :func:`loadpartial`."""
+    json.dump({
+        'BlameThrower partial': PARTIAL_VERSION,
+        'authors': [[author, _dumpstats(stats)] for author, stats in partial['authors'].iteritems()],
+        'groupby': partial['groupby'],
+        'groups': [[fields, [[key, _dumpstats(stats)] for key, stats in groups.iteritems()]] for fields, groups in partial['groups'].iteritems()],
+    }, outfile, separators=(',', ':'))
+
+
+def loadpartial(infile):
+    """:Return: the partial aggregate in JSON file `infile`, written by :func:`dumppartial`.
+
+    :raises ValueError: if `infile` doesn't hold a partial aggregate we can read.
+    """
+    obj = json.load(infile)
+    if not isinstance(obj, dict) or obj.get('BlameThrower partial') != PARTIAL_VERSION:
+        raise ValueError('Not a version {0} BlameThrower partial aggregate: {1}'.format(PARTIAL_VERSION, getattr(infile, 'name', infile)))
+    authors = defaultdict(_newauthor, ((_str(author), _loadstats(stats)) for author, stats in obj['authors']))
+    groupings = [(tuple(_str(field) for field in fields), defaultdict(_newauthor, ((tuple(_str(value) for value in key), _loadstats(stats)) for key, stats in groups)))
+                 for fields, groups in obj['groups']]
+    return _partial(authors, [tuple(_str(field) for field in fields) for fields in obj['groupby']], groupings)
+
+
+def _add(stats, analyne):
+    """Add `analyne` (or analyrun) to `stats`, a dict from :func:`_newauthor`."""
+    if isinstance(analyne, Analyrun):
+        stats['lines'][analyne.filename].add_run(analyne.start, analyne.length)
+    else:
         stats['lines'][analyne.filename].add(analyne.linenum)
         if analyne.bugtype:
             stats['bugs'][analyne.severity or 'total'] += 1
-        stats['files'].add(analyne.filename)
+    stats['files'].add(analyne.filename)
+
+
+def _finish(stats):
+    """Replace the ``lines`` and ``files`` of `stats`, a dict from :func:`_newauthor`,
+    by their counts, and fill in the totals.
+
+    :Return: `stats`
+    """
+    stats['lines'] = sum(len(lines) for lines in stats['lines'].itervalues())
+    stats['bugs']['total'] += stats['bugs']['high'] + stats['bugs']['med'] + stats['bugs']['low']
+    stats['files'] = len(stats['files'])
+    stats['bugs_per_line'] = stats['bugs']['total'] / stats['lines'] if stats['lines'] else 0
+    return stats
+
+
+def _summarize(authors):
+    """:Return: the :func:`getstats` result for `authors`, a dict mapping each author
+    (or `None`, for unattributed lines) to the stats collected for them.
+
+    The ``lines`` and ``files`` of each author's stats are replaced by their counts.
+    """
+    overall = {
+        'lines': 0,
+        'bugs': {'total': 0, 'high': 0, 'med': 0, 'low': 0},
+        'files': set(),
+        'bugs_per_line': 0.0,
+    }
 
     for stats in authors.itervalues():
         overall['files'].update(stats['files'])
-        stats['lines'] = sum(len(lines) for lines in stats['lines'].itervalues())
-        stats['bugs']['total'] += stats['bugs']['high'] + stats['bugs']['med'] + stats['bugs']['low']
-        stats['files'] = len(stats['files'])
-        stats['bugs_per_line'] = stats['bugs']['total'] / stats['lines'] if stats['lines'] else 0
-
+        _finish(stats)
         overall['lines'] += stats['lines']
         for type_ in ('total', 'high', 'med', 'low'):
             overall['bugs'][type_] += stats['bugs'][type_]
@@ -70,9 +478,76 @@ def getstats(analynes):
 
     result = {
         'overall': overall,
-        'unattributed': authors.pop(None, dict(AUTHOR, lines=0, files=0)),
+        'unattributed': authors.pop(None, dict(_newauthor(), lines=0, files=0)),
         'authors': {},
     }
     if authors:
         result['authors'] = dict(authors)
     return result
+
+
+def _nest(groups):
+    """:Return: `groups`, a dict mapping tuples of field values to the stats collected
+    for them, as nested dicts, one level per field, with each stats dict finished.
+
+    For example, grouping by author and bugtype gives ``result[author][bugtype]``.
+    """
+    result = {}
+    for key, stats in groups.iteritems():
+        level = result
+        for value in key[:-1]:
+            level = level.setdefault(value, {})
+        level[key[-1]] = _finish(stats)
+    return result
+
+
+def _groupings(groupby, directories):
+    """:Return: the list of groupings to collect: those in `groupby`, and, if
+    `directories`, by filename, which directories are rolled up from."""
+    groupings = [tuple(fields) for fields in groupby]
+    if directories and ('filename',) not in groupings:
+        groupings.append(('filename',))
+    return groupings
+
+
+def _directories(filename, maxdepth=None):
+    """:Return: an iterator over the directories containing `filename`, from the top
+    down to `maxdepth` levels deep; the top (depth 0) is ``'.'``."""
+    yield '.'
+    prefix = '/' if filename.startswith('/') else ''
+    parts = [part for part in filename.split('/')[:-1] if part and part != '.']
+    depth = len(parts) if maxdepth is None else min(len(parts), maxdepth)
+    for i in xrange(1, depth + 1):
+        yield prefix + '/'.join(parts[:i])
+
+
+def rollup(filestats, maxdepth=None, minlines=0):
+    """:Return: a dict mapping each directory to the total stats of the files
+    under it, given a dict mapping filenames to their stats (such as
+    ``getstats(analynes, [('filename',)])['groups']['filename']``).
+
+    Directories are the ``/``-separated prefixes of filenames; the top
+    directory, ``'.'``, holds every file, so its stats are the overall stats.
+    Since no two files share a line, each directory's lines and bugs are just
+    sums over its files.
+
+    :param int maxdepth: Only include directories at most this many levels deep.
+    :param int minlines: Only include directories with at least this many lines.
+    """
+    directories = {}
+    for filename, stats in filestats.iteritems():
+        for directory in _directories(filename, maxdepth):
+            total = directories.get(directory)
+            if total is None:
+                total = directories[directory] = dict(_newauthor(), lines=0, files=0)
+            total['lines'] += stats['lines']
+            total['files'] += 1
+            for type_ in ('total', 'high', 'med', 'low'):
+                total['bugs'][type_] += stats['bugs'][type_]
+
+    for directory, total in directories.items():
+        if total['lines'] < minlines:
+            del directories[directory]
+        else:
+            total['bugs_per_line'] = total['bugs']['total'] / total['lines'] if total['lines'] else 0
+    return directories
@@ -0,0 +1,172 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+"""
+Read live bug and blame streams all at once, in threads.
+
+When the inputs are pipes or FIFOs fed by programs that are still running
+(``pylint`` and ``git blame``, say), reading them one after the other leaves
+every program but one blocked on a full pipe, and a program that writes more
+than one of the inputs can block BlameThrower for good.  :func:`parse` reads
+each input in its own thread, so all the programs can run at once.
+
+Bugs and blame each go through a bounded queue, so a producer that gets ahead
+waits for the consumer instead of filling memory.  The exception is blame that
+comes before the bugs are done: :func:`blamethrower.merge` reads all the bugs
+before any blame, so blame waiting on a full queue could keep a program from
+ever writing the bugs.  Until the bugs are done, blame that doesn't fit in its
+queue goes to a temporary file instead, to be read after everything else.
+
+The threads mostly wait on their inputs, so they get along fine with the GIL;
+parsing itself is no faster.  For files already on disk, see
+:mod:`blamethrower.parallel`.
+"""
+
+import itertools
+import sys
+import tempfile
+import threading
+import Queue
+import cPickle as pickle
+
+import blamethrower
+from blamethrower.runs import StringTable, reintern
+
+__all__ = ['parse']
+
+_BATCH = 256            # Items per queue entry, to keep locking down
+_MAXBATCHES = 64        # Queue entries before a producer has to wait
+
+
+class _Failure(object):
+    """An exception raised by a producer thread, to be re-raised by the consumer."""
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+class _Overflow(object):
+    """Batches that didn't fit in a queue, pickled to a temporary file, for any number of threads."""
+    def __init__(self, until):
+        """:param threading.Event until: Take batches only until this is set."""
+        self.until = until
+        self._file = None
+        self._lock = threading.Lock()
+
+    def put(self, batch):
+        """Save `batch`, unless `until` is set.
+
+        :Return: whether it was saved.
+        """
+        with self._lock:
+            if self.until.is_set():
+                return False
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(prefix='blamethrower.')
+            pickle.dump(batch, self._file, pickle.HIGHEST_PROTOCOL)
+            return True
+
+    def batches(self):
+        """:Return: an iterator over the saved batches, for when no more will be put."""
+        if self._file is None:
+            return
+        self._file.seek(0)
+        try:
+            while True:
+                yield pickle.load(self._file)
+        except EOFError:
+            pass
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def _put(queue, item, stop, overflow=None):
+    """Put `item` on `queue`, or in `overflow` if the queue is full and it will take it,
+    unless `stop` is set first."""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return
+        except Queue.Full:
+            if overflow is not None and overflow.put(item):
+                return
+
+
+def _produce(items, queue, stop, overflow):
+    """Thread body: put batches of `items` on `queue` (or `overflow`), then `None`."""
+    try:
+        items = iter(items)
+        while not stop.is_set():
+            batch = list(itertools.islice(items, _BATCH))
+            if not batch:
+                break
+            _put(queue, batch, stop, overflow)
+    except Exception:       # pylint: disable=W0703
+        _put(queue, _Failure(sys.exc_info()), stop)
+    _put(queue, None, stop)
+
+
+def _consume(queue, numproducers, stop, overflow):
+    """:Return: an iterator over the items put on `queue` by `numproducers` producers,
+    in the order they arrive, then any in `overflow`; stop the producers if it is closed early."""
+    try:
+        while numproducers:
+            batch = queue.get()
+            if batch is None:
+                numproducers -= 1
+            elif isinstance(batch, _Failure):
+                raise batch.exc_info[0], batch.exc_info[1], batch.exc_info[2]
+            else:
+                for item in batch:
+                    yield item
+        if overflow is not None:
+            for batch in overflow.batches():
+                for item in batch:
+                    yield item
+    finally:
+        stop.set()
+
+
+def _start(inputs, maxbatches, stop, overflow=None):
+    """Start a thread for each of the ``(infile, items)`` pairs `inputs`, to read the items from the file.
+
+    :param threading.Event stop: Set when the returned iterator is done or closed.
+    :param _Overflow overflow: Where to put batches that don't fit in the queue, while it takes them.
+    :Return: an iterator over all their items.
+    """
+    queue = Queue.Queue(maxbatches)
+    for infile, items in inputs:
+        thread = threading.Thread(target=_produce, args=(items, queue, stop, overflow), name='read ' + str(getattr(infile, 'name', infile)))
+        thread.daemon = True
+        thread.start()
+    return _consume(queue, len(inputs), stop, overflow)
+
+
+def parse(bugsfiles=(), blamefiles=(), authors=None, maxbatches=_MAXBATCHES):
+    """Read and parse all `bugsfiles` and `blamefiles` at once, each in its own thread.
+
+    :Return: a ``(bugs, blame)`` pair of iterators, giving the same output as
+      chaining :func:`blamethrower.getbugs` over `bugsfiles` and
+      :func:`blamethrower.getblame` (or :func:`blamethrower.getblameruns`, if
+      `authors` is given) over `blamefiles`, respectively, except that items
+      from different inputs are interleaved in the order they're read.
+    :param bugsfiles: ``(analyzer_name, bugsfile, options)`` triples.
+    :param blamefiles: ``(repo_name, blamefile, options)`` triples.
+    :param StringTable authors: Return blame as :class:`blamethrower.runs.BlameRuns`,
+      with author names interned in this table.
+    :param int maxbatches: Buffer at most this many batches of bugs, and of blame; until
+      the bugs are all read, more blame goes to a temporary file.
+    :rtype: (iter(Analyne), iter((str, list(str))))
+    """
+    # Look up the modules here, so no thread has to import anything.
+    bugs = [(infile, blamethrower.getbugs(name, infile, **options)) for name, infile, options in bugsfiles]       # pylint: disable=W0142
+    if authors is None:
+        blame = [(infile, blamethrower.getblame(name, infile, **options)) for name, infile, options in blamefiles]       # pylint: disable=W0142
+    else:
+        # Each thread gets its own table, since StringTable isn't thread-safe.
+        blame = [(infile, blamethrower.getblameruns(name, infile, StringTable(), **options)) for name, infile, options in blamefiles]       # pylint: disable=W0142
+    bugsdone = threading.Event()
+    if not bugs:
+        bugsdone.set()
+    bugs, blame = _start(bugs, maxbatches, bugsdone), _start(blame, maxbatches, threading.Event(), _Overflow(bugsdone))
+    return bugs, blame if authors is None else reintern(blame, authors)
@@ -0,0 +1,108 @@
+# Copyright 2012 John Kleint
+# This is free software, licensed under the MIT License; see LICENSE.txt.
+
+r"""
+Read and write analynes as tab-separated values, quickly.
+
+One row per line of code, with fields in the order of
+:class:`blamethrower.Analyne`; `None` is an empty field.  Tabs and newlines in
+fields are written as the two-character escape sequences \t and \n; nothing
+else is escaped, so reading does not unescape them.
+
+Rather than stringifying and escaping each field, :func:`write` formats each
+row with one ``%`` and only escapes the rare row that has too many tabs or
+newlines.  Runs of lines are written without making an analyne per line, and
+rows are written in large batches.  :func:`read` reads and parses many rows at once.
+"""
+
+import itertools
+
+import blamethrower
+
+__all__ = ['HEADER', 'rows', 'write', 'read']
+
+#: The header row.
+HEADER = '\t'.join(('filename', 'linenum', 'bugtype', 'severity', 'author')) + '\n'
+
+_BATCHSIZE = 8192           # Rows per writelines()
+_READSIZE = 1 << 20         # Bytes per read()
+
+
+def _escape(val):
+    """:Return: `val` as a string, with tabs and newlines escaped."""
+    return str('' if val is None else val).replace('\t', '\\t').replace('\n', '\\n')
+
+
+def _slowrow(filename, linenum, bugtype, severity, author):
+    """:Return: the row for the given fields, escaping every field."""
+    return '\t'.join(_escape(val) for val in (filename, linenum, bugtype, severity, author)) + '\n'
+
+
+def rows(analynes):
+    """:Return: an iterator over the TSV rows (with newlines) of `analynes`, which may
+    include :class:`blamethrower.Analyrun` runs, which give a row for each line."""
+    Analyrun = blamethrower.Analyrun         # pylint: disable=C0103
+    for analyne in analynes:
+        if analyne.__class__ is Analyrun:
+            filename, start, length, author = analyne
+            prefix, suffix = '%s\t' % (filename,), '\t\t\t%s\n' % ('' if author is None else author,)
+            if prefix.count('\t') != 1 or '\n' in prefix or suffix.count('\t') != 3 or suffix.count('\n') != 1:
+                prefix, suffix = _escape(filename) + '\t', '\t\t\t' + _escape(author) + '\n'
+            for linenum in xrange(start, start + length):
+                yield prefix + str(linenum) + suffix
+        else:
+            filename, linenum, bugtype, severity, author = analyne
+            row = '%s\t%s\t%s\t%s\t%s\n' % (filename, linenum, '' if bugtype is None else bugtype,
+                                            '' if severity is None else severity, '' if author is None else author)
+            if row.count('\t') != 4 or row.count('\n') != 1:
+                row = _slowrow(filename, linenum, bugtype, severity, author)
+            yield row
+
+
+def write(analynes, outfile, header=True):
+    """Write `analynes` (which may include :class:`blamethrower.Analyrun` runs) to
+    `outfile` as tab-separated values, with a header row if `header`."""
+    if header:
+        outfile.write(HEADER)
+    allrows = rows(analynes)
+    while True:
+        batch = list(itertools.islice(allrows, _BATCHSIZE))
+        if not batch:
+            break
+        outfile.writelines(batch)
+
+
+def _parse(lines):
+    """:Return: a list of :class:`blamethrower.Analyne` for the rows in string `lines`,
+    which has no trailing newline.
+
+    :raises ValueError: if a row doesn't have five fields.
+    """
+    Analyne = blamethrower.Analyne      # pylint: disable=C0103
+    return [Analyne(filename or None, int(linenum), bugtype or None, severity or None, author or None)
+            for filename, linenum, bugtype, severity, author in (row.split('\t') for row in lines.split('\n'))]
+
+
+def read(infile, header=False):
+    """:Return: an iterator over the :class:`blamethrower.Analyne` namedtuples in
+    tab-separated values file `infile`, skipping a header row if `header`.
+
+    :raises ValueError: for a row that doesn't have five fields, or a bad line number.
+    """
+    if header:
+        infile.readline()
+    rest = ''
+    while True:
+        data = infile.read(_READSIZE)
+        if not data:
+            break
+        end = data.rfind('\n')
+        if end < 0:
+            rest += data
+            continue
+        lines, rest = rest + data[:end], data[end + 1:]
+        for analyne in _parse(lines):
+            yield analyne
+    if rest:
+        for analyne in _parse(rest):
+            yield analyne
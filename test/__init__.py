@@ -40,6 +40,27 @@ class AnalyneTest(unittest.TestCase):
         """
         return chain.from_iterable(getblame(repo, open_datafile('reporeaders', '{0}.{1}.txt.bz2'.format(project, repo)), **(options or {}).get(repo, {})) for (repo, project) in sorted(repo2project.iteritems()))
 
+    @staticmethod
+    def some_filters(analynes):
+        """:Return: a list of dicts of filters (as for :func:`blamethrower.sqlstore.select`) to try on `analynes`,
+        including paths that are directories, with and without a trailing slash, and a path that is only a prefix."""
+        author = analynes[0].author
+        bugtype = next(analyne.bugtype for analyne in analynes if analyne.bugtype)
+        filename = next((analyne.filename for analyne in reversed(analynes) if '/' in analyne.filename), analynes[-1].filename)
+        directory = filename.partition('/')[0]
+        bug = next((analyne for analyne in analynes if analyne.bugtype and analyne.filename.startswith(directory + '/')), analynes[0])
+        return [{}, {'author': author}, {'path': directory}, {'path': directory + '/'}, {'path': filename}, {'path': filename[:-1]},
+                {'bugtype': bugtype}, {'severity': 'high'}, {'author': bug.author, 'path': directory + '/', 'severity': bug.severity},
+                {'author': 'nobody'}]
+
+    @staticmethod
+    def matches(analyne, filters):
+        """:Return: whether `analyne` matches all of dict `filters`, as from :meth:`some_filters`."""
+        if not all(getattr(analyne, field) == value for field, value in filters.iteritems() if field != 'path'):
+            return False
+        path = filters.get('path')
+        return path is None or analyne.filename == path.rstrip('/') or analyne.filename.startswith(path.rstrip('/') + '/')
+
     def assert_sets_equal(self, expected, actual):
         """Assert `expected` is equal to `actual` and print useful message if not."""
         for item in expected:
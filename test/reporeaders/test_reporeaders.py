@@ -3,9 +3,23 @@
 
 """BlameThrower source code repository reader unit tests."""
 
-import unittest
+try:
+    import unittest2 as unittest        # For skipTest on Python 2.6
+except ImportError:
+    import unittest
+import itertools
+import tempfile
+import shutil
+import subprocess
+import os
+import warnings
+import cPickle as pickle
 
-from test import AnalyneTest
+import blamethrower.parallel
+from blamethrower.cache import BlameCache
+from blamethrower.reporeaders import git, hg, gitcollect, hgcollect
+from blamethrower.runs import StringTable
+from test import AnalyneTest, open_datafile
 
 
 class RepoReaderTests(AnalyneTest):
@@ -21,6 +35,245 @@ class RepoReaderTests(AnalyneTest):
     def test_os_utils_git(self):    # https://github.com/casser/os-utils 637015569b2bf8e2d83406e234b5e8d667b06193 2012 Sep 05
         self.assert_analynes_equal('reporeaders', 'git', 'os-utils')
 
+    def test_git_get_authors_streams(self):
+        commit1, commit2 = 'a' * 40, 'b' * 40
+        porcelain = [commit1 + ' 1 1 2\n', 'author Alice\n', 'author-mail <alice@example.com>\n', '\tline 1\n',
+                     commit1 + ' 2 2\n', '\tline 2\n',
+                     commit2 + ' 1 3 1\n', 'author Bob\n', 'filename foo.py\n', '\tline 3\n']
+        consumed = []
+        authors = git.get_authors(consumed.append(line) or line for line in itertools.chain(porcelain, itertools.repeat('\tunreachable\n')))
+        self.assertEqual(list(itertools.islice(authors, 4)), [None, 'Alice', 'Alice', 'Bob'])
+        self.assertEqual(consumed, porcelain[:-2])      # Each author comes out as soon as it's known
+        self.assertEqual(list(git.get_authors(porcelain + [commit2 + ' 2 4\n'])), [None, 'Alice', 'Alice', 'Bob', 'Bob'])
+        self.assertRaises(AssertionError, list, git.get_authors(porcelain[:4] + porcelain[6:]))
+
+    def test_git_commits(self):
+        commit1, commit2 = 'a' * 40, 'b' * 40
+        header1 = [commit1 + ' 1 1 1\n', 'author Alice\n', 'author-mail <alice@example.com>\n', 'author-time 1330000000\n', 'filename a.py\n']
+        header2 = [commit2 + ' 1 2 1\n', 'author Bob\n', 'author-mail <bob@example.com>\n', 'author-time 1340000000\n', 'filename a.py\n']
+        blame = (['>>> git-blame output for: a.py <<<\n'] + header1 + ['\tline 1\n'] + header2 + ['\tline 2\n'] +
+                 ['>>> git-blame output for: b.py <<<\n', commit2 + ' 2 1 1\n', 'author Bob\n', 'author-mail <bob@example.com>\n',
+                  'author-time 1340000000\n', 'filename b.py\n', '\tline 1\n'])
+        commits = git.CommitTable()
+        self.assertEqual([(filename, ids.tolist()) for filename, ids in git.read_commits(blame, commits)], [('a.py', [-1, 0, 1]), ('b.py', [-1, 1])])
+        self.assertEqual(len(commits), 2)
+        self.assertEqual(commits[0], git.Commit(commit1, 'Alice', '<alice@example.com>', 1330000000))
+        self.assertEqual(commits[1], git.Commit(commit2, 'Bob', '<bob@example.com>', 1340000000))
+        self.assertEqual(list(git.read(blame)), [('a.py', [None, 'Alice', 'Bob']), ('b.py', [None, 'Bob'])])
+        self.assertEqual(list(git.get_authors([commit2 + ' 1 1 1\n', '\tline 1\n'], commits)), [None, 'Bob'])       # Already known
+
+    def test_hg_parse_author(self):
+        lines = open_datafile('reporeaders', 'shove.hg.txt.bz2').readlines()
+        lines += ['a  <b@c>  \n', 'x <@c>\n', 'x <b@c> y\n', 'A <x> B <c@d>\n', 'a <b@c@d>\n', '\t lcr \t\n', '\n', ' \t\n']
+        for line in lines:
+            match = hg.AUTHOR_RE.match(line)
+            self.assertEqual(hg.parse_author(line), match.group('author') if match else None)
+
+    def test_hgcollect_output(self):
+        # Recorded from `hg annotate --user --template hgcollect.TEMPLATE` (Mercurial 7.2.4) on a.py, an empty
+        # file, a binary image.png, and sub dir/b.txt: there's a header for every file, even binary and empty ones.
+        output = open_datafile('reporeaders', 'hgcollect.hg.txt.bz2').readlines()
+        self.assertEqual(len(output), 9)
+        expected = [('a.py', [None, 'Alice', 'bob', 'Alice', 'bob']), ('sub dir/b.txt', [None, 'Alice'])]
+        self.assertEqual(list(hg.read(output)), expected)
+        authors = StringTable()
+        self.assertEqual([(filename, blameruns.tolist()) for filename, blameruns in hg.read_runs(output, authors)], expected)
+        self.assertRaises(ValueError, list, hg.read(output[1:]))
+
+    def test_parse_chunks(self):
+        minchunk = blamethrower.parallel._MINCHUNK
+        blamethrower.parallel._MINCHUNK = 4096       # So our little test files get split
+        try:
+            for reader, project in ((git, 'httpbin'), (git, 'os-utils'), (hg, 'shove')):
+                with tempfile.TemporaryFile() as blamefile:
+                    blamefile.write(open_datafile('reporeaders', '{0}.{1}.txt.bz2'.format(project, reader.__name__.split('.')[-1])).read())
+                    blamefile.seek(0)
+                    expected = list(reader.read(blamefile))
+                    for jobs in (1, 2, 3):
+                        blamefile.seek(0)
+                        self.assertEqual(list(reader.read(blamefile, jobs=jobs)), expected)
+                        blamefile.seek(0)
+                        authors = StringTable()
+                        actual = list(reader.read_runs(blamefile, authors, jobs=str(jobs)))      # Options come from the command line as strings
+                        self.assertEqual([(filename, blameruns.tolist()) for filename, blameruns in actual], expected)
+                        self.assertTrue(all(blameruns.authors is authors for _, blameruns in actual))
+        finally:
+            blamethrower.parallel._MINCHUNK = minchunk
+
+    def test_split(self):
+        header = '>>> header: '
+        buf = ''.join('{0}{1} <<<\nline\n'.format(header, i) for i in xrange(10))
+        for numchunks in (1, 2, 3, 10, 20):
+            chunks = blamethrower.parallel.split(buf, header, numchunks)
+            self.assertEqual(''.join(buf[start:end] for start, end in chunks), buf)
+            self.assertTrue(all(buf[start:].startswith(header) for start, _ in chunks))
+            self.assertEqual(len(chunks), min(numchunks, 10))
+
+
+def _have_git():
+    """:Return: whether the git command is available."""
+    try:
+        subprocess.Popen(['git', '--version'], stdout=subprocess.PIPE).communicate()
+    except OSError:
+        return False
+    return True
+
+
+def _have_hg():
+    """:Return: whether the hg command is available."""
+    try:
+        subprocess.Popen(['hg', '--version'], stdout=subprocess.PIPE).communicate()
+    except OSError:
+        return False
+    return True
+
+
+class HgCollectTests(unittest.TestCase):
+    def setUp(self):
+        if not _have_hg():
+            self.skipTest('hg not available')
+        self.repo = tempfile.mkdtemp(prefix='blamethrower.')
+        subprocess.check_call(['hg', 'init'], cwd=self.repo)
+        self.commit('Alice <alice@example.com>', {'a.py': 'one\ntwo\nthree\n', 'sub dir/b.txt': 'bee\n', 'empty': '', 'binary': '\0\1\2\n'})
+        self.commit('Bob <bob@example.com>', {'a.py': 'one\nTWO\nthree\nfour\n'})
+
+    def commit(self, user, files):
+        """Commit `files`, a dict of filename to contents, as `user`."""
+        for filename, contents in files.iteritems():
+            path = os.path.join(self.repo, filename)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as outfile:
+                outfile.write(contents)
+        subprocess.check_call(['hg', 'commit', '-q', '-A', '-u', user, '-m', 'Commit'], cwd=self.repo)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+
+    def test_collect(self):
+        expected = [('a.py', [None, 'Alice', 'Bob', 'Alice', 'Bob']), ('sub dir/b.txt', [None, 'Alice'])]       # No binary or empty files
+        self.assertEqual(hgcollect.listfiles(self.repo), ['a.py', 'binary', 'empty', 'sub dir/b.txt'])
+        for jobs, batchsize in ((1, 100), (2, 1), (8, 3)):
+            self.assertEqual(list(hgcollect.collect(self.repo, jobs=jobs, batchsize=batchsize)), expected)
+        self.assertEqual(list(hgcollect.collect(self.repo, rev='0', files=['a.py'])), [('a.py', [None, 'Alice', 'Alice', 'Alice'])])
+        authors = StringTable()
+        self.assertEqual([(filename, blameruns.tolist()) for filename, blameruns in hgcollect.collect_runs(self.repo, authors)], expected)
+        try:
+            list(hgcollect.collect(self.repo, files=['nonexistent']))
+            self.fail('hg annotate of a nonexistent file succeeded')
+        except subprocess.CalledProcessError as err:
+            self.assertTrue('nonexistent' in err.output)
+
+
+class GitCollectTests(unittest.TestCase):
+    def setUp(self):
+        if not _have_git():
+            self.skipTest('git not available')
+        self.repo = tempfile.mkdtemp(prefix='blamethrower.')
+        subprocess.check_call(['git', 'init', '-q'], cwd=self.repo)
+        self.commit('Alice', {'a.py': 'one\ntwo\nthree\n', 'sub dir/b.txt': 'bee\n', 'empty': ''})
+        self.commit('Bob', {'a.py': 'one\nTWO\nthree\nfour\n'})
+
+    def commit(self, author, files):
+        """Commit `files`, a dict of filename to contents, as `author`."""
+        for filename, contents in files.iteritems():
+            path = os.path.join(self.repo, filename)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as outfile:
+                outfile.write(contents)
+        env = dict(os.environ, GIT_AUTHOR_NAME=author, GIT_AUTHOR_EMAIL='a@example.com', GIT_COMMITTER_NAME=author, GIT_COMMITTER_EMAIL='a@example.com')
+        for cmd in (['git', 'add', '-A'], ['git', 'commit', '-q', '-m', 'Commit']):
+            subprocess.check_call(cmd, cwd=self.repo, env=env)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+
+    def test_collect(self):
+        expected = [('a.py', [None, 'Alice', 'Bob', 'Alice', 'Bob']), ('empty', [None]), ('sub dir/b.txt', [None, 'Alice'])]
+        self.assertEqual(gitcollect.listfiles(self.repo), [filename for filename, _ in expected])
+        for jobs in (1, 2, 8):
+            self.assertEqual(list(gitcollect.collect(self.repo, jobs=jobs)), expected)
+        self.assertEqual(list(gitcollect.collect(self.repo, rev='HEAD~1', files=['a.py'])), [('a.py', [None, 'Alice', 'Alice', 'Alice'])])
+        authors = StringTable()
+        self.assertEqual([(filename, blameruns.tolist()) for filename, blameruns in gitcollect.collect_runs(self.repo, authors)], expected)
+        try:
+            list(gitcollect.collect(self.repo, files=['nonexistent']))
+            self.fail('git blame of a nonexistent file succeeded')
+        except subprocess.CalledProcessError as err:
+            self.assertTrue('nonexistent' in err.output)
+
+    def test_cache(self):
+        expected = list(gitcollect.collect(self.repo))
+        cache = BlameCache(os.path.join(self.repo, '.git', 'blamecache'))
+        self.assertEqual(list(gitcollect.collect(self.repo, cache=cache)), expected)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 3, 3))
+        def noblame(*args):
+            """Fail, since everything should come from the cache."""
+            raise AssertionError("Blamed {0}".format(args))
+
+        oldblame, gitcollect.blame = gitcollect.blame, noblame
+        try:
+            cache = BlameCache(cache.directory)
+            self.assertEqual(list(gitcollect.collect(self.repo, cache=cache)), expected)
+            self.assertEqual(list(gitcollect.collect(self.repo, cache=cache, files=['a.py'])), expected[:1])
+        finally:
+            gitcollect.blame = oldblame
+        self.assertEqual((cache.hits, cache.misses), (4, 0))
+
+        self.commit('Carol', {'a.py': 'ONE\nTWO\nthree\nfour\n'})
+        cache = BlameCache(cache.directory)
+        self.assertEqual(list(gitcollect.collect(self.repo, cache=cache)), [('a.py', [None, 'Carol', 'Bob', 'Alice', 'Bob'])] + expected[1:])
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+        cache.maxsize = 1
+        cache.put(BlameCache.key('new'), [None, 'Carol'])
+        self.assertEqual(len(cache), 0)
+        cache.maxsize = 1 << 20
+        cache.put(BlameCache.key('new'), [None, 'Carol', 'Carol', 'Dave'])
+        self.assertEqual(cache.get(BlameCache.key('new')), [None, 'Carol', 'Carol', 'Dave'])
+        self.assertEqual(cache.get(BlameCache.key('old')), None)
+        for _ in xrange(3):     # Replacing an entry doesn't count it twice.
+            cache.put(BlameCache.key('new'), [None, 'Carol', 'Carol', 'Dave'])
+        self.assertEqual(cache._size, sum(size for _, size, _ in cache._entries()))
+
+        for i, data in enumerate(['garbage', pickle.dumps(5), pickle.dumps(('Carol', 'runs')), pickle.dumps((['Carol'], [1, 2])),
+                                  pickle.dumps((['Carol'], [2 ** 70])), pickle.dumps((['Carol'], None)), pickle.dumps(((), [0, 1, 7]))[:-3]]):
+            key = BlameCache.key('corrupt', str(i))
+            cache.put(key, [None, 'Carol'])
+            with open(cache._path(key), 'wb') as outfile:
+                outfile.write(data)
+            self.assertEqual(cache.get(key), None, data)
+            self.assertFalse(os.path.exists(cache._path(key)))
+
+    def test_timeout(self):
+        slowgit = os.path.join(self.repo, 'slowgit')
+        with open(slowgit, 'w') as outfile:
+            outfile.write('#!/bin/sh\nexec sleep 10\n')
+        os.chmod(slowgit, 0755)
+        oldgit, gitcollect.GIT = gitcollect.GIT, slowgit
+        try:
+            with warnings.catch_warnings(record=True) as warnlist:
+                warnings.simplefilter('always')
+                self.assertEqual(list(gitcollect.collect(self.repo, timeout=0.1, files=['a.py', 'empty'])), [])
+        finally:
+            gitcollect.GIT = oldgit
+        self.assertEqual([warning.message.filename for warning in warnlist], ['a.py', 'empty'])
+        self.assertTrue(all(warning.category is gitcollect.BlameTimeoutWarning for warning in warnlist))
+
+
+    def test_noisy_stderr(self):
+        noisygit = os.path.join(self.repo, 'noisygit')
+        with open(noisygit, 'w') as outfile:
+            outfile.write('#!/bin/sh\nhead -c 1000000 /dev/zero >&2\nexec git "$@"\n')      # Much more than a pipe holds
+        os.chmod(noisygit, 0755)
+        oldgit, gitcollect.GIT = gitcollect.GIT, noisygit
+        try:
+            # With a timeout, so blocking on stderr fails rather than hangs.
+            self.assertEqual(gitcollect.blame(self.repo, 'a.py', timeout=30), [None, 'Alice', 'Bob', 'Alice', 'Bob'])
+        finally:
+            gitcollect.GIT = oldgit
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
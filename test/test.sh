@@ -20,6 +20,7 @@ function statsfilter {
 cd "$dir"/test
 errfile=blamethrower.err
 outfile=blamethrower.out
+dbfile=blamethrower.db
 IFS=.       # Ahh, the joys of bash string manipulation. :)
 
 # Single module functional tests.
@@ -51,8 +52,13 @@ for datafile in *.tsv.bz2; do
     "${blamethrower[@]}" $(cat "$project.$repo.$analyzer.opts" 2>/dev/null) "--$repo" <(bzcat reporeaders/"$project.$repo.txt.bz2") "--$analyzer" <(bzcat analyzers/"$project.$analyzer.txt.bz2") 2> "$errfile" > "$outfile"
     diff -u0 --label="$statfile" <(bzcat "$statfile" | statsfilter) --label="$outfile" <(statsfilter < "$outfile")
     diff -u0 "$(ls "$project.$repo.$analyzer.err" 2>/dev/null || ls /dev/null)" "$errfile"
+    "$dir/bin/blamethrower-reduce" <("${blamethrower[@]}" --partial $(cat "$project.$repo.$analyzer.opts" 2>/dev/null) "--$repo" <(bzcat reporeaders/"$project.$repo.txt.bz2") "--$analyzer" <(bzcat analyzers/"$project.$analyzer.txt.bz2") 2> /dev/null) > "$outfile"
+    diff -u0 --label="$statfile" <(bzcat "$statfile" | statsfilter) --label="$outfile" <(statsfilter < "$outfile")
+    "${blamethrower[@]}" --store "$dbfile" $(cat "$project.$repo.$analyzer.opts" 2>/dev/null) "--$repo" <(bzcat reporeaders/"$project.$repo.txt.bz2") "--$analyzer" <(bzcat analyzers/"$project.$analyzer.txt.bz2") 2> /dev/null
+    "$dir/bin/blamethrower-query" "$dbfile" > "$outfile"
+    diff -u0 --label="$statfile" <(bzcat "$statfile" | statsfilter) --label="$outfile" <(statsfilter < "$outfile")
     echo -n .
 done
 
-rm "$errfile" "$outfile"
+rm "$errfile" "$outfile" "$dbfile"
 echo -e "\nOK"
@@ -9,9 +9,33 @@ import itertools
 import random
 from collections import defaultdict
 import warnings
+import tempfile
+import shutil
+import cPickle as pickle
+from cStringIO import StringIO
+from contextlib import closing
+from gzip import GzipFile
+import bz2
+import os
+import threading
+import json
+import argparse
+import urllib2
 
 import blamethrower.stats
-from test import AnalyneTest
+import blamethrower.parallel
+import blamethrower.extsort
+import blamethrower.columns
+import blamethrower.columnfile
+import blamethrower.instrument
+import blamethrower.compressed
+import blamethrower.tsv
+import blamethrower.dedup
+import blamethrower.streams
+import blamethrower.server
+import blamethrower.sqlstore
+from blamethrower.runs import StringTable, BlameRuns
+from test import AnalyneTest, open_datafile
 
 
 class BlamethrowerTest(AnalyneTest):
@@ -84,12 +108,553 @@ class BlamethrowerTest(AnalyneTest):
         self.assert_stats_correct({'hg': 'shove'}, {'pylint': 'shove'})
         self.assert_stats_correct({'git': 'os-utils'}, {'findbugs': 'os-utils'}, {'findbugs': {'prefix': 'src/'}})
 
+    def test_groupby(self):
+        groupby = [blamethrower.stats.parse_groupby(fields) for fields in ('author,bugtype', 'filename', 'severity', 'bugtype,filename,author')]
+        with warnings.catch_warnings(record=True):
+            analynes = list(blamethrower.merge(self.readbugs({'pylint': 'httpbin'}), self.readblame({'git': 'httpbin'})))
+        stats = blamethrower.stats.getstats(analynes, groupby)
+        self.assertEqual(dict((key, value) for key, value in stats.iteritems() if key != 'groups'), blamethrower.stats.getstats(analynes))
+        self.assertEqual(sorted(stats['groups']), ['author,bugtype', 'bugtype,filename,author', 'filename', 'severity'])
+        for fields in groupby:
+            keys = set(tuple(getattr(analyne, field) for field in fields) for analyne in analynes)
+            self.assertTrue(len(keys) > 1)
+            for key in keys:
+                groupstats = stats['groups'][','.join(fields)]
+                for value in key:
+                    groupstats = groupstats[value]
+                self.assertEqual(groupstats, self.get_correct_stats(analynes, lambda a: tuple(getattr(a, field) for field in fields) == key))
+
+        self.assertEqual(blamethrower.stats.getstats(blamethrower.merge(None, [('a', [None, 'x', 'x', 'y'])]), [('bugtype', 'author')])['groups'],
+                         {'bugtype,author': {None: {'x': {'lines': 2, 'files': 1, 'bugs': {'total': 0, 'high': 0, 'med': 0, 'low': 0}, 'bugs_per_line': 0},
+                                                    'y': {'lines': 1, 'files': 1, 'bugs': {'total': 0, 'high': 0, 'med': 0, 'low': 0}, 'bugs_per_line': 0}}}})
+        tables = blamethrower.columns.Tables()
+        self.assertEqual(blamethrower.columns.getstats(blamethrower.columns.tobatches(analynes, tables, 100), groupby), stats)
+        self.assertEqual(blamethrower.columns.getstats([], groupby)['groups'], blamethrower.stats.getstats([], groupby)['groups'])
+        self.assertRaises(ValueError, blamethrower.stats.parse_groupby, 'author,linenum')
+        self.assertRaises(ValueError, blamethrower.stats.parse_groupby, 'author,author')
+        self.assertEqual(blamethrower.stats.groupby_arg('author,bugtype'), ('author', 'bugtype'))
+        self.assertRaises(argparse.ArgumentTypeError, blamethrower.stats.groupby_arg, 'author,linenum')
+
+    def test_directories(self):
+        with warnings.catch_warnings(record=True):
+            analynes = list(blamethrower.merge(self.readbugs({'findbugs': 'os-utils'}, {'findbugs': {'prefix': 'src/'}}), self.readblame({'git': 'os-utils'})))
+        stats = blamethrower.stats.getstats(analynes, directories=True)
+        self.assertFalse('groups' in stats)
+        directories = stats['directories']
+        self.assertEqual(directories['.'], stats['overall'])
+        expected = set(['.'])
+        for analyne in analynes:
+            parts = analyne.filename.split('/')[:-1]
+            expected.update('/'.join(parts[:i]) for i in xrange(1, len(parts) + 1))
+        self.assertEqual(set(directories), expected)
+        for directory in expected:
+            self.assertEqual(directories[directory], self.get_correct_stats(analynes, lambda a: directory == '.' or a.filename.startswith(directory + '/')))
+
+        limited = blamethrower.stats.getstats(analynes, [('filename',)], directories=True, maxdepth=2, minlines=500)
+        self.assertTrue('filename' in limited['groups'])
+        self.assertEqual(limited['directories'], dict((directory, stats) for directory, stats in directories.iteritems()
+                                                      if directory.count('/') < 2 and stats['lines'] >= 500))
+        self.assertTrue(1 < len(limited['directories']) < len(directories))
+        tables = blamethrower.columns.Tables()
+        self.assertEqual(blamethrower.columns.getstats(blamethrower.columns.tobatches(analynes, tables), directories=True), stats)
+        self.assertEqual(sorted(blamethrower.stats.rollup({'/a/b.py': stats['overall'], './c.py': stats['overall']})), ['.', '/a'])
+
     def test_merge(self):
         self.assert_merge_works({'git': 'httpbin'}, {'pylint': 'httpbin'})
         self.assert_merge_works({'git': 'apricot'}, {'jslint': 'apricot'})
         self.assert_merge_works({'hg': 'shove'}, {'pylint': 'shove'})
         self.assert_merge_works({'git': 'os-utils'}, {'findbugs': 'os-utils'}, {'findbugs': {'prefix': 'src/'}})
 
+    def test_blameruns(self):
+        authors = StringTable()
+        blameruns = BlameRuns.fromauthors([None, 'a', 'a', 'b', 'a', 'a', 'a'], authors)
+        self.assertEqual(list(blameruns), [(1, 2, 0), (3, 1, 1), (4, 3, 0)])
+        self.assertEqual(len(blameruns), 6)
+        self.assertEqual(blameruns.tolist(), [None, 'a', 'a', 'b', 'a', 'a', 'a'])
+        self.assertEqual(authors.strings, ['a', 'b'])
+        self.assertEqual(len(BlameRuns(authors)), 0)
+
+    def test_merge_runs(self):
+        for repo2project, analyzer2project, options in (({'git': 'httpbin'}, {'pylint': 'httpbin'}, None),
+                                                        ({'git': 'apricot'}, {'jslint': 'apricot'}, None),
+                                                        ({'hg': 'shove'}, {'pylint': 'shove'}, None),
+                                                        ({'git': 'os-utils'}, {'findbugs': 'os-utils'}, {'findbugs': {'prefix': 'src/'}})):
+            blame = list(self.readblame(repo2project, options))
+            authors = StringTable()
+            blameruns = list(itertools.chain.from_iterable(blamethrower.getblameruns(repo, open_datafile('reporeaders', '{0}.{1}.txt.bz2'.format(project, repo)), authors)
+                                                           for repo, project in sorted(repo2project.iteritems())))
+            self.assertEqual(blameruns, [(filename, BlameRuns.fromauthors(authorlist, authors)) for filename, authorlist in blame])
+            with warnings.catch_warnings(record=True) as expected_warnings:
+                expected = list(blamethrower.merge(self.readbugs(analyzer2project, options), blame))
+            with warnings.catch_warnings(record=True) as actual_warnings:
+                actual = list(blamethrower.merge(self.readbugs(analyzer2project, options), blameruns))
+            self.assertEqual([str(warning.message) for warning in actual_warnings], [str(warning.message) for warning in expected_warnings])
+            self.assertTrue(len(actual) < len(expected))
+            self.assertEqual(list(blamethrower.expand_runs(actual)), expected)
+            self.assertEqual(blamethrower.stats.getstats(actual), blamethrower.stats.getstats(expected))
+            self.assertEqual(blamethrower.stats.getstats(blamethrower.merge(None, blameruns + blameruns)), blamethrower.stats.getstats(blamethrower.merge(None, blame)))
+
+    def test_lineset(self):
+        for maxline, numlines, numruns in ((10, 5, 0), (100, 50, 3), (70000, 100, 0), (300000, 20000, 10), (200000, 0, 30), (140000, 140000, 5)):
+            lineset, expected = blamethrower.stats.LineSet(), set()
+            for _ in xrange(numlines):
+                linenum = random.randint(1, maxline)
+                lineset.add(linenum)
+                expected.add(linenum)
+            for _ in xrange(numruns):
+                start, length = random.randint(1, maxline), random.randint(1, maxline // 4)
+                lineset.add_run(start, length)
+                expected.update(xrange(start, start + length))
+            self.assertEqual(len(lineset), len(expected))
+
+    def test_lineset_ranges(self):
+        lineset = blamethrower.stats.LineSet()
+        for linenum in range(1, 5000, 3) + [70000, 70001, 70003]:
+            lineset.add(linenum)
+        lineset.add_run(10, 20)
+        lineset.add_run(69990, 12)
+        expected = set(range(1, 5000, 3) + [70000, 70001, 70003] + range(10, 30) + range(69990, 70002))
+        ranges = list(lineset.ranges())
+        self.assertEqual(sorted(itertools.chain.from_iterable(xrange(start, end) for start, end in ranges)), sorted(expected))
+        self.assertTrue(all(end < nextstart for (_, end), (nextstart, _) in zip(ranges, ranges[1:])))
+        copy = pickle.loads(pickle.dumps(lineset))
+        self.assertEqual(list(copy.ranges()), ranges)
+        other = blamethrower.stats.LineSet()
+        other.update([(1, 3), (70003, 70010)])
+        other.update(lineset.ranges())
+        self.assertEqual(len(other), len(expected | set([2]) | set(range(70003, 70010))))
+
+    def test_partial(self):
+        groupby = [('author', 'bugtype'), ('severity',)]
+        with warnings.catch_warnings(record=True):
+            analynes = list(blamethrower.merge(self.readbugs({'findbugs': 'os-utils'}, {'findbugs': {'prefix': 'src/'}}), self.readblame({'git': 'os-utils'})))
+        expected = blamethrower.stats.getstats(analynes, groupby, directories=True, maxdepth=3)
+        filenames = sorted(set(analyne.filename for analyne in analynes))
+        for numshards in (1, 2, 5):
+            shards = [[analyne for analyne in analynes if filenames.index(analyne.filename) % numshards == shard] for shard in xrange(numshards)]
+            shards[0].extend(analyne for analyne in analynes[:100] if not analyne.bugtype)       # Lines in more than one shard count once
+            partials = [blamethrower.stats.getpartial(shard, groupby, directories=True) for shard in shards]
+            partials = [pickle.loads(pickle.dumps(partial, pickle.HIGHEST_PROTOCOL)) for partial in partials]
+            for i, partial in enumerate(partials):
+                outfile = StringIO()
+                blamethrower.stats.dumppartial(partial, outfile)
+                partials[i] = blamethrower.stats.loadpartial(StringIO(outfile.getvalue()))
+            stats = blamethrower.stats.finish(blamethrower.stats.mergepartials(partials), directories=True, maxdepth=3)
+            self.assertEqual(stats, expected)
+
+        tables = blamethrower.columns.Tables()
+        partial = blamethrower.columns.getpartial(blamethrower.columns.tobatches(analynes, tables), groupby, directories=True)
+        self.assertEqual(blamethrower.stats.finish(partial, directories=True, maxdepth=3), expected)
+        self.assertRaises(ValueError, blamethrower.stats.mergepartials, [])
+        self.assertRaises(ValueError, blamethrower.stats.mergepartials, [blamethrower.stats.getpartial(analynes), blamethrower.stats.getpartial(analynes, groupby)])
+        self.assertRaises(ValueError, blamethrower.stats.finish, blamethrower.stats.getpartial(analynes), directories=True)
+        self.assertRaises(ValueError, blamethrower.stats.loadpartial, StringIO('{"overall": {}}'))
+
+    def test_tsv(self):
+        analynes = [blamethrower.Analyne('a.py', 1, 'E1', 'high', 'Al'), blamethrower.Analyrun('a.py', 2, 3, None),
+                    blamethrower.Analyne('b\tc.py', 7, None, None, 'Bo\nb'), blamethrower.Analyrun('d\n.py', 1, 2, 'Cy\t')]
+        outfile = StringIO()
+        blamethrower.tsv.write(analynes, outfile)
+        self.assertEqual(outfile.getvalue().split('\n'), ['filename\tlinenum\tbugtype\tseverity\tauthor', 'a.py\t1\tE1\thigh\tAl',
+                                                         'a.py\t2\t\t\t', 'a.py\t3\t\t\t', 'a.py\t4\t\t\t', 'b\\tc.py\t7\t\t\tBo\\nb',
+                                                         'd\\n.py\t1\t\t\tCy\\t', 'd\\n.py\t2\t\t\tCy\\t', ''])
+        expected = list(blamethrower.expand_runs(analynes[:2]))
+        outfile = StringIO()
+        blamethrower.tsv.write(expected * 1000, outfile, header=False)
+        old = blamethrower.tsv._READSIZE
+        try:
+            for readsize in (5, 64, 1 << 20):
+                blamethrower.tsv._READSIZE = readsize
+                self.assertEqual(list(blamethrower.tsv.read(StringIO(outfile.getvalue()))), expected * 1000)
+                self.assertEqual(list(blamethrower.tsv.read(StringIO(outfile.getvalue().rstrip('\n')))), expected * 1000)
+        finally:
+            blamethrower.tsv._READSIZE = old
+        self.assertEqual(list(blamethrower.tsv.read(StringIO(blamethrower.tsv.HEADER), header=True)), [])
+        self.assertRaises(ValueError, list, blamethrower.tsv.read(StringIO('a.py\t1\t\t\n')))
+
+    def test_compressed(self):
+        text = ''.join('line {0}\r\n'.format(i) if i % 7 else 'line {0}\r'.format(i) for i in xrange(100000)) + 'last'
+        expected = text.replace('\r\n', '\n').replace('\r', '\n')
+        tmpdir = tempfile.mkdtemp()
+        try:
+            def compressed(name, data):
+                path = os.path.join(tmpdir, name)
+                with open(path, 'wb') as outfile:
+                    outfile.write(data)
+                return path
+
+            gz = StringIO()
+            with closing(GzipFile(fileobj=gz, mode='wb')) as outfile:
+                outfile.write(text)
+            paths = [compressed('a.gz', gz.getvalue()), compressed('b', bz2.compress(text)), compressed('c', gz.getvalue() * 2 + '\0' * 8)]
+            for path in paths:
+                infile = blamethrower.compressed.openfile(path)
+                self.assertTrue(isinstance(infile, blamethrower.compressed.BackgroundReader))
+                self.assertEqual(infile.readline(), 'line 0\n')
+                self.assertEqual(infile.read(7), 'line 1\n')
+                lines = list(infile)
+                self.assertTrue(''.join(lines) == expected[14:] + (expected if path.endswith('c') else ''))
+                self.assertEqual(lines[:2], ['line 2\n', 'line 3\n'])
+                self.assertEqual(infile.read(), '')
+                infile.close()
+            with closing(blamethrower.compressed.openfile(paths[0], 'rb')) as infile:
+                self.assertEqual(infile.read(), text)
+            with closing(blamethrower.compressed.openfile(paths[1])) as infile:       # Closed before reading it all
+                infile.readline()
+            self.assertEqual(blamethrower.compressed.openfile(compressed('plain', text)).read(), expected)
+            self.assertRaises(IOError, list, blamethrower.compressed.openfile(compressed('bad', gz.getvalue()[:10] + 'garbage' * 100)))
+            bz = bz2.compress(text)
+            for name, data in (('short.gz', gz.getvalue()[:-8]), ('short.bz2', bz[:-1]), ('half.bz2', bz[:len(bz) // 2])):
+                self.assertRaises(IOError, blamethrower.compressed.openfile(compressed(name, data)).read)
+            with closing(blamethrower.compressed.openfile(compressed('d', bz * 2), 'rb')) as infile:
+                self.assertEqual(infile.read(3), text[:3])
+                self.assertEqual(infile.read(len(text)), text[3:] + text[:3])
+                self.assertEqual(infile.read(), text[3:])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_dedup(self):
+        Analyne = blamethrower.Analyne
+        bugs = [Analyne('file{0}'.format(i % 5), i % 7, 'type{0}'.format(i % 3), 'sev{0}'.format(i), None) for i in xrange(300)]
+        expected = {}
+        for bug in bugs:
+            expected.setdefault((bug.filename, bug.linenum, bug.bugtype), bug)       # The first one wins
+        for maxkeys in (1, 10, 100, 1000):
+            with warnings.catch_warnings(record=True) as warnlist:
+                warnings.simplefilter('always')
+                deduped = list(blamethrower.dedup.dedup(bugs, maxkeys))
+            self.assertEqual(sorted(deduped), sorted(expected.itervalues()))
+            self.assertTrue(all(type(bug) is Analyne for bug in deduped))
+            self.assertEqual([warning.message.numdups for warning in warnlist], [len(bugs) - len(expected)])
+        with warnings.catch_warnings(record=True) as warnlist:
+            warnings.simplefilter('always')
+            self.assertEqual(list(blamethrower.dedup.dedup(expected.values())), expected.values())
+            self.assertEqual(list(blamethrower.dedup.dedup([])), [])
+        self.assertEqual(warnlist, [])
+
+    def test_extsort(self):
+        items = [(random.randint(0, 20), i) for i in xrange(1000)]
+        for maxsize in (1, 7, 999, 1000, 5000):
+            self.assertEqual(list(blamethrower.extsort.sort(items, lambda item: item[0], maxsize)), sorted(items, key=lambda item: item[0]))
+        self.assertEqual(list(blamethrower.extsort.sort([], None, 1)), [])
+
+        # More batches than merge at once, so they are merged in passes.
+        items = [(random.randint(0, 200), i) for i in xrange(30000)]
+        self.assertTrue(len(items) // 100 > blamethrower.extsort.FANIN)
+        self.assertEqual(list(blamethrower.extsort.sort(items, lambda item: item[0], 100)), sorted(items, key=lambda item: item[0]))
+        fanin = blamethrower.extsort.FANIN
+        try:
+            blamethrower.extsort.FANIN = 3
+            for maxsize in (1, 2, 10):
+                self.assertEqual(list(blamethrower.extsort.sort(items[:500], lambda item: item[0], maxsize)), sorted(items[:500], key=lambda item: item[0]))
+        finally:
+            blamethrower.extsort.FANIN = fanin
+
+    def test_sortmerge(self):
+        for repo2project, analyzer2project, options in (({'git': 'httpbin'}, {'pylint': 'httpbin'}, None),
+                                                        ({'git': 'apricot'}, {'jslint': 'apricot'}, None),
+                                                        ({'hg': 'shove'}, {'pylint': 'shove'}, None),
+                                                        ({'git': 'os-utils'}, {'findbugs': 'os-utils'}, {'findbugs': {'prefix': 'src/'}})):
+            blame = list(self.readblame(repo2project, options))
+            bugs = list(self.readbugs(analyzer2project, options))
+            with warnings.catch_warnings(record=True) as expected_warnings:
+                expected = list(blamethrower.merge(bugs, blame))
+            for sortbuffer in (10, 100000):
+                with warnings.catch_warnings(record=True) as actual_warnings:
+                    warnings.simplefilter('always')
+                    actual = list(blamethrower.merge(bugs, reversed(blame), sortbuffer))
+                self.assertEqual([str(warning.message) for warning in actual_warnings], [str(warning.message) for warning in expected_warnings])
+                self.assertEqual(sorted(actual), sorted(expected))
+                self.assertEqual([analyne.filename for analyne in actual if analyne.author], sorted(analyne.filename for analyne in expected if analyne.author))
+            self.assertEqual(list(blamethrower.merge(None, blame, 10)), list(blamethrower.merge(None, sorted(blame))))
+
+    def test_columns(self):
+        for repo2project, analyzer2project, options in (({'git': 'httpbin'}, {'pylint': 'httpbin'}, None),
+                                                        ({'git': 'apricot'}, {'jslint': 'apricot'}, None),
+                                                        ({'hg': 'shove'}, {'pylint': 'shove'}, None),
+                                                        ({'git': 'os-utils'}, {'findbugs': 'os-utils'}, {'findbugs': {'prefix': 'src/'}})):
+            blame = list(self.readblame(repo2project, options))
+            bugs = list(self.readbugs(analyzer2project, options))
+            tables = blamethrower.columns.Tables()
+            batches = list(blamethrower.columns.tobatches(bugs, tables, 100))
+            self.assertEqual(list(itertools.chain.from_iterable(batches)), bugs)
+            with warnings.catch_warnings(record=True) as expected_warnings:
+                expected = list(blamethrower.merge(bugs, blame))
+            with warnings.catch_warnings(record=True) as actual_warnings:
+                actual = list(blamethrower.columns.merge(batches, blame, tables, 1000))
+            self.assertEqual([str(warning.message) for warning in actual_warnings], [str(warning.message) for warning in expected_warnings])
+            self.assertEqual(sorted(itertools.chain.from_iterable(actual)), sorted(expected))
+            self.assertEqual(blamethrower.columns.getstats(actual), blamethrower.stats.getstats(expected))
+            self.assertEqual(blamethrower.columns.getstats(batches), blamethrower.stats.getstats(bugs))
+            self.assertEqual(blamethrower.columns.getstats(blamethrower.columns.merge(None, blame, tables)), blamethrower.stats.getstats(blamethrower.merge(None, blame)))
+
+    def test_columnfile(self):
+        blame = list(self.readblame({'git': 'httpbin'}))
+        bugs = list(self.readbugs({'pylint': 'httpbin'}))
+        expected = list(blamethrower.merge(bugs, blame))
+        tables = blamethrower.columns.Tables()
+        with tempfile.TemporaryFile() as tmp:
+            blamethrower.columnfile.write(blamethrower.columns.tobatches(expected, tables, 100), tmp, tables)
+            tmp.flush()
+            columnfile = blamethrower.columnfile.ColumnFile(tmp)
+            self.assertEqual(len(columnfile), len(expected))
+            self.assertEqual(list(columnfile), expected)
+            columns = list(columnfile.columns())
+            self.assertEqual(len(columns), (len(expected) + 99) // 100)
+            self.assertEqual(list(itertools.chain.from_iterable(column['linenums'] for column in columns)), [analyne.linenum for analyne in expected])
+            self.assertEqual(columns[0]['filenames'][-1], columns[0]['filenames'][99])
+            self.assertRaises(IndexError, lambda: columns[0]['authors'][100])
+            self.assertEqual(blamethrower.columns.getstats(columnfile.batches()), blamethrower.stats.getstats(expected))
+            columnfile.close()
+            tmp.seek(0)
+            data = tmp.read()
+
+        # Non-ASCII unicode names, as ElementTree gives for FindBugs paths, come back as UTF-8.
+        Analyne = blamethrower.Analyne
+        unicode_analynes = [Analyne(u'caf\xe9.py', 1, 'E1', 'high', u'Zo\xeb'), Analyne('plain.py', 2, None, None, u'Zo\xeb'),
+                            Analyne(u'caf\xe9.py', 3, 'E1', 'low', 'Bob')]
+        tables = blamethrower.columns.Tables()
+        with tempfile.TemporaryFile() as tmp:
+            blamethrower.columnfile.write(blamethrower.columns.tobatches(unicode_analynes, tables, 2), tmp, tables)
+            tmp.flush()
+            columnfile = blamethrower.columnfile.ColumnFile(tmp)
+            self.assertEqual(list(columnfile), [Analyne(*(field.encode('utf-8') if isinstance(field, unicode) else field for field in analyne))
+                                                for analyne in unicode_analynes])
+            columnfile.close()
+
+        trailer = blamethrower.columnfile._TRAILER.size
+        for broken in ('', data[:3], data[:len(data) // 2], data[:-1], data[:len(data) // 2] + data[-trailer:], data[:100] + data[-trailer - 100:]):
+            with tempfile.TemporaryFile() as tmp:
+                tmp.write(broken)
+                tmp.flush()
+                self.assertRaises(ValueError, blamethrower.columnfile.ColumnFile, tmp)
+
+        with tempfile.TemporaryFile() as tmp:
+            blamethrower.columnfile.write([], tmp, blamethrower.columns.Tables())
+            tmp.flush()
+            self.assertEqual(list(blamethrower.columnfile.ColumnFile(tmp)), [])
+            tmp.seek(0)
+            tmp.write('garbage')
+            tmp.flush()
+            self.assertRaises(ValueError, blamethrower.columnfile.ColumnFile, tmp)
+
+    def test_profiler(self):
+        class FakeClock(object):
+            """Stands in for the :mod:`time` module, with a clock that only moves when told to."""
+            now = 0.0
+
+            def time(self):
+                return self.now
+            clock = time
+
+        def slow(items, seconds):
+            """Take `seconds` per item."""
+            for item in items:
+                clock.now += seconds
+                yield item
+
+        clock = FakeClock()
+        cprofiledir = tempfile.mkdtemp()
+        realtime, blamethrower.instrument.time = blamethrower.instrument.time, clock
+        try:
+            profiler = blamethrower.instrument.Profiler(cprofiledir)
+            with profiler.stage('outer') as setitems:
+                inner = profiler.iter('inner', slow(xrange(50), 1))
+                middle = profiler.iter('middle', slow(inner, 2), lambda item: 2)
+                self.assertEqual(list(middle), range(50))
+                clock.now += 5
+                setitems(7)
+        finally:
+            blamethrower.instrument.time = realtime
+        results = dict((result['stage'], result) for result in profiler.results())
+        self.assertEqual([result['stage'] for result in profiler.results()], ['outer', 'middle', 'inner'])
+        self.assertEqual([results[stage]['items'] for stage in ('outer', 'middle', 'inner')], [7, 100, 50])
+        # Each stage is only charged for its own time.
+        self.assertEqual([results[stage]['wall_seconds'] for stage in ('outer', 'middle', 'inner')], [5, 100, 50])
+        self.assertEqual([results[stage]['cpu_seconds'] for stage in ('outer', 'middle', 'inner')], [5, 100, 50])
+        self.assertEqual([results[stage]['items_per_sec'] for stage in ('outer', 'middle', 'inner')], [7 / 5, 1, 1])
+        for result in results.itervalues():
+            self.assertTrue(result['maxrss_mb'] > 0)
+        self.assertEqual(sorted(os.listdir(cprofiledir)), ['inner.prof', 'middle.prof', 'outer.prof'])
+        shutil.rmtree(cprofiledir)
+
+        profiler = blamethrower.instrument.NullProfiler()
+        with profiler.stage('outer') as setitems:
+            self.assertEqual(list(profiler.iter('inner', xrange(5))), range(5))
+            setitems(5)
+        self.assertEqual(profiler.results(), [])
+
+    def test_parallel_parse(self):
+        analyzer2project = {'pylint': 'httpbin', 'jslint': 'apricot', 'findbugs': 'os-utils'}
+        repo2project = {'git': 'httpbin', 'hg': 'shove'}
+        for jobs in (1, 2, 8):
+            bugsfiles = [(analyzer, open_datafile('analyzers', '{0}.{1}.txt.bz2'.format(project, analyzer)), {}) for analyzer, project in sorted(analyzer2project.iteritems())]
+            blamefiles = [(repo, open_datafile('reporeaders', '{0}.{1}.txt.bz2'.format(project, repo)), {}) for repo, project in sorted(repo2project.iteritems())]
+            bugs, blame = blamethrower.parallel.parse(bugsfiles, blamefiles, jobs)
+            self.assertEqual(list(blame), list(self.readblame(repo2project)))       # Out of order on purpose
+            self.assertEqual(list(bugs), list(self.readbugs(analyzer2project)))
+        bugs, blame = blamethrower.parallel.parse()
+        self.assertEqual((list(bugs), list(blame)), ([], []))
+
+    def test_streams(self):
+        analyzer2project = {'pylint': 'httpbin', 'jslint': 'apricot', 'findbugs': 'os-utils'}
+        repo2project = {'git': 'httpbin', 'hg': 'shove'}
+        bugsfiles = [(analyzer, open_datafile('analyzers', '{0}.{1}.txt.bz2'.format(project, analyzer)), {}) for analyzer, project in sorted(analyzer2project.iteritems())]
+        blamefiles = [(repo, open_datafile('reporeaders', '{0}.{1}.txt.bz2'.format(project, repo)), {}) for repo, project in sorted(repo2project.iteritems())]
+        bugs, blame = blamethrower.streams.parse(bugsfiles, blamefiles, maxbatches=1)
+        self.assertEqual(sorted(blame), sorted(self.readblame(repo2project)))       # Interleaved in no particular order
+        self.assertEqual(sorted(bugs), sorted(self.readbugs(analyzer2project)))
+        bugs, blame = blamethrower.streams.parse()
+        self.assertEqual((list(bugs), list(blame)), ([], []))
+
+        # One program writing both inputs: reading them one after the other would never finish.
+        pylint, git = open_datafile('analyzers', 'httpbin.pylint.txt.bz2').read(), open_datafile('reporeaders', 'httpbin.git.txt.bz2').read()
+        (bugsin, bugsout), (blamein, blameout) = os.pipe(), os.pipe()
+
+        def write():
+            """Write a little of each input at a time."""
+            with os.fdopen(bugsout, 'w') as bugsfile:
+                with os.fdopen(blameout, 'w') as blamefile:
+                    for i in xrange(0, max(len(pylint), len(git)), 1024):
+                        bugsfile.write(pylint[i:i + 1024])
+                        blamefile.write(git[i:i + 1024])
+        writer = threading.Thread(target=write)
+        writer.daemon = True
+        writer.start()
+        authors = StringTable()
+        bugs, blame = blamethrower.streams.parse([('pylint', os.fdopen(bugsin), {})], [('git', os.fdopen(blamein), {})], authors, maxbatches=1)
+        self.assertEqual(list(bugs), list(self.readbugs({'pylint': 'httpbin'})))
+        blame = list(blame)
+        self.assertTrue(all(blameruns.authors is authors for _, blameruns in blame))
+        self.assertEqual([(filename, blameruns.tolist()) for filename, blameruns in blame], list(self.readblame({'git': 'httpbin'})))
+        writer.join()
+
+        # All the blame before any bugs: more blame than fits in its queue and pipe waits on disk.
+        copies = 40
+        (bugsin, bugsout), (blamein, blameout) = os.pipe(), os.pipe()
+
+        def write_blame_first():
+            """Write all the blame, then all the bugs."""
+            with os.fdopen(bugsout, 'w') as bugsfile:
+                with os.fdopen(blameout, 'w') as blamefile:
+                    for _ in xrange(copies):
+                        blamefile.write(git)
+                bugsfile.write(pylint)
+        writer = threading.Thread(target=write_blame_first)
+        writer.daemon = True
+        writer.start()
+        bugs, blame = blamethrower.streams.parse([('pylint', os.fdopen(bugsin), {})], [('git', os.fdopen(blamein), {})], StringTable(), maxbatches=1)
+        results = []
+        reader = threading.Thread(target=lambda: results.extend((list(bugs), [(filename, blameruns.tolist()) for filename, blameruns in blame])))
+        reader.daemon = True
+        reader.start()
+        reader.join(60)
+        self.assertFalse(reader.is_alive(), 'deadlocked')
+        self.assertEqual(results[0], list(self.readbugs({'pylint': 'httpbin'})))
+        self.assertEqual(sorted(results[1]), sorted(list(self.readblame({'git': 'httpbin'})) * copies))
+        writer.join()
+
+        bugs, blame = blamethrower.streams.parse(blamefiles=[('git', StringIO('not git blame\n'), {})])
+        self.assertRaises(ValueError, list, blame)
+
+    def test_server_index(self):
+        bugs, table = list(self.readbugs({'pylint': 'httpbin'})), StringTable()
+        blame = [(filename, BlameRuns.fromauthors(authors, table)) for filename, authors in self.readblame({'git': 'httpbin'})]
+        with warnings.catch_warnings(record=True):
+            index = blamethrower.server.Index(blamethrower.merge(bugs, blame))
+            analynes = list(blamethrower.expand_runs(blamethrower.merge(bugs, blame)))
+        for filters in self.some_filters(analynes):
+            matches = lambda analyne: self.matches(analyne, filters)
+            self.assertEqual(index.stats(**filters)['overall'], self.get_correct_stats(analynes, matches))
+            self.assertEqual(index.bugs(**filters), [analyne for analyne in analynes if analyne.bugtype and matches(analyne)])
+        self.assertEqual(len(index.bugs(3, author=analynes[0].author)), 3)
+
+    def test_server(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            bugsfile, blamefile = os.path.join(tmpdir, 'bugs.txt'), os.path.join(tmpdir, 'blame.txt')
+            pylint = open_datafile('analyzers', 'httpbin.pylint.txt.bz2').readlines()
+            with open(bugsfile, 'w') as outfile:
+                outfile.writelines(pylint[:10])
+            with open(blamefile, 'w') as outfile:
+                outfile.write(open_datafile('reporeaders', 'httpbin.git.txt.bz2').read())
+            server = blamethrower.server.Server([('pylint', bugsfile, {})], [('git', blamefile, {})])
+            self.assertEqual(server.reload(), [bugsfile, blamefile])
+            self.assertEqual(server.reload(), [])
+            httpd = blamethrower.server.make_httpd(server, 'localhost:0')
+            thread = threading.Thread(target=httpd.serve_forever)
+            thread.daemon = True
+            thread.start()
+            url = 'http://localhost:{0}/'.format(httpd.server_address[1])
+            try:
+                get = lambda query: json.load(urllib2.urlopen(url + query))
+                self.assertEqual(len(get('bugs')), 10)
+                self.assertEqual(get('stats?path=httpbin/core.py')['overall'], server.index.stats(path='httpbin/core.py')['overall'])
+                self.assertEqual(get('stats?group_by=severity')['groups'], json.loads(json.dumps(server.index.stats([('severity',)])['groups'])))
+                with open(bugsfile, 'w') as outfile:
+                    outfile.writelines(pylint)
+                os.utime(bugsfile, (0, 0))      # In case the write was within the file system's timestamp resolution
+                self.assertEqual(json.load(urllib2.urlopen(url + 'reload', '')), {'reloaded': [bugsfile]})
+                numbugs = len(list(self.readbugs({'pylint': 'httpbin'})))
+                self.assertEqual(len(get('bugs?limit=10000')), numbugs)
+                self.assertEqual(get('status')['inputs'][0]['items'], numbugs)
+                self.assertRaises(urllib2.HTTPError, get, 'nonsense')
+                self.assertRaises(urllib2.HTTPError, get, 'stats?group_by=nonsense')
+                with open(blamefile, 'w') as outfile:
+                    outfile.write('not git blame\n')
+                os.utime(blamefile, (0, 0))
+                try:
+                    urllib2.urlopen(url + 'reload', '')
+                    self.fail('reload of bad blame succeeded')
+                except urllib2.HTTPError as err:
+                    self.assertEqual(err.code, 500)
+                    self.assertTrue('error' in json.load(err))
+                self.assertEqual(len(get('bugs?limit=10000')), numbugs)     # Still answering from the old index
+            finally:
+                httpd.shutdown()
+                httpd.server_close()
+            self.assertRaises(ValueError, blamethrower.server.make_httpd, server, blamefile)
+            self.assertEqual(open(blamefile).read(), 'not git blame\n')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_sqlstore(self):
+        table = StringTable()
+        with warnings.catch_warnings(record=True):
+            first = list(blamethrower.merge(self.readbugs({'pylint': 'httpbin'}), self.readblame({'git': 'httpbin'})))
+            blame = [(filename, BlameRuns.fromauthors(authors, table)) for filename, authors in self.readblame({'hg': 'shove'})]
+            second = list(blamethrower.merge(self.readbugs({'pylint': 'shove'}), blame))
+        db = blamethrower.sqlstore.connect(':memory:')
+        self.assertRaises(ValueError, blamethrower.sqlstore.select, db)
+        self.assertEqual(blamethrower.sqlstore.write(first, db, 'first', '2012-10-01T00:00:00'), 1)
+        self.assertEqual(blamethrower.sqlstore.write(second, db), 2)
+        self.assertEqual(blamethrower.sqlstore.runs(db)[0], (1, '2012-10-01T00:00:00', 'first', len(first)))
+        self.assertEqual(sorted(blamethrower.sqlstore.select(db, 1)), sorted(first))
+        self.assertEqual(sorted(blamethrower.expand_runs(blamethrower.sqlstore.select(db))), sorted(blamethrower.expand_runs(second)))
+        self.assertRaises(ValueError, blamethrower.sqlstore.select, db, 3)
+
+        analynes = list(blamethrower.expand_runs(second))
+        for filters in self.some_filters(analynes) + [{'path': 'shove/store/'}]:
+            expected = [analyne for analyne in analynes if self.matches(analyne, filters)]
+            self.assertEqual(sorted(blamethrower.expand_runs(blamethrower.sqlstore.select(db, **filters))), sorted(expected))
+        self.assertEqual(blamethrower.sqlstore.getstats(db, [('author',)], run=2), blamethrower.stats.getstats(second, [('author',)]))
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'test.db')
+            blamethrower.sqlstore.connect(filename).execute('PRAGMA user_version = 99').connection.close()
+            self.assertRaises(ValueError, blamethrower.sqlstore.connect, filename)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_manifest(self):
+        for package, names in (('analyzers', blamethrower.getanalyzers()), ('reporeaders', blamethrower.getreporeaders())):
+            manifest = blamethrower.getmanifest(package)
+            self.assertEqual(sorted(manifest), sorted(names))
+            for name in names:
+                module = blamethrower.getmodule('blamethrower.' + package, name)
+                self.assertEqual(manifest[name], {'help': getattr(module, 'HELP', None), 'options': getattr(module, 'OPTIONS', {})})
+
     def test_itergroup(self):
         MAXINT, MAXLEN, NUMTRIALS = 100, 10000, 50
         isstart = lambda x: x == 0